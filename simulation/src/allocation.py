@@ -0,0 +1,177 @@
+"""
+Audit allocation: which test points get verified under a budget.
+
+The randomized policy samples `budget` points without replacement with probability
+proportional to a weight (by default 1 / obviousness). It is the same successive
+sampling as np.random.choice(replace=False, p=...), done with Efraimidis-Spirakis
+keys: every point draws E ~ Exp(1) and the points with the smallest E / w are taken.
+(This is Gumbel-top-k, log w - log E.) The keys are independent, so this works
+in a few ways:
+- one array op serves many seeds at once (one row of weights per seed);
+- a test set can be streamed in chunks, keeping only the current `budget`
+  smallest keys (a reservoir);
+- a stratified policy is a top-k within each stratum;
+- sorting the keys once gives a priority order whose first B points are a
+  sample of size B, for every budget B at once (nested budgets).
+The deterministic policy audits the `budget` highest-weight points.
+"""
+
+import numpy as np
+
+# Floor on obviousness when it is inverted into a weight
+OBVIOUSNESS_EPS = 1e-10
+
+POLICIES = ("sample", "top", "stratified")
+
+
+def inverse_obviousness_weights(obviousness):
+    """Allocation weights v(x) proportional to 1 / O_R(x): less obvious points get more audits."""
+    return 1.0 / (np.asarray(obviousness, dtype=np.float64) + OBVIOUSNESS_EPS)
+
+
+def sample_keys(weights, rng=None):
+    """
+    Efraimidis-Spirakis keys E / w (smaller is chosen first), same shape as weights.
+    rng: a Generator, a RandomState or None for the global np.random stream.
+    """
+    if rng is None:
+        rng = np.random
+    weights = np.asarray(weights, dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        return rng.exponential(size=weights.shape) / weights
+
+
+def _smallest(keys, k):
+    """Boolean mask of the k smallest keys along the last axis."""
+    mask = np.zeros(keys.shape, dtype=bool)
+    k = min(k, keys.shape[-1])
+    if k > 0:
+        idx = np.argpartition(keys, k - 1, axis=-1)[..., :k]
+        np.put_along_axis(mask, idx, True, axis=-1)
+    return mask
+
+
+def weighted_sample(weights, budget, rng=None):
+    """
+    Samples min(budget, n) points without replacement, proportionally to weights.
+    weights: (n,) or (n_seeds, n), one independent draw per row.
+    Returns a boolean mask of the same shape.
+    """
+    return _smallest(sample_keys(weights, rng), budget)
+
+
+def priority_order(weights, rng=None):
+    """
+    Indices in sampling order: for every B, the first B are a weighted sample of
+    size B without replacement (the same draw as weighted_sample on the same stream).
+    """
+    return np.argsort(sample_keys(weights, rng), axis=-1, kind="stable")
+
+
+def top_budget(weights, budget):
+    """The `budget` highest-weight points (ties broken by position), as a boolean mask."""
+    weights = np.asarray(weights, dtype=np.float64)
+    mask = np.zeros(weights.shape, dtype=bool)
+    idx = np.argsort(-weights, axis=-1, kind="stable")[..., :budget]
+    np.put_along_axis(mask, idx, True, axis=-1)
+    return mask
+
+
+def stratum_quotas(weights, strata, budget):
+    """
+    Audits per stratum, proportional to the stratum's total weight, by largest
+    remainders, and never more than the stratum's size. Returns an array indexed by stratum.
+    """
+    sizes = np.bincount(strata)
+    budget = min(budget, len(strata))
+    total = np.bincount(strata, weights=weights, minlength=len(sizes))
+    quotas = np.zeros(len(sizes), dtype=np.int64)
+    remaining = budget
+    # Strata that fill up hand their share to the others
+    while remaining > 0:
+        open_ = quotas < sizes
+        share = np.where(open_, total, 0.0)
+        share = remaining * share / share.sum() if share.sum() > 0 else remaining * open_ / open_.sum()
+        add = np.minimum(np.floor(share).astype(np.int64), sizes - quotas)
+        short = remaining - add.sum()
+        if short > 0:
+            # Largest fractional parts among strata with room left
+            frac = np.where(quotas + add < sizes, share - np.floor(share), -1.0)
+            order = np.argsort(-frac, kind="stable")[:short]
+            add[order[frac[order] >= 0]] += 1
+        if add.sum() == 0:
+            break
+        quotas += add
+        remaining = budget - quotas.sum()
+    return quotas
+
+
+def stratified_sample(weights, strata, budget, rng=None):
+    """
+    Stratified allocation: stratum_quotas(weights, strata, budget) audits in each
+    stratum (non-negative integer labels, e.g. leaf ids), drawn within the stratum
+    proportionally to weights. Returns a boolean mask.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    strata = np.asarray(strata)
+    quotas = stratum_quotas(weights, strata, budget)
+
+    # Rank of every point's key within its stratum
+    keys = sample_keys(weights, rng)
+    order = np.lexsort((keys, strata))
+    starts = np.concatenate([[0], np.cumsum(np.bincount(strata, minlength=len(quotas)))[:-1]])
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts[strata[order]]
+    return rank < quotas[strata]
+
+
+def reservoir_sample(weight_chunks, budget, rng=None):
+    """
+    weighted_sample over a stream: weight_chunks yields consecutive chunks of the
+    weights, which are seen once and not kept. Memory is O(budget + chunk size).
+    Returns the sorted global indices of the sampled points.
+    """
+    if budget <= 0:
+        return np.empty(0, dtype=np.int64)
+    keys = np.empty(0)
+    idx = np.empty(0, dtype=np.int64)
+    offset = 0
+    for chunk in weight_chunks:
+        chunk_keys = sample_keys(chunk, rng)
+        chunk_idx = np.arange(offset, offset + len(chunk_keys))
+        offset += len(chunk_keys)
+        if len(keys) == budget:
+            # Only keys below the current budget-th smallest can enter
+            below = chunk_keys < keys.max()
+            chunk_keys, chunk_idx = chunk_keys[below], chunk_idx[below]
+        keys = np.concatenate([keys, chunk_keys])
+        idx = np.concatenate([idx, chunk_idx])
+        if len(keys) > budget:
+            keep = np.argpartition(keys, budget - 1)[:budget]
+            keys, idx = keys[keep], idx[keep]
+    return np.sort(idx)
+
+
+def audit_order(obviousness, rng=None):
+    """Priority order of the "sample" policy: budget B audits the first B points."""
+    return priority_order(inverse_obviousness_weights(obviousness), rng)
+
+
+def allocate_audits(obviousness, budget, policy="sample", strata=None, rng=None):
+    """
+    Audit mask for a test set (for "sample" and "top" also one row per seed) under a policy:
+    "sample" draws proportionally to 1 / obviousness, "top" takes the least obvious
+    points, and "stratified" splits the budget over strata (default: the distinct
+    obviousness levels, i.e. groups of leaves) and samples within each stratum.
+    rng: a Generator, a RandomState or None for the global np.random stream.
+    """
+    weights = inverse_obviousness_weights(obviousness)
+    if policy == "sample":
+        return weighted_sample(weights, budget, rng)
+    if policy == "top":
+        return top_budget(weights, budget)
+    if policy == "stratified":
+        if strata is None:
+            _, strata = np.unique(obviousness, return_inverse=True)
+        return stratified_sample(weights, strata, budget, rng)
+    raise ValueError(f"Unknown allocation policy {policy!r}; expected one of {POLICIES}")
@@ -0,0 +1,117 @@
+"""
+Vectorized bootstrap for means of per-observation statistics.
+
+Every runner bootstraps a mean: of per-trial errors, of per-point squared errors
+or of per-point correctness. Each resample is a row of a weight matrix W (how
+often each observation is drawn), so the bootstrap means of all statistics
+(columns of `values`) come out of one matrix product W @ values / n. Resamples
+are processed in chunks so memory stays bounded for any number of resamples.
+"""
+
+import numpy as np
+
+DEFAULT_RESAMPLES = 10_000
+
+# Entries of the (chunk, n) weight matrix held in memory at once
+CHUNK_ELEMENTS = 2 ** 22
+
+
+def resample_indices(n, n_resamples, rng):
+    """Index matrix of shape (n_resamples, n): row b lists the draws of resample b."""
+    return rng.integers(0, n, size=(n_resamples, n))
+
+
+def multinomial_weights(n, n_resamples, rng):
+    """Weight matrix of shape (n_resamples, n) drawn directly as Multinomial(n, 1/n) rows."""
+    return rng.multinomial(n, np.full(n, 1.0 / n), size=n_resamples)
+
+
+def index_weights(idx):
+    """Converts an index matrix into the equivalent count (weight) matrix."""
+    n_resamples, n = idx.shape
+    flat = idx + n * np.arange(n_resamples)[:, None]
+    return np.bincount(flat.ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+
+
+def bootstrap_means(values, n_resamples=DEFAULT_RESAMPLES, scheme="index", chunk_size=None, rng=None):
+    """
+    Bootstrap distribution of the column means of `values`.
+
+    values: shape (n,) or (n, ...); observations along the first axis.
+    scheme: "index" draws an index matrix, "multinomial" draws weights directly;
+            both give the ordinary nonparametric bootstrap.
+    Returns an array of shape (n_resamples,) + values.shape[1:].
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.reshape(len(values), -1)
+    n = len(flat)
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // n)
+
+    boot = np.empty((n_resamples, flat.shape[1]))
+    for start in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - start)
+        if scheme == "index":
+            weights = index_weights(resample_indices(n, size, rng))
+        elif scheme == "multinomial":
+            weights = multinomial_weights(n, size, rng)
+        else:
+            raise ValueError(f"Unknown bootstrap scheme: {scheme}")
+        boot[start:start + size] = weights @ flat / n
+    return boot.reshape((n_resamples,) + values.shape[1:])
+
+
+def bca_levels(values, boot, level):
+    """
+    Per-statistic quantile levels of the BCa interval for the mean.
+    values: (n, k) observations, boot: (B, k) bootstrap means. Returns (k, 2).
+    """
+    from scipy.special import ndtr, ndtri
+
+    n, B = len(values), len(boot)
+    theta = values.mean(axis=0)
+
+    # Bias correction; ties count half so degenerate (constant) statistics give z0 = 0
+    below = (boot < theta).mean(axis=0) + 0.5 * (boot == theta).mean(axis=0)
+    z0 = ndtri(np.clip(below, 0.5 / B, 1.0 - 0.5 / B))
+
+    # Acceleration from the closed-form jackknife of the mean
+    jack = (values.sum(axis=0) - values) / (n - 1)
+    d = jack.mean(axis=0) - jack
+    num = (d ** 3).sum(axis=0)
+    den = 6.0 * (d ** 2).sum(axis=0) ** 1.5
+    a = np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+    tail = (1.0 - level) / 2.0
+    z = ndtri(np.array([tail, 1.0 - tail]))
+    zz = z0[:, None] + z[None, :]
+    return ndtr(z0[:, None] + zz / (1.0 - a[:, None] * zz))
+
+
+def bootstrap_ci(values, level=0.90, method="percentile", n_resamples=DEFAULT_RESAMPLES,
+                 scheme="index", chunk_size=None, rng=None):
+    """
+    Bootstrap mean and confidence interval of the mean of every statistic.
+
+    values: shape (n,) or (n, ...); observations along the first axis.
+    method: "percentile" or "bca" (bias-corrected and accelerated).
+    Returns (boot_mean, ci) with shapes values.shape[1:] and values.shape[1:] + (2,).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    boot = bootstrap_means(values, n_resamples, scheme=scheme, chunk_size=chunk_size, rng=rng)
+
+    flat = values.reshape(len(values), -1)
+    boot_flat = boot.reshape(n_resamples, -1)
+    if method == "percentile":
+        tail = (1.0 - level) / 2.0
+        ci = np.percentile(boot_flat, [100 * tail, 100 * (1.0 - tail)], axis=0).T
+    elif method == "bca":
+        levels = bca_levels(flat, boot_flat, level)
+        ci = np.array([np.quantile(boot_flat[:, j], levels[j]) for j in range(flat.shape[1])])
+    else:
+        raise ValueError(f"Unknown interval method: {method}")
+
+    shape = values.shape[1:]
+    return boot_flat.mean(axis=0).reshape(shape), ci.reshape(shape + (2,))
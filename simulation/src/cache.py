@@ -0,0 +1,136 @@
+"""
+Content-addressed on-disk cache for datasets and fitted trees.
+
+An artefact is stored under the sha256 of everything that determines it: the
+generator parameters, the seed, the model hyperparameters and a code version
+(a hash of the source of the functions that produced it). A changed input or a
+changed generator therefore misses the cache rather than returning stale
+results. Entries are plain .npz files, written atomically so several runs and
+worker processes can share one cache directory. The cache size is bounded:
+least recently used entries are evicted first.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join("simulation", "cache")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def code_version(*objects):
+    """
+    Hash of the source code of functions, classes or modules.
+    Any edit to them changes the version and so every key built from it.
+    """
+    h = hashlib.sha256()
+    for obj in objects:
+        h.update(inspect.getsource(obj).encode())
+    return h.hexdigest()[:16]
+
+
+def _jsonable(obj):
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, (np.ndarray, tuple)):
+        return list(obj)
+    raise TypeError(f"Cannot hash {type(obj).__name__} in a cache key")
+
+
+def cache_key(**parts):
+    """sha256 of the canonical JSON of the key parts (order of keywords does not matter)."""
+    blob = json.dumps(parts, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def seed_parts(seed_seq):
+    """Identity of a SeedSequence: the same entropy and spawn key give the same stream."""
+    return {"entropy": seed_seq.entropy, "spawn_key": list(seed_seq.spawn_key)}
+
+
+class ArtifactCache:
+    """
+    Directory of .npz artefacts, root/<kind>/<key[:2]>/<key>.npz.
+
+    An entry's modification time records its last use (hits touch it), so eviction
+    works on filesystems mounted with noatime too.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, kind, key[:2], key + ".npz")
+
+    def get(self, kind, key):
+        """Arrays stored under key as a dict, or None on a miss."""
+        path = self._path(kind, key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            # Missing, evicted by another process meanwhile, or unreadable
+            return None
+        return arrays
+
+    def put(self, kind, key, arrays):
+        """Stores a dict of arrays under key; the file appears atomically."""
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get_or_compute(self, kind, key, compute):
+        """Cached arrays for key, computing and storing them (compute() -> dict) on a miss."""
+        arrays = self.get(kind, key)
+        if arrays is None:
+            arrays = compute()
+            self.put(kind, key, arrays)
+        return arrays
+
+    def entries(self):
+        """(mtime, size, path) of every stored artefact."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        Returns the number of bytes freed.
+        """
+        found = sorted(self.entries())
+        total = sum(size for _, size, _ in found)
+        freed = 0
+        for _, size, path in found:
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+        return freed
@@ -1,14 +1,13 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression, Ridge
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.pipeline import make_pipeline
-from sklearn.metrics import mean_squared_error
+import argparse
 import os
+import sys
+from bootstrap import bootstrap_ci, DEFAULT_RESAMPLES, CHUNK_ELEMENTS
+from orthopoly import LegendreSweep, legendre_vander, refit_bootstrap_mse, solve_nested_gram
+from import_profile import add_profile_argument, run_with_import_profile
 
-# Configuration
+# Configuration (created when figures are first saved)
 OUTPUT_DIR = "../figures"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 def generate_data(n_samples=200):
     """
@@ -18,16 +17,24 @@ def generate_data(n_samples=200):
     Anomaly: Sharp Gaussian spike at x=0.98
     """
     X = np.sort(np.random.rand(n_samples, 1), axis=0)
-    
-    # Base Rule
-    y = X.copy()
-    
-    # The "Cliff" / Anomaly
-    # A sharp spike centered at 0.98
+    return X, runge_target(X)
+
+def runge_target(X):
+    """
+    Base Rule y = x plus the "Cliff": a sharp spike centered at 0.98.
+    """
     spike = 10.0 * np.exp(-5000 * (X - 0.98)**2)
-    y += spike
-    
-    return X, y
+    return X + spike
+
+def generate_chunks(n_samples, chunk_size, seed=0):
+    """
+    Yields the data of generate_data in chunks of at most chunk_size points, unsorted.
+    Chunk i draws from its own SeedSequence, so a second pass regenerates the same data.
+    """
+    for i, start in enumerate(range(0, n_samples, chunk_size)):
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(i,)))
+        x = rng.random(min(chunk_size, n_samples - start))
+        yield x, runge_target(x)
 
 def get_partitions(X, y):
     """
@@ -40,13 +47,16 @@ def get_partitions(X, y):
     
     return (X[mask_normal], y[mask_normal]), (X[mask_exception], y[mask_exception])
 
-def run_experiment():
+def run_experiment(degrees=(1, 2, 5, 10, 15, 20, 30), n_samples=300, refit_bootstrap=False):
+    import matplotlib.pyplot as plt
+    
     print("Generating Runge's Boundary Divergence Data...")
-    X, y = generate_data(n_samples=300)
+    X, y = generate_data(n_samples=n_samples)
     
-    # Define degrees of complexity (Obviousness = 1/degree)
-    degrees = [1, 2, 5, 10, 15, 20, 30]
-    n_bootstrap = 100
+    # Degrees of complexity (Obviousness = 1/degree)
+    degrees = list(degrees)
+    n_bootstrap = DEFAULT_RESAMPLES
+    rng = np.random.default_rng()
     
     results = []
     
@@ -55,31 +65,33 @@ def run_experiment():
     
     colors = plt.cm.viridis(np.linspace(0, 1, len(degrees)))
     
+    # One orthogonal (Legendre) basis and QR for all degrees: the fits are nested,
+    # so no ridge penalty is needed to keep high degrees stable
+    print(f"Fitting Polynomial Regressors (Degrees {min(degrees)}..{max(degrees)})...")
+    sweep = LegendreSweep(X, y, max(degrees))
+    
+    # Partition Errors
+    (X_base, y_base), (X_exc, y_exc) = get_partitions(X, y)
+    
+    # Refit bootstrap: every replicate refits all degrees on a resample, scored on the original partitions
+    if refit_bootstrap:
+        print(f"Refitting {n_bootstrap} bootstrap replicates...")
+        masks = [X.flatten() < 0.95, X.flatten() >= 0.95]
+        refit_mse = refit_bootstrap_mse(sweep, y, degrees, masks, n_resamples=n_bootstrap, rng=rng)
+        refit_ci = np.percentile(refit_mse, [5, 95], axis=0).transpose(1, 2, 0)
+    
     for i, d in enumerate(degrees):
-        print(f"Training Polynomial Regressor (Degree={d})...")
-        
-        # Create Pipeline
-        # We use a small ridge penalty to prevent absolute explosion for high degrees,
-        # but keep it small enough to allow overfitting if the model wants to.
-        model = make_pipeline(PolynomialFeatures(d), Ridge(alpha=1e-5))
-        model.fit(X, y)
-        
-        y_pred = model.predict(X)
-        
-        # Partition Errors
-        (X_base, y_base), (X_exc, y_exc) = get_partitions(X, y)
+        y_pred = sweep.predict(X, d)
         
         # Predict on partitions
-        pred_base = model.predict(X_base)
-        pred_exc = model.predict(X_exc)
+        pred_base = sweep.predict(X_base, d)
+        pred_exc = sweep.predict(X_exc, d)
         
-        # Bootstrap for Confidence Intervals
+        # Bootstrap for Confidence Intervals (MSE is the mean of per-point squared errors)
         def get_mse_ci(y_true, y_pred):
-            boot_mses = []
-            for _ in range(n_bootstrap):
-                idx = np.random.choice(len(y_true), size=len(y_true), replace=True)
-                boot_mses.append(mean_squared_error(y_true[idx], y_pred[idx]))
-            return np.mean(boot_mses), np.percentile(boot_mses, [5, 95])
+            sq_err = (np.ravel(y_true) - np.ravel(y_pred)) ** 2
+            return bootstrap_ci(sq_err, level=0.90,
+                                n_resamples=n_bootstrap, rng=rng)
 
         mse_base, ci_base = get_mse_ci(y_base, pred_base)
         mse_exc, ci_exc = get_mse_ci(y_exc, pred_exc)
@@ -93,6 +105,9 @@ def run_experiment():
             'mse_exc': mse_exc,
             'mse_exc_ci': ci_exc.tolist()
         })
+        if refit_bootstrap:
+            results[-1]['mse_base_refit_ci'] = refit_ci[i, 0].tolist()
+            results[-1]['mse_exc_refit_ci'] = refit_ci[i, 1].tolist()
         
         # Plotting fit
         # Only plot a few distinct ones for clarity
@@ -105,6 +120,7 @@ def run_experiment():
     plt.xlabel("Input Space (x)")
     plt.ylabel("Target (y)")
     plt.ylim(-2, 12) # Focus on the spike
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     plt.savefig(os.path.join(OUTPUT_DIR, "runge_fits.pdf"))
     print("Saved fit plot.")
     
@@ -123,6 +139,9 @@ def run_experiment():
     
     plt.plot(obvs, u_exc, 'r-o', linewidth=3, label='Fragility (F) on Anomaly')
     plt.fill_between(obvs, u_exc_lo, u_exc_hi, color='r', alpha=0.2, label='90% CI')
+    if refit_bootstrap:
+        plt.fill_between(obvs, [r['mse_exc_refit_ci'][0] for r in results], [r['mse_exc_refit_ci'][1] for r in results],
+                         color='orange', alpha=0.2, label='90% CI (refit)')
     plt.plot(obvs, u_base, 'b--o', linewidth=2, label='Base Error')
     
     plt.xlabel('Representational Fluency (1 / Degree)')
@@ -143,6 +162,73 @@ def run_experiment():
         status = "Overfit" if r['mse_base'] > 0.1 and r['mse_exc'] < 1.0 else status
         print(f"| {r['degree']} | {r['obviousness']:.3f} | {r['mse_base']:.4f} | {r['mse_exc']:.4f} | {status} |")
     print("\n")
+    
+    if refit_bootstrap:
+        print("| Degree ($d$) | MSE (Base) 90% CI, refit | MSE (Cliff) 90% CI, refit |")
+        print("| :--- | :--- | :--- |")
+        for r in results:
+            (b_lo, b_hi), (e_lo, e_hi) = r['mse_base_refit_ci'], r['mse_exc_refit_ci']
+            print(f"| {r['degree']} | [{b_lo:.4f}, {b_hi:.4f}] | [{e_lo:.4f}, {e_hi:.4f}] |")
+        print("\n")
+
+def run_streaming(degrees=(1, 2, 5, 10, 15, 20, 30, 50), n_samples=10**8, chunk_size=None, seed=0):
+    """
+    Out-of-core sweep: memory stays flat in n_samples.
+    Pass 1 accumulates the Legendre Gram matrix V^T V and V^T y over chunks and solves
+    every degree from it; pass 2 regenerates the chunks and scores the base and cliff SSE.
+    """
+    degrees = list(degrees)
+    k = max(degrees) + 1
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // k)
+    
+    print(f"Pass 1/2: accumulating sufficient statistics over {n_samples} points...")
+    gram = np.zeros((k, k))
+    rhs = np.zeros(k)
+    for x, y in generate_chunks(n_samples, chunk_size, seed):
+        V = legendre_vander(x, k - 1)
+        gram += V.T @ V
+        rhs += V.T @ y
+    coef = solve_nested_gram(gram, rhs, degrees)
+    
+    print("Pass 2/2: scoring base and cliff partitions...")
+    sse = np.zeros((2, len(degrees)))
+    counts = np.zeros(2)
+    for x, y in generate_chunks(n_samples, chunk_size, seed):
+        sq_err = (y[:, None] - legendre_vander(x, k - 1) @ coef) ** 2
+        mask_exc = x >= 0.95
+        sse[0] += sq_err[~mask_exc].sum(axis=0)
+        sse[1] += sq_err[mask_exc].sum(axis=0)
+        counts += [(~mask_exc).sum(), mask_exc.sum()]
+    mse = sse / counts[:, None]
+    
+    print(f"\n### Streaming Results: The Runge Cliff (n={n_samples})")
+    print("| Degree ($d$) | Obviousness ($1/d$) | MSE (Base) | MSE (Cliff) |")
+    print("| :--- | :--- | :--- | :--- |")
+    for j, d in enumerate(degrees):
+        print(f"| {d} | {1.0 / d:.3f} | {mse[0, j]:.6f} | {mse[1, j]:.6f} |")
+    print("\n")
+    return mse
 
 if __name__ == "__main__":
-    run_experiment()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_samples", type=int, default=300)
+    parser.add_argument("--max_degree", type=int, default=None,
+                        help="Sweep every degree 1..max_degree (< n_samples) instead of the default list")
+    parser.add_argument("--refit_bootstrap", action="store_true",
+                        help="Also give MSE intervals from refitting every degree on each bootstrap resample")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Generate and fit in chunks (memory independent of n_samples); point estimates only")
+    parser.add_argument("--chunk_size", type=int, default=None, help="Points per chunk in streaming mode")
+    parser.add_argument("--seed", type=int, default=0, help="Root seed of the streamed chunks")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    
+    if args.profile_imports:
+        sys.exit(run_with_import_profile())
+    if args.streaming:
+        degrees = (1, 2, 5, 10, 15, 20, 30, 50) if args.max_degree is None else range(1, args.max_degree + 1)
+        run_streaming(degrees, n_samples=args.n_samples, chunk_size=args.chunk_size, seed=args.seed)
+    else:
+        degrees = (1, 2, 5, 10, 15, 20, 30) if args.max_degree is None else range(1, args.max_degree + 1)
+        run_experiment(degrees, n_samples=args.n_samples, refit_bootstrap=args.refit_bootstrap)
@@ -0,0 +1,103 @@
+"""
+Exact expected error of a fitted tree under a known binary input distribution.
+
+Each leaf of a tree on binary inputs is a box: every split fixes one bit. When the
+bits are independent and the label (and the tail indicator) depend on only a few
+"relevant" bits, the probability mass of each leaf, split by stratum and label,
+is a product of per-bit probabilities summed over the 2**len(relevant_bits)
+assignments of the relevant bits. Errors then follow from the leaf predictions
+with no test set, at O(leaves) cost, and for every alpha of a pruning path at once.
+"""
+
+import itertools
+
+import numpy as np
+
+from pruning_path import PruningPath, tree_arrays
+
+
+class BitDistribution:
+    """
+    Independent bits (bit j is 1 with probability bit_probs[j]) and a deterministic
+    label. label_fn and tail_fn map pattern rows to labels / tail flags and may only
+    depend on the columns listed in relevant_bits.
+    """
+
+    def __init__(self, bit_probs, label_fn, tail_fn, relevant_bits):
+        self.bit_probs = np.asarray(bit_probs, dtype=np.float64)
+        self.label_fn = label_fn
+        self.tail_fn = tail_fn
+        self.relevant_bits = np.asarray(sorted(set(relevant_bits)), dtype=np.intp)
+
+        # Every assignment of the relevant bits, embedded in full-width patterns
+        self.assignments = np.array(list(itertools.product((0, 1), repeat=len(self.relevant_bits))), dtype=np.uint8)
+        patterns = np.zeros((len(self.assignments), len(self.bit_probs)), dtype=np.uint8)
+        patterns[:, self.relevant_bits] = self.assignments
+        self.labels = np.asarray(label_fn(patterns))
+        self.tail = np.asarray(tail_fn(patterns), dtype=bool)
+
+    def leaf_masses(self, path):
+        """
+        Probability mass of every (leaf, relevant-bit assignment) pair, shape
+        (n_leaves, n_assignments), for the leaves of the unpruned tree in `path`.
+        """
+        t = path.tree_
+        n_bits = len(self.bit_probs)
+        leaf_paths = path.paths[path.leaves]
+
+        # allowed[l, j, v]: bit j may take value v inside leaf l
+        allowed = np.ones((len(path.leaves), n_bits, 2), dtype=bool)
+        rows = np.arange(len(path.leaves))
+        for d in range(leaf_paths.shape[1] - 1):
+            node, child = leaf_paths[:, d], leaf_paths[:, d + 1]
+            split = node != child
+            f = t.feature[node[split]]
+            went_left = child[split] == t.children_left[node[split]]
+            for v in (0, 1):
+                allowed[rows[split], f, v] &= (v <= t.threshold[node[split]]) == went_left
+
+        bit_dist = np.stack([1.0 - self.bit_probs, self.bit_probs], axis=1)
+        free = np.ones(n_bits, dtype=bool)
+        free[self.relevant_bits] = False
+        mass = np.prod((allowed[:, free, :] * bit_dist[free]).sum(axis=2), axis=1)
+
+        r = self.relevant_bits
+        fixed = allowed[:, r[None, :], self.assignments] * bit_dist[r[None, :], self.assignments]
+        return mass[:, None] * np.prod(fixed, axis=2)
+
+
+def exact_errors(path, alphas, dist):
+    """
+    Exact (bulk, tail) error rates of the subtree pruned at each alpha, each of
+    shape (n_alphas,): P(error | bulk) and P(error | tail) under `dist`.
+    """
+    mass = dist.leaf_masses(path)
+
+    # Class index of each assignment's label; a label the tree never saw is always wrong
+    classes = path.classes_
+    label_index = np.minimum(np.searchsorted(classes, dist.labels), len(classes) - 1)
+    seen = classes[label_index] == dist.labels
+
+    pred = path.node_class[path.effective_leaves(alphas)]
+    errors = []
+    for stratum in (~dist.tail, dist.tail):
+        # Mass of each leaf, and of each class within it, inside this stratum
+        leaf_mass = mass[:, stratum].sum(axis=1)
+        class_mass = np.zeros((len(mass), len(classes)))
+        for c in range(len(classes)):
+            class_mass[:, c] = mass[:, stratum & seen & (label_index == c)].sum(axis=1)
+        wrong = leaf_mass[:, None] - np.take_along_axis(class_mass, pred, axis=1)
+        errors.append(wrong.sum(axis=0) / leaf_mass.sum())
+    return errors[0], errors[1]
+
+
+def exact_model_errors(model, dist):
+    """
+    Exact (bulk, tail) error rates of one fitted tree: a DecisionTreeClassifier or a
+    PrunedTree view of a pruning path.
+    """
+    if hasattr(model, "path"):
+        err_bulk, err_tail = exact_errors(model.path, [model.ccp_alpha], dist)
+    else:
+        err_bulk, err_tail = exact_errors(PruningPath(tree_arrays(model)), [0.0], dist)
+    return err_bulk[0], err_tail[0]
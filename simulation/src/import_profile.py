@@ -0,0 +1,71 @@
+"""
+Per-module import-time report for the simulation entry points.
+
+`--profile_imports` (alias `--profile-imports`) re-runs the script under
+`python -X importtime`, which times every import from interpreter start. It then
+prints the slowest modules and the totals per top-level package. The heavy
+stacks (matplotlib, sklearn, pandas) are imported lazily where they are used, so
+this report shows which of them a given run actually paid for.
+"""
+
+import subprocess
+import sys
+from collections import defaultdict
+
+PROFILE_FLAGS = ("--profile_imports", "--profile-imports")
+
+
+def add_profile_argument(parser):
+    """Registers the --profile_imports flag on an argparse parser."""
+    parser.add_argument(*PROFILE_FLAGS, dest="profile_imports", action="store_true",
+                        help="Re-run under `python -X importtime` and report import time per module")
+
+
+def parse_importtime(lines):
+    """
+    Parses `-X importtime` lines into [(module, self_us, cumulative_us)], in import order.
+    """
+    records = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        records.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return records
+
+
+def format_report(records, top=20):
+    """Report of the slowest modules (cumulative) and self time per top-level package."""
+    by_package = defaultdict(int)
+    for module, self_us, _ in records:
+        by_package[module.split(".")[0]] += self_us
+    total = sum(by_package.values())
+
+    lines = [f"\n### Import times ({len(records)} modules, {total / 1e6:.3f} s total)",
+             "| Package | Self time (s) |", "| :--- | :--- |"]
+    for package, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"| {package} | {us / 1e6:.3f} |")
+
+    lines += ["", "| Module | Cumulative (s) | Self (s) |", "| :--- | :--- | :--- |"]
+    for module, self_us, cum_us in sorted(records, key=lambda r: -r[2])[:top]:
+        lines.append(f"| {module} | {cum_us / 1e6:.3f} | {self_us / 1e6:.3f} |")
+    return "\n".join(lines)
+
+
+def run_with_import_profile(top=20):
+    """
+    Re-runs the current script (same arguments, minus the profile flag) under
+    `python -X importtime`, passes its output through and prints the import report.
+    Returns the child's exit code.
+    """
+    argv = [arg for arg in sys.argv if arg not in PROFILE_FLAGS]
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + argv, stderr=subprocess.PIPE, text=True)
+
+    lines = proc.stderr.splitlines()
+    for line in lines:
+        if not line.startswith("import time:"):
+            print(line, file=sys.stderr)
+    print(format_report(parse_importtime(lines), top=top))
+    return proc.returncode
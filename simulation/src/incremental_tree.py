@@ -0,0 +1,274 @@
+"""
+Incremental correction of a fitted tree with a few extra labelled points.
+
+Refitting DecisionTreeClassifier on train + audit data regrows the whole tree to
+absorb a handful of audits. For binary features, a node's choice of split depends
+only on its count table: for every feature f, value v and class c, the number of
+its samples with x_f = v and label c. IncrementalTree keeps that table for every
+node of the unpruned tree. Absorbing new points then works as follows:
+
+1. route them down the tree, adding them to the tables of the nodes they pass;
+2. re-check the split of each touched node, top-down: a node whose current split
+   is still the best one (Gini, as sklearn) keeps it, and a leaf stays a leaf if
+   sklearn would not split it;
+3. regrow only the subtrees whose split changed, from the samples that reach them.
+
+Nodes are numbered in pre-order, as sklearn's depth-first builder does, so a
+regrown subtree is spliced in as one contiguous block of node ids. The corrected
+tree for a given alpha is then re-pruned with PruningPath. Apart from regrown
+subtrees, the cost depends on the number of new points and the size of the tree,
+not on the size of the training set.
+
+Where several splits tie exactly, sklearn's pick depends on its random feature
+order, so a full refit may choose differently. Use refit_agreement to compare
+against one.
+"""
+
+import numpy as np
+
+from pruning_path import TREE_LEAF, PruningPath, tree_arrays
+
+# sklearn's threshold for "impure enough to split"
+EPSILON = np.finfo(np.float64).eps
+# Relative tolerance when deciding whether the current split is still the best
+TIE_TOL = 1e-12
+
+
+def _check_binary(X):
+    X = np.asarray(X)
+    if X.size and not np.isin(X, (0, 1)).all():
+        raise ValueError("IncrementalTree needs binary (0/1) features")
+    return X.astype(np.uint8)
+
+
+def _structure(left, right):
+    """Depth and subtree size (in nodes) of every node, level by level."""
+    depth = np.zeros(len(left), dtype=np.intp)
+    level = np.array([0])
+    levels = []
+    while level.size:
+        levels.append(level)
+        internal = level[left[level] != TREE_LEAF]
+        children = np.concatenate([left[internal], right[internal]])
+        depth[children] = len(levels)
+        level = children
+    size = np.ones(len(left), dtype=np.intp)
+    for level in reversed(levels):
+        internal = level[left[level] != TREE_LEAF]
+        size[internal] += size[left[internal]] + size[right[internal]]
+    return depth, size
+
+
+class IncrementalTree:
+    """
+    Unpruned CART on binary features with a count table per node. The tree,
+    its training samples and their leaves are updated in place by absorb().
+    """
+
+    def __init__(self, arrays, X, y, max_depth=None, random_state=None):
+        """arrays: tree_arrays() of an unpruned DecisionTreeClassifier fitted on (X, y)."""
+        self.max_depth = max_depth
+        self.random_state = random_state
+        self.classes_ = np.asarray(arrays["classes"])
+        self.left = np.asarray(arrays["children_left"], dtype=np.intp)
+        self.right = np.asarray(arrays["children_right"], dtype=np.intp)
+        self.feature = np.asarray(arrays["feature"], dtype=np.intp)
+        self.threshold = np.asarray(arrays["threshold"], dtype=np.float64)
+        internal = np.flatnonzero(self.left != TREE_LEAF)
+        if not np.array_equal(self.left[internal], internal + 1):
+            raise ValueError("Expected a depth-first (pre-order) tree")
+
+        self.X = _check_binary(X)
+        self.y_index = self._class_index(y)
+        self.counts = np.zeros((len(self.left), self.X.shape[1], 2, len(self.classes_)), dtype=np.int64)
+        self.sample_leaf, _ = self._accumulate(self.counts, self.left, self.right, self.feature,
+                                               self.threshold, self.X, self.y_index)
+        self._update_stats()
+
+    @classmethod
+    def fit(cls, X, y, max_depth=None, random_state=None):
+        """Grows the unpruned sklearn tree on (X, y) and wraps it."""
+        from sklearn.tree import DecisionTreeClassifier
+
+        clf = DecisionTreeClassifier(max_depth=max_depth, random_state=random_state).fit(X, y)
+        return cls(tree_arrays(clf), X, y, max_depth=max_depth, random_state=random_state)
+
+    def copy(self):
+        """Independent copy (training samples are shared; they are never modified in place)."""
+        other = object.__new__(IncrementalTree)
+        other.__dict__.update(self.__dict__)
+        other.counts = self.counts.copy()
+        return other
+
+    def _class_index(self, y):
+        y = np.asarray(y)
+        index = np.minimum(np.searchsorted(self.classes_, y), len(self.classes_) - 1)
+        if not np.array_equal(self.classes_[index], y):
+            raise ValueError(f"Labels must be among the training classes {self.classes_}")
+        return index
+
+    @staticmethod
+    def _accumulate(counts, left, right, feature, threshold, X, y_index):
+        """
+        Routes rows of X from the root, adding each row to the count table of every node
+        it passes. Returns (leaf of each row, every node passed, with repeats).
+        """
+        p, n_classes = counts.shape[1], counts.shape[3]
+        node = np.zeros(len(X), dtype=np.intp)
+        active = np.arange(len(X))
+        visited = []
+        while active.size:
+            current = node[active]
+            visited.append(current)
+            flat = ((current[:, None] * p + np.arange(p)) * 2 + X[active]) * n_classes + y_index[active, None]
+            counts.reshape(-1)[:] += np.bincount(flat.ravel(), minlength=counts.size)
+            active = active[left[current] != TREE_LEAF]
+            current = node[active]
+            go_left = X[active, feature[current]] <= threshold[current]
+            node[active] = np.where(go_left, left[current], right[current])
+        return node, np.concatenate(visited) if visited else np.empty(0, dtype=np.intp)
+
+    def _update_stats(self):
+        """Node statistics in the form of sklearn's tree arrays, from the count tables."""
+        self.class_counts = self.counts[:, 0].sum(axis=1)
+        self.n_node_samples = self.class_counts.sum(axis=1)
+        n = self.n_node_samples.astype(np.float64)
+        self.impurity = 1.0 - (self.class_counts.astype(np.float64) ** 2).sum(axis=1) / (n * n)
+        self.depth, self.size = _structure(self.left, self.right)
+
+    def _split_scores(self, node):
+        """
+        sklearn's proxy improvement (-n_left * gini_left - n_right * gini_right) of
+        splitting `node` on each feature; -inf where the feature is constant in the node.
+        """
+        c = self.counts[node].astype(np.float64)
+        scores = np.zeros(c.shape[0])
+        for side in (0, 1):
+            n_side = c[:, side].sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                gini = 1.0 - (c[:, side] ** 2).sum(axis=1) / (n_side * n_side)
+            scores -= n_side * np.nan_to_num(gini)
+        constant = (c[:, 0].sum(axis=1) == 0) | (c[:, 1].sum(axis=1) == 0)
+        scores[constant] = -np.inf
+        return scores
+
+    def _splittable(self, node):
+        """Whether sklearn would split `node` given its samples."""
+        if self.max_depth is not None and self.depth[node] >= self.max_depth:
+            return False
+        if self.n_node_samples[node] < 2 or self.impurity[node] <= EPSILON:
+            return False
+        return np.isfinite(self._split_scores(node)).any()
+
+    def _needs_regrow(self, node):
+        if self.left[node] == TREE_LEAF:
+            return self._splittable(node)
+        scores = self._split_scores(node)
+        best = scores.max()
+        return scores[self.feature[node]] < best - TIE_TOL * max(abs(best), 1.0)
+
+    def absorb(self, X, y):
+        """
+        Adds labelled rows (X, y) to the tree, regrowing only the subtrees whose best
+        split changed. Returns the node ids (before the update) of the regrown subtrees.
+        """
+        X = _check_binary(X)
+        y_index = self._class_index(y)
+        leaf, visited = self._accumulate(self.counts, self.left, self.right, self.feature,
+                                         self.threshold, X, y_index)
+        self.X = np.vstack([self.X, X])
+        self.y_index = np.concatenate([self.y_index, y_index])
+        self.sample_leaf = np.concatenate([self.sample_leaf, leaf])
+        self._update_stats()
+
+        # Top-down (pre-order ids ascending); skip nodes inside a subtree already regrown
+        regrow = []
+        for node in np.unique(visited):
+            if regrow and node < regrow[-1] + self.size[regrow[-1]]:
+                continue
+            if self._needs_regrow(node):
+                regrow.append(node)
+
+        # Splice from the right so the ids of the remaining roots stay valid
+        for root in reversed(regrow):
+            self._regrow(root)
+        if regrow:
+            self._update_stats()
+        return np.array(regrow, dtype=np.intp)
+
+    def _regrow(self, root):
+        """Replaces the subtree at `root` by a fresh sklearn fit on the samples that reach it."""
+        from sklearn.tree import DecisionTreeClassifier
+
+        end = root + self.size[root]
+        inside = (self.sample_leaf >= root) & (self.sample_leaf < end)
+        max_depth = None if self.max_depth is None else self.max_depth - self.depth[root]
+        clf = DecisionTreeClassifier(max_depth=max_depth, random_state=self.random_state)
+        # Fit on class indices (the node arrays are all we keep); inputs are already valid
+        clf.fit(self.X[inside].astype(np.float32), self.y_index[inside], check_input=False)
+        t = clf.tree_
+
+        # Child ids of the subtree shift by `root`, those after it by the change in size
+        shift = t.node_count - (end - root)
+        sub_left = np.where(t.children_left == TREE_LEAF, TREE_LEAF, t.children_left + root)
+        sub_right = np.where(t.children_right == TREE_LEAF, TREE_LEAF, t.children_right + root)
+        sub_counts = np.zeros((t.node_count,) + self.counts.shape[1:], dtype=np.int64)
+        sub_leaf, _ = self._accumulate(sub_counts, t.children_left, t.children_right, t.feature,
+                                       t.threshold, self.X[inside], self.y_index[inside])
+
+        def splice(old, sub):
+            return np.concatenate([old[:root], sub, old[end:]])
+
+        def shifted(children):
+            return np.where(children >= end, children + shift, children)
+
+        self.left = splice(shifted(self.left), sub_left)
+        self.right = splice(shifted(self.right), sub_right)
+        self.feature = splice(self.feature, t.feature)
+        self.threshold = splice(self.threshold, t.threshold)
+        self.counts = splice(self.counts, sub_counts)
+        sample_leaf = np.where(self.sample_leaf >= end, self.sample_leaf + shift, self.sample_leaf)
+        sample_leaf[inside] = sub_leaf + root
+        self.sample_leaf = sample_leaf
+
+    def arrays(self):
+        """Node arrays in the format of tree_arrays(), for PruningPath."""
+        n = self.n_node_samples.astype(np.float64)
+        return {
+            "children_left": self.left,
+            "children_right": self.right,
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "value": (self.class_counts / n[:, None])[:, None, :],
+            "impurity": self.impurity,
+            "n_node_samples": self.n_node_samples,
+            "weighted_n_node_samples": n,
+            "classes": self.classes_,
+        }
+
+    def pruning_path(self):
+        return PruningPath(self.arrays())
+
+    def subtree(self, alpha):
+        """The corrected tree pruned at alpha (a PrunedTree view)."""
+        return self.pruning_path().subtree(alpha)
+
+
+def refit_agreement(tree, alphas, X_eval):
+    """
+    Checks an IncrementalTree against DecisionTreeClassifier(ccp_alpha=alpha) refit
+    from scratch on the same samples. Returns, per alpha, the fraction of X_eval
+    rows on which both predict the same class and the two leaf counts.
+    """
+    from sklearn.tree import DecisionTreeClassifier
+
+    path = tree.pruning_path()
+    y = tree.classes_[tree.y_index]
+    report = []
+    for alpha in alphas:
+        refit = DecisionTreeClassifier(ccp_alpha=alpha, max_depth=tree.max_depth, random_state=tree.random_state)
+        refit.fit(tree.X, y)
+        pruned = path.subtree(alpha)
+        agreement = (pruned.predict(X_eval) == refit.predict(X_eval)).mean()
+        report.append((agreement, pruned.get_n_leaves(), refit.get_n_leaves()))
+    return report
@@ -0,0 +1,264 @@
+"""
+Warm-started regularization path for L1-regularized logistic regression.
+
+Solves the same problem as LogisticRegression(penalty='l1', solver='liblinear'):
+
+    min_w  ||w||_1 + C * sum_i s_i log(1 + exp(-y_i w^T x_i)),   y_i in {-1, +1},
+
+where, as in liblinear, the intercept is the weight of a constant column
+(intercept_scaling) and is penalized like any other weight. The sample weights s_i
+(1 by default) let a few distinct rows stand in for a whole population.
+
+Fits along a grid of C values run from strong to weak regularization, and each
+fit starts from the previous solution. Each fit runs newGLMNET-style outer
+iterations, as liblinear does: coordinate descent on a quadratic model of the
+loss, with the exact L1 term, followed by an Armijo line search.
+The sequential strong rule screens out features that will stay at zero, and a
+KKT check over all features restores any that were screened out by mistake.
+Near the previous solution a fit takes a few sweeps over a small active set.
+
+X may be a scipy.sparse matrix. It is then held in CSC form, so selecting the
+active columns is cheap, and only the Hessian of the active set is formed (dense,
+|active| x |active|). With many near-identical features, e.g. 10^5 copies of a
+shortcut, the strong rule can admit far more features than will ever be nonzero,
+so at most MAX_ADD new features join the working set at a time (largest gradients
+first); the KKT check brings in the rest if they are needed.
+"""
+
+import numpy as np
+
+# Armijo line search parameters (sufficient decrease, step shrink)
+SIGMA = 0.01
+BETA = 0.5
+MAX_LINE_SEARCH = 30
+
+# Inner coordinate-descent sweeps on each quadratic model
+MAX_INNER = 100
+
+# Most features added to the working set at once
+MAX_ADD = 1000
+
+
+def _issparse(X):
+    return hasattr(X, "tocsc")
+
+
+def _design(X, intercept_scaling):
+    """X with the constant intercept column appended: CSC if X is sparse, else dense float64."""
+    if _issparse(X):
+        from scipy import sparse
+
+        ones = np.full((X.shape[0], 1), intercept_scaling)
+        return sparse.hstack([X, ones], format="csc", dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    return np.hstack([X, np.full((len(X), 1), intercept_scaling)])
+
+
+def _limit(candidates, score, limit):
+    """The `limit` candidates with the largest score (all of them if there are fewer)."""
+    idx = np.flatnonzero(candidates)
+    if len(idx) <= limit:
+        return candidates
+    kept = np.zeros_like(candidates)
+    kept[idx[np.argpartition(-score[idx], limit)[:limit]]] = True
+    return kept
+
+
+def _objective(margins, w, Cs):
+    return Cs @ np.logaddexp(0.0, -margins) + np.abs(w).sum()
+
+
+def _violation(g, w):
+    """Minimum-norm subgradient of ||w||_1 + loss, per weight (zero at the optimum)."""
+    return np.where(w > 0, np.abs(g + 1.0), np.where(w < 0, np.abs(g - 1.0), np.maximum(np.abs(g) - 1.0, 0.0)))
+
+
+def _newton_step(X, y, w, margins, Cs, active, tol):
+    """
+    One outer iteration of newGLMNET on the weights in `active`: coordinate descent on
+    the quadratic model of the loss plus the exact L1 term, then an Armijo line search
+    along the resulting direction. Cs holds C * s_i per row. Updates w and margins in place.
+    Returns the largest KKT violation over `active` before the step.
+    """
+    XA = X[:, active]
+    tau = 1.0 / (1.0 + np.exp(-margins))
+    g = XA.T @ (Cs * (tau - 1.0) * y)
+    if _issparse(XA):
+        H = (XA.T @ XA.multiply((Cs * tau * (1.0 - tau))[:, None])).toarray()
+    else:
+        H = (XA.T * (Cs * tau * (1.0 - tau))) @ XA
+    H.flat[::len(active) + 1] += 1e-12
+
+    wA = w[active]
+    violation = _violation(g, wA)
+    max_violation = violation.max(initial=0.0)
+    if max_violation <= tol:
+        return max_violation
+
+    # Inner CD on g^T d + d^T H d / 2 + ||wA + d||_1, keeping Hd up to date
+    d = np.zeros(len(active))
+    Hd = np.zeros(len(active))
+    for _ in range(MAX_INNER):
+        inner = 0.0
+        for j in range(len(active)):
+            G = g[j] + Hd[j]
+            h = H[j, j]
+            z = wA[j] + d[j]
+            if G + 1.0 <= h * z:
+                delta = -(G + 1.0) / h
+            elif G - 1.0 >= h * z:
+                delta = -(G - 1.0) / h
+            else:
+                delta = -z
+            if delta != 0.0:
+                d[j] += delta
+                Hd += delta * H[:, j]
+                inner = max(inner, abs(delta) * h)
+        if inner <= 0.1 * max_violation:
+            break
+
+    # Armijo backtracking on the exact objective
+    decrease = g @ d + np.abs(wA + d).sum() - np.abs(wA).sum()
+    Xd = (XA @ d) * y
+    f_old = _objective(margins, wA, Cs)
+    step = 1.0
+    for _ in range(MAX_LINE_SEARCH):
+        trial = margins + step * Xd
+        if _objective(trial, wA + step * d, Cs) - f_old <= SIGMA * step * decrease:
+            break
+        step *= BETA
+    w[active] = wA + step * d
+    margins[:] = trial
+    return max_violation
+
+
+def _full_gradient(X, y, margins, s):
+    """Gradient of the loss term sum_i s_i log(1 + exp(-margin_i)) w.r.t. every weight."""
+    return X.T @ (-s * y / (1.0 + np.exp(margins)))
+
+
+def l1_logistic_path(X, y, Cs, sample_weight=None, tol=1e-4, max_iter=1000, intercept_scaling=1.0):
+    """
+    L1 logistic regression for every C in Cs, warm-started from strong to weak regularization.
+
+    X: (n, p) features, dense or scipy.sparse; y: labels in {0, 1} (or any two values, the larger is positive);
+    sample_weight: (n,) row weights s_i, e.g. pattern counts or probabilities.
+    Returns (coefs, intercepts) of shapes (len(Cs), p) and (len(Cs),), in the order of Cs,
+    matching LogisticRegression(penalty='l1', solver='liblinear') up to the tolerance.
+    """
+    classes = np.unique(y)
+    y_pm = np.where(np.asarray(y) == classes[-1], 1.0, -1.0)
+    Xb = _design(X, intercept_scaling)
+    n_weights = Xb.shape[1]
+    s = np.ones(Xb.shape[0]) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+
+    Cs = np.asarray(Cs, dtype=np.float64)
+    order = np.argsort(Cs)
+    coefs = np.zeros((len(Cs), n_weights))
+
+    w = np.zeros(n_weights)
+    margins = np.zeros(Xb.shape[0])
+    grad = _full_gradient(Xb, y_pm, margins, s)
+    prev_lam = None
+    for k in order:
+        C = Cs[k]
+        lam = 1.0 / C
+
+        # Sequential strong rule (in units of the loss gradient): keep nonzeros and
+        # features whose gradient at the previous solution is close to the threshold
+        if prev_lam is None:
+            keep = np.abs(grad) >= lam
+        else:
+            keep = np.abs(grad) >= 2.0 * lam - prev_lam
+        keep = _limit(keep & (w == 0), np.abs(grad), MAX_ADD) | (w != 0)
+
+        while True:
+            active = np.flatnonzero(keep)
+            for _ in range(max_iter):
+                if _newton_step(Xb, y_pm, w, margins, C * s, active, tol) <= tol:
+                    break
+            # KKT check on the screened-out features
+            grad = _full_gradient(Xb, y_pm, margins, s)
+            missed = ~keep & (np.abs(grad) > lam * (1.0 + tol))
+            if not missed.any():
+                break
+            keep |= _limit(missed, np.abs(grad), MAX_ADD)
+
+        coefs[k] = w
+        prev_lam = lam
+    return coefs[:, :-1], coefs[:, -1] * intercept_scaling
+
+
+def predict_labels(X, coef, intercept):
+    """Predicted {0, 1} labels of every fit: coef (k, p), intercept (k,) -> (k, n)."""
+    if not _issparse(X):
+        X = np.asarray(X, dtype=np.float64)
+    return (X @ coef.T + intercept).T > 0
+
+
+def l1_logistic_batch(X, y, Cs, sample_weight=None, tol=1e-4, max_iter=1000, intercept_scaling=1.0):
+    """
+    Solves many small L1 logistic problems at once, one newGLMNET iteration for all of
+    them per step (vectorized over the batch; converged problems are frozen).
+
+    X: (N, n, p) one design per problem; y: (n,) shared or (N, n) labels in {0, 1};
+    Cs: (N,); sample_weight: (n,) shared or (N, n).
+    Returns (coefs, intercepts) of shapes (N, p) and (N,).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    N, n, p = X.shape
+    Xb = np.concatenate([X, np.full((N, n, 1), intercept_scaling)], axis=2)
+    y_pm = np.broadcast_to(np.where(np.asarray(y) > 0, 1.0, -1.0), (N, n))
+    s = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    Cs_row = np.asarray(Cs, dtype=np.float64)[:, None] * np.broadcast_to(s, (N, n))
+
+    w = np.zeros((N, p + 1))
+    margins = np.zeros((N, n))
+    todo = np.arange(N)
+    for _ in range(max_iter):
+        XA, yA, CA, wA, mA = Xb[todo], y_pm[todo], Cs_row[todo], w[todo], margins[todo]
+        tau = 1.0 / (1.0 + np.exp(-mA))
+        g = np.einsum("bip,bi->bp", XA, CA * (tau - 1.0) * yA)
+        H = np.einsum("bip,bi,biq->bpq", XA, CA * tau * (1.0 - tau), XA)
+        H[:, np.arange(p + 1), np.arange(p + 1)] += 1e-12
+
+        max_violation = _violation(g, wA).max(axis=1)
+        busy = max_violation > tol
+        todo, XA, yA, CA, wA, mA = todo[busy], XA[busy], yA[busy], CA[busy], wA[busy], mA[busy]
+        g, H, max_violation = g[busy], H[busy], max_violation[busy]
+        if len(todo) == 0:
+            break
+
+        # Inner CD on the quadratic models, one coordinate of every problem at a time
+        d = np.zeros_like(wA)
+        Hd = np.zeros_like(wA)
+        for _ in range(MAX_INNER):
+            inner = np.zeros(len(todo))
+            for j in range(p + 1):
+                G = g[:, j] + Hd[:, j]
+                h = H[:, j, j]
+                z = wA[:, j] + d[:, j]
+                delta = np.where(G + 1.0 <= h * z, -(G + 1.0) / h,
+                                 np.where(G - 1.0 >= h * z, -(G - 1.0) / h, -z))
+                d[:, j] += delta
+                Hd += delta[:, None] * H[:, :, j]
+                inner = np.maximum(inner, np.abs(delta) * h)
+            if np.all(inner <= 0.1 * max_violation):
+                break
+
+        # Armijo backtracking, each problem with its own step
+        decrease = (g * d).sum(axis=1) + np.abs(wA + d).sum(axis=1) - np.abs(wA).sum(axis=1)
+        Xd = np.einsum("bip,bp->bi", XA, d) * yA
+        f_old = (CA * np.logaddexp(0.0, -mA)).sum(axis=1) + np.abs(wA).sum(axis=1)
+        step = np.ones(len(todo))
+        accepted = np.zeros(len(todo), dtype=bool)
+        for _ in range(MAX_LINE_SEARCH):
+            w_new = wA + step[:, None] * d
+            f_new = (CA * np.logaddexp(0.0, -(mA + step[:, None] * Xd))).sum(axis=1) + np.abs(w_new).sum(axis=1)
+            accepted |= f_new - f_old <= SIGMA * step * decrease
+            if accepted.all():
+                break
+            step = np.where(accepted, step, step * BETA)
+        w[todo] = wA + step[:, None] * d
+        margins[todo] = mA + step[:, None] * Xd
+    return w[:, :-1], w[:, -1] * intercept_scaling
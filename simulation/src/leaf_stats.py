@@ -0,0 +1,44 @@
+"""
+Per-leaf statistics of a fitted tree, scored with a single traversal.
+
+Everything the audit scripts read off a tree for a test point depends only on the
+leaf the point lands in: the predicted class, its confidence (the class proportion
+behind the prediction) and the number of training points in the leaf. These are
+precomputed once per node, so scoring a test set is one apply() and one gather.
+"""
+
+import numpy as np
+
+
+class LeafScorer:
+    """
+    Node tables of a fitted DecisionTreeClassifier or PrunedTree. Both apply() to
+    node ids of their own `tree_`, so the tables are indexed by node id.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.classes_ = np.asarray(model.classes_)
+        t = model.tree_
+        value = t.value[:, 0, :]
+
+        # Same arithmetic as predict / predict_proba
+        pred = np.argmax(value, axis=1)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        confidence = (value / normalizer)[np.arange(len(value)), pred]
+
+        # One row per node: predicted class index, confidence, training points
+        self.table = np.column_stack([pred, confidence, t.n_node_samples]).astype(np.float64)
+
+    def score(self, X):
+        """
+        Returns (predictions, confidence, obviousness, leaf_ids) for the rows of X.
+        Obviousness is count based: O_R(x) = training points in x's leaf, normalized
+        over X (high O_R: many similar examples; low O_R: rare, exception-like).
+        """
+        leaf_ids = self.model.apply(X)
+        rows = self.table[leaf_ids]
+        predictions = self.classes_.take(rows[:, 0].astype(np.intp))
+        counts = rows[:, 2]
+        return predictions, rows[:, 1], counts / counts.sum(), leaf_ids
@@ -1,11 +1,27 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import argparse
 import os
+import sys
 import datetime
 import json
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.metrics import accuracy_score
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+import pattern_data
+import pruning_path
+import bootstrap
+import exact_eval
+from pruning_path import PruningPath, tree_arrays
+from pattern_data import draw_pattern_counts, weighted_error
+from bootstrap import bootstrap_ci, DEFAULT_RESAMPLES
+from sequential import ci_widths, sequential_trials
+from exact_eval import BitDistribution, exact_errors, exact_model_errors
+from cache import ArtifactCache, DEFAULT_CACHE_DIR, cache_key, code_version, seed_parts
+from import_profile import add_profile_argument, run_with_import_profile
+from results_store import ResultsStore, DEFAULT_STORE, summary_rows
+from run_index import served_run
+
+# matplotlib and sklearn are imported where they are used: workers never plot, and
+# --help or a fully cached run never fits a tree
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -17,13 +33,36 @@ class NumpyEncoder(json.JSONEncoder):
             return obj.tolist()
         return super(NumpyEncoder, self).default(obj)
 
-def generate_data(n_samples, n_bits, exception_prob=0.01):
+# Finished cells are appended here as they complete, one JSON record per line
+CELL_LOG = "cells.jsonl"
+
+# Settings a resumed run must share with the original: they fix every cell's data
+RUN_IDENTITY = ("seed", "n_bits", "n_train", "n_test", "pattern_counts", "engine", "exact_eval", "crn", "antithetic")
+# Value of identity settings added later, for configs saved before them
+IDENTITY_DEFAULTS = {"crn": False, "antithetic": False}
+
+# Independent random streams derived from the root seed
+TEST_STREAM = 0
+TRAIN_STREAM = 1
+BOOTSTRAP_STREAM = 2
+
+# P(x[N-1] == 1) in training (oversampled so the exception is learnable) and in the test population
+TRAIN_EXCEPTION_PROB = 0.1
+TEST_EXCEPTION_PROB = 0.01
+
+def generate_data(n_samples, n_bits, exception_prob=0.01, rng=None, antithetic=False):
     """
     Generates Sparse Parity data with a Black Swan exception.
     Rule: y = x[0] XOR x[1]
     Exception: If x[N-1] == 1, flip y.
+    antithetic: the antithetic partner of the same rng draw (every bit complemented,
+    the exception drawn from 1 - U instead of U).
     """
-    X = np.random.randint(0, 2, size=(n_samples, n_bits))
+    if rng is None:
+        rng = np.random.default_rng()
+    X = rng.integers(0, 2, size=(n_samples, n_bits))
+    if antithetic:
+        X = 1 - X
     
     # Base Rule: Logical AND of first two bits (Learnable by Greedy Trees)
     y = np.logical_and(X[:, 0], X[:, 1]).astype(int)
@@ -37,7 +76,10 @@ def generate_data(n_samples, n_bits, exception_prob=0.01):
     # But if we want x[N-1] to be rare in Training, we must bias sampling.
     
     # Bias the training data so x[N-1] is almost always 0
-    mask_rare = np.random.random(n_samples) < exception_prob
+    u = rng.random(n_samples)
+    if antithetic:
+        u = 1.0 - u
+    mask_rare = u < exception_prob
     X[:, -1] = 0 # Default to 0
     X[mask_rare, -1] = 1 # Inject rare events
     
@@ -47,6 +89,106 @@ def generate_data(n_samples, n_bits, exception_prob=0.01):
     
     return X, y
 
+def sparse_parity_labels(X):
+    """
+    Labels of generate_data as a function of the inputs alone: x[0] AND x[1], flipped when x[N-1] == 1.
+    """
+    y = np.logical_and(X[:, 0], X[:, 1]).astype(int)
+    return np.where(X[:, -1] == 1, 1 - y, y)
+
+def generate_pattern_counts(n_samples, n_bits, exception_prob=0.01, rng=None, antithetic=False):
+    """
+    Same distribution as generate_data, compressed to (patterns, labels, counts).
+    Cost depends on n_bits only, so n_samples can be 10^9 or more.
+    antithetic: the uniform bits of every drawn pattern are complemented; the
+    multinomial draw has no per-row uniform, so the exception bit is kept.
+    """
+    bit_probs = np.full(n_bits, 0.5)
+    bit_probs[-1] = exception_prob
+    X, y, counts = draw_pattern_counts(n_samples, bit_probs, sparse_parity_labels, rng=rng)
+    if antithetic:
+        X = X.copy()
+        X[:, :-1] = 1 - X[:, :-1]
+        y = sparse_parity_labels(X)
+    return X, y, counts
+
+def draw_data(n_samples, exception_prob, params, rng, antithetic=False):
+    """
+    Draws (X, y, weights) as individual rows (unit weights) or as pattern counts.
+    """
+    if params["pattern_counts"]:
+        return generate_pattern_counts(n_samples, params["n_bits"], exception_prob, rng=rng, antithetic=antithetic)
+    X, y = generate_data(n_samples, params["n_bits"], exception_prob, rng=rng, antithetic=antithetic)
+    return X, y, np.ones(len(y))
+
+def exception_mask(X):
+    """
+    Exception (tail) region of Sparse Parity: x[N-1] == 1.
+    """
+    return X[:, -1] == 1
+
+def test_distribution(n_bits, exception_prob=TEST_EXCEPTION_PROB):
+    """
+    The test population as a BitDistribution, for exact evaluation without a test set.
+    Labels and the exception region depend on x[0], x[1] and x[N-1] only.
+    """
+    bit_probs = np.full(n_bits, 0.5)
+    bit_probs[-1] = exception_prob
+    return BitDistribution(bit_probs, sparse_parity_labels, exception_mask,
+                           relevant_bits=(0, 1, n_bits - 1))
+
+def data_key(n_samples, exception_prob, params, seed_seq, antithetic=False):
+    """
+    Cache key of one dataset: generator parameters, seed and generator code version.
+    """
+    parts = {"antithetic": True} if antithetic else {}
+    return cache_key(n_samples=n_samples, exception_prob=exception_prob, n_bits=params["n_bits"],
+                     pattern_counts=params["pattern_counts"], seed=seed_parts(seed_seq),
+                     code=params["code"]["data"], **parts)
+
+def cached_data(n_samples, exception_prob, params, seed_seq, antithetic=False):
+    """
+    draw_data seeded by seed_seq, read from the cache when the same draw was made before.
+    """
+    def draw():
+        X, y, w = draw_data(n_samples, exception_prob, params, np.random.default_rng(seed_seq), antithetic)
+        # Inputs are bits; uint8 keeps cached datasets 8x smaller and trees unchanged
+        return {"X": X.astype(np.uint8), "y": y, "w": w}
+
+    cache = params["cache"]
+    if cache is None:
+        arrays = draw()
+    else:
+        arrays = cache.get_or_compute("data", data_key(n_samples, exception_prob, params, seed_seq, antithetic), draw)
+    return arrays["X"], arrays["y"], arrays["w"]
+
+def cached_tree(seed_seq, tree_params, params, antithetic=False):
+    """
+    Node arrays of a tree fit on the training draw of seed_seq (or its antithetic
+    partner). On a cache hit neither the data nor the tree is recomputed.
+    """
+    def fit():
+        from sklearn.tree import DecisionTreeClassifier
+
+        X_train, y_train, w_train = cached_data(params["n_train"], TRAIN_EXCEPTION_PROB, params, seed_seq, antithetic)
+        clf = DecisionTreeClassifier(**tree_params)
+        clf.fit(X_train, y_train, sample_weight=w_train)
+        return tree_arrays(clf)
+
+    cache = params["cache"]
+    if cache is None:
+        return fit()
+    key = cache_key(data=data_key(params["n_train"], TRAIN_EXCEPTION_PROB, params, seed_seq, antithetic),
+                    tree=tree_params, code=params["code"]["tree"])
+    return cache.get_or_compute("tree", key, fit)
+
+def split_errors(wrong, X_test, w_test):
+    """
+    Weighted (std, exc) error rates; the exception region is x[N-1] == 1.
+    """
+    mask_exc = exception_mask(X_test)
+    return weighted_error(wrong, w_test, ~mask_exc), weighted_error(wrong, w_test, mask_exc)
+
 def measure_obviousness(model, n_bits, depth):
     """
     Obviousness = 1 / Cost.
@@ -55,76 +197,370 @@ def measure_obviousness(model, n_bits, depth):
     """
     return 10.0 / float(depth)
 
-def run_experiment(config):
-    # Setup Output
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    run_dir = os.path.join("simulation", "runs", f"{timestamp}_SparseParity")
-    os.makedirs(run_dir, exist_ok=True)
+def cell_seed(seed, alpha, trial):
+    """
+    SeedSequence for one (alpha, trial) cell.
+    Keyed on the bit pattern of alpha rather than its position in the grid, so every
+    cell draws the same training data no matter how the sweep is split across workers.
+    """
+    alpha_key = int(np.float64(alpha).view(np.uint64))
+    return np.random.SeedSequence(seed, spawn_key=(TRAIN_STREAM, alpha_key, trial))
+
+def trial_seed(seed, trial):
+    """
+    SeedSequence for the training draw of one trial shared by every alpha (path engine).
+    """
+    return np.random.SeedSequence(seed, spawn_key=(TRAIN_STREAM, trial))
+
+def training_draw(params, trial, alpha=None):
+    """
+    (SeedSequence, antithetic) of the training draw of a cell. alpha=None, or crn
+    (common random numbers), gives trial's draw shared by every alpha. With
+    antithetic, odd trials are the antithetic partners of the even trial before them.
+    """
+    source = trial - trial % 2 if params["antithetic"] else trial
+    if alpha is None or params["crn"]:
+        seed_seq = trial_seed(params["seed"], source)
+    else:
+        seed_seq = cell_seed(params["seed"], alpha, source)
+    return seed_seq, bool(params["antithetic"] and trial % 2)
+
+# Test set (or, with exact_eval, test distribution) shared by every cell; set once per process by init_worker
+_test_set = None
+
+def init_worker(test_set):
+    global _test_set
+    _test_set = test_set
+
+def run_cell(cell):
+    """
+    Fits one tree for a single (alpha, trial) cell and returns its (std, exc) errors.
+    """
+    alpha, trial, params = cell
+
+    # Resample Training Data for diversity (or share trial's draw across alphas with crn)
+    seed_seq, antithetic = training_draw(params, trial, alpha)
+    arrays = cached_tree(seed_seq, {"ccp_alpha": float(alpha), "random_state": trial}, params, antithetic)
+    clf = PruningPath(arrays).subtree(0.0)
+
+    # Metrics
+    if params["exact_eval"]:
+        return exact_model_errors(clf, _test_set)
+    X_test, y_test, w_test = _test_set
+    wrong = clf.predict(X_test) != y_test
+    return split_errors(wrong, X_test, w_test)
+
+def run_path_cell(cell):
+    """
+    Grows one unpruned tree for a trial and evaluates its pruned subtree at every alpha.
+    Returns (std, exc) error arrays over alphas.
+    """
+    alphas, trial, params = cell
+
+    # Unpruned tree (ccp_alpha=0), shared with the refit cell at alpha 0 through the cache when --crn is set
+    seed_seq, antithetic = training_draw(params, trial)
+    arrays = cached_tree(seed_seq, {"ccp_alpha": 0.0, "random_state": trial}, params, antithetic)
+    path = PruningPath(arrays)
+    if params["exact_eval"]:
+        return exact_errors(path, alphas, _test_set)
+    X_test, y_test, w_test = _test_set
+    wrong = path.predict(X_test, alphas) != y_test
+    return split_errors(wrong, X_test, w_test)
+
+def iter_cells(cells, test_set, workers=1, cell_fn=run_cell):
+    """
+    Yields (cell, result) in order as cells finish, fanning them out over a process
+    pool when workers > 1. Each cell seeds its own generator, so the output does not
+    depend on workers.
+    """
+    if workers <= 1:
+        init_worker(test_set)
+        for cell in cells:
+            yield cell, cell_fn(cell)
+        return
+
+    chunksize = max(1, len(cells) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(test_set,)) as pool:
+        yield from zip(cells, pool.map(cell_fn, cells, chunksize=chunksize))
+
+def missing_cells(alphas, trials, done, params, engine):
+    """
+    (cells, cell_fn) for the (alpha, trial) pairs of alphas x trials not in done.
+    """
+    if engine == "path":
+        # One unpruned tree per trial; every missing alpha is read off its pruning path
+        cells = []
+        for i in trials:
+            missing = np.array([alpha for alpha in alphas if (float(alpha), i) not in done])
+            if len(missing):
+                cells.append((missing, i, params))
+        return cells, run_path_cell
+    return [(alpha, i, params) for alpha in alphas for i in trials if (float(alpha), i) not in done], run_cell
+
+def resampling_units(errors, antithetic):
+    """
+    Bootstrap units of per-trial errors (trials on axis 0): the trials themselves,
+    or with antithetic the mean of each pair.
+    """
+    if antithetic:
+        return errors.reshape((len(errors) // 2, 2) + errors.shape[1:]).mean(axis=1)
+    return errors
+
+def trial_errors(done, alpha, n_trials, antithetic):
+    """(error_std, error_exc) units of alpha's first n_trials trials, from the cell log."""
+    return resampling_units(np.array([done[(float(alpha), i)] for i in range(n_trials)]), antithetic)
+
+def cell_records(cell, result):
+    """
+    Log records for a finished cell; a path cell covers several alphas.
+    """
+    alphas, trial, _ = cell
+    err_std, err_exc = result
+    return [{"alpha": float(a), "trial": trial, "error_std": float(s), "error_exc": float(e)}
+            for a, s, e in zip(np.atleast_1d(alphas), np.atleast_1d(err_std), np.atleast_1d(err_exc))]
+
+def load_cell_log(run_dir):
+    """
+    Finished cells of a run as {(alpha, trial): (error_std, error_exc)}.
+    A torn final line left by a crash is ignored and its cell recomputed.
+    """
+    done = {}
+    log_path = os.path.join(run_dir, CELL_LOG)
+    if not os.path.exists(log_path):
+        return done
+    with open(log_path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[(rec["alpha"], rec["trial"])] = (rec["error_std"], rec["error_exc"])
+    return done
+
+def open_cell_log(run_dir):
+    """
+    Opens the run's cell log for appending, first terminating a torn final line.
+    """
+    log_path = os.path.join(run_dir, CELL_LOG)
+    torn = False
+    if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
+        with open(log_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+    log = open(log_path, 'a')
+    if torn:
+        log.write("\n")
+    return log
+
+def open_run_dir(config):
+    """
+    Creates a fresh timestamped run directory, or reopens config.resume after checking
+    that it was run with the same data settings. The grid may grow on resume.
+    """
+    if config.resume:
+        run_dir = config.resume
+        with open(os.path.join(run_dir, "config.json")) as f:
+            saved = json.load(f)
+        for key in RUN_IDENTITY:
+            value = saved.get(key, IDENTITY_DEFAULTS.get(key))
+            if value != getattr(config, key):
+                raise ValueError(f"Cannot resume {run_dir}: {key}={value!r} but got {getattr(config, key)!r}")
+    else:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        run_dir = os.path.join("simulation", "runs", f"{timestamp}_SparseParity")
+        os.makedirs(run_dir, exist_ok=True)
     
     with open(os.path.join(run_dir, "config.json"), 'w') as f:
         json.dump(vars(config), f, indent=4)
+    return run_dir
 
-    # 1. Data Generation
-    print("Generating Data...")
+def setup_experiment(config):
+    """
+    Shared inputs of every cell: (params, test_set). The test set is the exact test
+    distribution with exact_eval, else a sampled test set.
+    """
     # Oversample the exception to ensure it's learnable (Reasonable Curiosity)
     # If the event is too rare (0.005), even a deep tree won't statistically justify the split.
-    X_train, y_train = generate_data(config.n_train, config.n_bits, exception_prob=0.1)
+    # Training data is drawn per cell (see run_cell) with exception_prob=TRAIN_EXCEPTION_PROB.
+    params = {
+        "seed": config.seed,
+        "n_train": config.n_train,
+        "n_bits": config.n_bits,
+        "pattern_counts": config.pattern_counts,
+        "exact_eval": config.exact_eval,
+        "crn": config.crn,
+        "antithetic": config.antithetic,
+        "cache": None if config.no_cache else ArtifactCache(config.cache_dir, config.cache_max_mb * 1024 ** 2),
+        "code": {
+            "data": code_version(generate_data, sparse_parity_labels, generate_pattern_counts, draw_data, pattern_data),
+            "tree": code_version(tree_arrays) + version("scikit-learn"),
+        },
+    }
     
     # Test set reflects Reality: Rare Black Swans
-    X_test, y_test = generate_data(config.n_test, config.n_bits, exception_prob=0.01) 
+    if config.exact_eval:
+        # Errors are computed exactly under the test distribution; no test set is drawn
+        test_set = test_distribution(config.n_bits)
+    else:
+        test_seq = np.random.SeedSequence(config.seed, spawn_key=(TEST_STREAM,))
+        test_set = cached_data(config.n_test, TEST_EXCEPTION_PROB, params, test_seq)
+    return params, test_set
+
+def run_code_version():
+    """
+    Version of the code behind a run's results (this script, its engines and scikit-learn),
+    recorded in config.json so the run index only serves runs made by the same code.
+    """
+    return code_version(sys.modules[__name__], pattern_data, pruning_path, bootstrap, exact_eval) + version("scikit-learn")
+
+def run_experiment(config):
+    if config.antithetic and (config.n_trials % 2 or config.batch_trials % 2):
+        raise ValueError(f"--antithetic pairs trials; --n_trials and --batch_trials must be even, "
+                         f"got {config.n_trials} and {config.batch_trials}")
+
+    # An identical earlier run is served from the run index instead of recomputed
+    config.code_version = run_code_version()
+    if not config.resume and not config.recompute:
+        previous = served_run(vars(config))
+        if previous:
+            print(f"Identical config already run: {os.path.join(previous, 'results.json')} "
+                  f"(--recompute to run it again)")
+            return
+
+    # Setup Output
+    run_dir = open_run_dir(config)
+
+    # 1. Data Generation
+    print("Generating Data...")
+    params, test_set = setup_experiment(config)
 
     # 2. Train Models with varying "Compressive Pressure" (Regularization Strength ccp_alpha)
-    alphas = np.linspace(0.0, 0.1, 50)
-    n_trials = 20 # Ensemble size for smoothing
-    n_bootstrap = 100 # For confidence intervals
+    alphas = np.linspace(0.0, config.alpha_max, config.n_alphas)
+    n_trials = config.n_trials # Ensemble size for smoothing
+    boot_rng = np.random.default_rng(np.random.SeedSequence(config.seed, spawn_key=(BOOTSTRAP_STREAM,)))
     
     results = []
     
-    print(f"Running Ensemble Simulation ({n_trials} trials per alpha)...")
+    # Cells already in the log (from an interrupted or smaller run) are skipped
+    done = load_cell_log(run_dir)
+    
+    if config.target_ci_width is None:
+        print(f"Running Ensemble Simulation ({n_trials} trials per alpha, {config.workers} workers, {config.engine} engine)...")
+    else:
+        print(f"Running Ensemble Simulation (batches of {config.batch_trials} trials per alpha until its 90% CI is "
+              f"<= {config.target_ci_width} wide, at most {n_trials}; {config.workers} workers, {config.engine} engine)...")
+    if done:
+        print(f"Resuming {run_dir}: {len(done)} cells already logged")
     
-    for alpha in alphas:
-        # Accumulators for this alpha
-        err_std_trials = []
-        err_exc_trials = []
+    store = ResultsStore(config.store) if config.store else None
+    if store is not None:
+        run = store.add_run(os.path.normpath(run_dir), "sparse_parity", vars(config))
+        # Cells logged before the run was stored (e.g. a sweep_queue run) go in first
+        if done and not store.n_run_rows("sparse_parity_cells", run):
+            store.append("sparse_parity_cells", [{"alpha": a, "trial": i, "error_std": s, "error_exc": e}
+                                                 for (a, i), (s, e) in done.items()], run=run)
+    
+    with open_cell_log(run_dir) as log:
+        def run_trials(run_alphas, trials):
+            cells, cell_fn = missing_cells(run_alphas, trials, done, params, config.engine)
+            for cell, result in iter_cells(cells, test_set, workers=config.workers, cell_fn=cell_fn):
+                records = cell_records(cell, result)
+                for rec in records:
+                    log.write(json.dumps(rec) + "\n")
+                    done[(rec["alpha"], rec["trial"])] = (rec["error_std"], rec["error_exc"])
+                log.flush()
+                if store is not None:
+                    store.append("sparse_parity_cells", records, run=run)
+                    store.file.flush()
         
-        for i in range(n_trials):
-            # Resample Training Data for diversity
-            X_train, y_train = generate_data(config.n_train, config.n_bits, exception_prob=0.1)
-            
-            clf = DecisionTreeClassifier(ccp_alpha=alpha, random_state=i)
-            clf.fit(X_train, y_train)
+        if config.target_ci_width is None:
+            run_trials(alphas, range(n_trials))
+            n_used = np.full(len(alphas), n_trials)
+        else:
+            # Interim CIs come from their own stream, so stopping does not shift the final CIs' draws
+            stop_rng = np.random.default_rng(np.random.SeedSequence(config.seed, spawn_key=(BOOTSTRAP_STREAM, 1)))
             
-            # Metrics
-            mask_std = X_test[:, -1] == 0
-            mask_exc = X_test[:, -1] == 1
+            def widths(active, n):
+                # Widest of the error_std and error_exc CIs
+                return [ci_widths(trial_errors(done, alpha, n, config.antithetic), rng=stop_rng).max()
+                        for alpha in active]
             
-            y_pred_std = clf.predict(X_test[mask_std])
-            y_pred_exc = clf.predict(X_test[mask_exc])
-            
-            err_std_trials.append(1.0 - accuracy_score(y_test[mask_std], y_pred_std))
-            err_exc_trials.append(1.0 - accuracy_score(y_test[mask_exc], y_pred_exc))
+            used = sequential_trials(list(alphas), lambda active, trials: run_trials(np.array(active), trials),
+                                     widths, config.target_ci_width, config.batch_trials, n_trials)
+            n_used = np.array([used[alpha] for alpha in alphas])
+            print(f"Sequential stopping used {n_used.sum()} of {len(alphas) * n_trials} cells "
+                  f"({n_used.min()} to {n_used.max()} trials per alpha)")
+    
+    if params["cache"] is not None:
+        freed = params["cache"].evict()
+        if freed:
+            print(f"Evicted {freed / 1024 ** 2:.1f} MB of least recently used cache entries")
+    
+    if config.target_ci_width is None:
+        # Errors of shape (n_alphas, n_trials, 2), assembled from the log
+        errors = np.array([[done[(float(alpha), i)] for i in range(n_trials)] for alpha in alphas])
         
-        # Bootstrap for Confidence Intervals
-        def get_ci(data):
-            boot_means = [np.mean(np.random.choice(data, size=len(data), replace=True)) for _ in range(n_bootstrap)]
-            return np.percentile(boot_means, [5, 95])
-
-        ci_std = get_ci(err_std_trials)
-        ci_exc = get_ci(err_exc_trials)
+        # Resampling units: trials, or antithetic pairs (the two halves of a pair are not independent)
+        units = resampling_units(errors.transpose(1, 0, 2), config.antithetic)
+        # Paired differences from the previous alpha, per unit. With crn (or the path engine) a
+        # unit saw the same training data at every alpha, so its sampling noise largely cancels
+        diffs = np.diff(units, axis=1, prepend=units[:, :1])
+        
+        # Bootstrap for Confidence Intervals: units are resampled jointly for every alpha
+        _, ci = bootstrap_ci(np.concatenate([units, diffs], axis=-1), level=0.90,
+                             method=config.ci_method, n_resamples=config.n_bootstrap, rng=boot_rng)
+        means = np.array([[np.mean(errors[a, :, 0]), np.mean(errors[a, :, 1])] for a in range(len(alphas))])
+        diff_means = np.array([[np.mean(diffs[:, a, 0]), np.mean(diffs[:, a, 1])] for a in range(len(alphas))])
+    else:
+        # Alphas ran different numbers of trials: one bootstrap per alpha, and paired
+        # differences over the trials an alpha shares with the previous one
+        ci = np.zeros((len(alphas), 4, 2))
+        means = np.zeros((len(alphas), 2))
+        diff_means = np.zeros((len(alphas), 2))
+        for a, alpha in enumerate(alphas):
+            errors = np.array([done[(float(alpha), i)] for i in range(n_used[a])])
+            means[a] = [np.mean(errors[:, 0]), np.mean(errors[:, 1])]
+            _, ci[a, :2] = bootstrap_ci(resampling_units(errors, config.antithetic), level=0.90,
+                                        method=config.ci_method, n_resamples=config.n_bootstrap, rng=boot_rng)
+            if a:
+                n_pair = min(n_used[a], n_used[a - 1])
+                diffs = (trial_errors(done, alpha, n_pair, config.antithetic)
+                         - trial_errors(done, alphas[a - 1], n_pair, config.antithetic))
+                diff_means[a] = diffs.mean(axis=0)
+                _, ci[a, 2:] = bootstrap_ci(diffs, level=0.90, method=config.ci_method,
+                                            n_resamples=config.n_bootstrap, rng=boot_rng)
 
+    for a, alpha in enumerate(alphas):
         results.append({
             "alpha": alpha,
-            "error_std": np.mean(err_std_trials),
-            "error_std_ci": ci_std.tolist(),
-            "error_exc": np.mean(err_exc_trials),
-            "error_exc_ci": ci_exc.tolist()
+            "error_std": means[a, 0],
+            "error_std_ci": ci[a, 0].tolist(),
+            "error_exc": means[a, 1],
+            "error_exc_ci": ci[a, 1].tolist(),
+            "error_std_diff": diff_means[a, 0],
+            "error_std_diff_ci": ci[a, 2].tolist(),
+            "error_exc_diff": diff_means[a, 1],
+            "error_exc_diff_ci": ci[a, 3].tolist(),
+            "n_trials": n_used[a]
         })
+    width = ci[..., 1] - ci[..., 0]
+    print(f"Mean 90% CI width of error_exc: {width[:, 1].mean():.4f}; "
+          f"of its paired difference between neighbouring alphas: {width[1:, 3].mean():.4f}")
 
     # Save Results
     with open(os.path.join(run_dir, "results.json"), 'w') as f:
         json.dump(results, f, indent=4, cls=NumpyEncoder)
+    if store is not None:
+        # A resumed run replaces its summary
+        store.drop_run("sparse_parity", run)
+        store.append("sparse_parity", summary_rows(results), run=run)
+        store.close()
+        print(f"Appended run {run} to {config.store}")
         
     # 3. Plotting
+    import matplotlib.pyplot as plt
+    
     alpha_vals = [r['alpha'] for r in results]
     err_exc = [r['error_exc'] for r in results]
     err_exc_lo = [r['error_exc_ci'][0] for r in results]
@@ -148,12 +584,50 @@ def run_experiment(config):
     plt.savefig(fig_path)
     print(f"Plot saved to {plot_path} and {fig_path}")
 
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--n_bits", type=int, default=20)
     parser.add_argument("--n_train", type=int, default=2000)
     parser.add_argument("--n_test", type=int, default=1000)
+    parser.add_argument("--pattern_counts", action="store_true",
+                        help="Draw datasets as per-pattern counts (cost independent of n_train/n_test)")
+    parser.add_argument("--exact_eval", action="store_true",
+                        help="Exact expected errors under the test distribution instead of a sampled test set")
     parser.add_argument("--exception_prob", type=float, default=0.005, help="Rarity of Black Swan in training")
-    args = parser.parse_args()
+    parser.add_argument("--seed", type=int, default=0, help="Root seed for all random streams")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for the alpha x trial sweep")
+    parser.add_argument("--n_alphas", type=int, default=50, help="Points on the ccp_alpha grid")
+    parser.add_argument("--alpha_max", type=float, default=0.1, help="Largest ccp_alpha on the grid")
+    parser.add_argument("--n_trials", type=int, default=20, help="Training draws per alpha")
+    parser.add_argument("--target_ci_width", "--target-ci-width", type=float, default=None,
+                        help="Sequential stopping: run trials per alpha in batches until the 90%% CIs of its errors are "
+                             "at most this wide; --n_trials becomes the cap")
+    parser.add_argument("--batch_trials", type=int, default=4, help="Trials per batch with --target_ci_width")
+    parser.add_argument("--n_bootstrap", type=int, default=DEFAULT_RESAMPLES, help="Bootstrap resamples for the CIs")
+    parser.add_argument("--ci_method", choices=["percentile", "bca"], default="percentile")
+    parser.add_argument("--engine", choices=["refit", "path"], default="refit",
+                        help="refit: one tree per (alpha, trial); path: one unpruned tree per trial, pruned for every alpha")
+    parser.add_argument("--crn", action="store_true",
+                        help="Common random numbers: trial i trains on the same draw at every alpha "
+                             "(the path engine always does)")
+    parser.add_argument("--antithetic", action="store_true",
+                        help="Trials come in antithetic pairs: trial 2k+1 trains on the antithetic partner of trial 2k's draw")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Shared cache of datasets and fitted trees, keyed by config, seed and code version")
+    parser.add_argument("--cache_max_mb", type=int, default=2048, help="Cache size bound; LRU entries are evicted beyond it")
+    parser.add_argument("--no_cache", action="store_true", help="Neither read nor write the cache")
+    parser.add_argument("--resume", metavar="RUN_DIR", default=None,
+                        help="Continue a run: skip cells already in its log, compute any new alphas or trials")
+    parser.add_argument("--recompute", action="store_true",
+                        help="Run even if the run index holds a complete run with the same config")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_STORE, default=None,
+                        help=f"Also append cells and the summary to an HDF5 results store (default {DEFAULT_STORE})")
+    add_profile_argument(parser)
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
     
+    if args.profile_imports:
+        sys.exit(run_with_import_profile())
     run_experiment(args)
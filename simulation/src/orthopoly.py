@@ -0,0 +1,149 @@
+"""
+Polynomial least squares of every degree at once, in a shifted Legendre basis.
+
+Fitting degree d in the monomial basis means solving with a Vandermonde matrix
+whose condition number grows exponentially in d. Legendre polynomials of
+t = 2x - 1 are orthogonal on [0, 1], so their design matrix stays well conditioned.
+
+The fits are also nested: with V = QR (Householder), the first d + 1 columns of Q
+span the polynomials of degree <= d. Then Q^T y is computed once and the fit of
+degree d is Q[:, :d+1] @ (Q^T y)[:d+1]. Each extra degree adds a single rank-one
+term. Coefficients come from back substitution with R, and predictions are made
+with Clenshaw's recurrence.
+
+The same nesting carries over to weighted fits, which is what a refit bootstrap
+needs. For resample weights w, the Cholesky factor of Q^T diag(w) Q restricted
+to its leading (d + 1) block is the factor for degree d. So one batched Cholesky
+per replicate gives that replicate's refit at every degree. Likewise the Gram
+matrix V^T V, accumulated over chunks of a dataset too large for memory, yields
+every degree's fit from a single Cholesky factorisation.
+"""
+
+import numpy as np
+
+from bootstrap import CHUNK_ELEMENTS, DEFAULT_RESAMPLES, multinomial_weights
+
+
+def legendre_vander(x, degree):
+    """Design matrix (n, degree + 1): column k is P_k(2x - 1), built by the three-term recurrence."""
+    t = 2.0 * np.ravel(x) - 1.0
+    V = np.empty((len(t), degree + 1))
+    V[:, 0] = 1.0
+    if degree > 0:
+        V[:, 1] = t
+    for k in range(1, degree):
+        V[:, k + 1] = ((2 * k + 1) * t * V[:, k] - k * V[:, k - 1]) / (k + 1)
+    return V
+
+
+def legendre_clenshaw(coef, x):
+    """
+    Evaluates sum_k coef[k] P_k(2x - 1) by Clenshaw's recurrence.
+    coef: (degree + 1,) or (degree + 1, m) for m series at once; returns (n,) or (n, m).
+    """
+    coef = np.asarray(coef, dtype=np.float64)
+    t = 2.0 * np.ravel(x) - 1.0
+    if coef.ndim == 2:
+        t = t[:, None]
+    b1 = np.zeros(t.shape if coef.ndim == 1 else (len(t), coef.shape[1]))
+    b2 = np.zeros_like(b1)
+    # P_{k+1} = alpha_k P_k + beta_k P_{k-1}, alpha_k = (2k+1) t / (k+1), beta_k = -k / (k+1)
+    for k in range(len(coef) - 1, 0, -1):
+        alpha = (2 * k + 1) * t / (k + 1)
+        beta = -(k + 1) / (k + 2)
+        b1, b2 = coef[k] + alpha * b1 + beta * b2, b1
+    # P_0 = 1, P_1 = t, and beta_1 = -1/2
+    return coef[0] + t * b1 - 0.5 * b2
+
+
+class LegendreSweep:
+    """
+    Least-squares polynomial fits of (x, y) for every degree 0..max_degree, with x in [0, 1].
+    """
+
+    def __init__(self, x, y, max_degree):
+        x = np.ravel(x)
+        if max_degree >= len(x):
+            raise ValueError(f"Degree {max_degree} needs more than {len(x)} points")
+        self.max_degree = max_degree
+        self.Q, self.R = np.linalg.qr(legendre_vander(x, max_degree))
+        self.qty = self.Q.T @ np.ravel(y)
+
+    def fitted(self, degree):
+        """Fitted values of the degree-d fit at the training points."""
+        return self.Q[:, :degree + 1] @ self.qty[:degree + 1]
+
+    def fitted_all(self):
+        """Fitted values of every degree, shape (n, max_degree + 1); column d is degree d."""
+        return np.cumsum(self.Q * self.qty, axis=1)
+
+    def coef(self, degree):
+        """Legendre coefficients of the degree-d fit."""
+        from scipy.linalg import solve_triangular
+
+        return solve_triangular(self.R[:degree + 1, :degree + 1], self.qty[:degree + 1])
+
+    def predict(self, x, degree):
+        """Predictions of the degree-d fit at new points x."""
+        return legendre_clenshaw(self.coef(degree), x)
+
+
+def solve_nested_gram(gram, rhs, degrees):
+    """
+    Least-squares Legendre coefficients of several degrees from the normal equations
+    gram = V^T V, rhs = V^T y of the max-degree basis.
+    Returns (max_degree + 1, len(degrees)); column j holds the coefficients of
+    degrees[j], zero-padded above that degree.
+    """
+    from scipy.linalg import solve_triangular
+
+    L = np.linalg.cholesky(gram)
+    z = solve_triangular(L, rhs, lower=True)
+    coef = np.zeros((len(rhs), len(degrees)))
+    for j, d in enumerate(degrees):
+        coef[:d + 1, j] = solve_triangular(L[:d + 1, :d + 1].T, z[:d + 1])
+    return coef
+
+
+def refit_bootstrap_mse(sweep, y, degrees, masks, n_resamples=DEFAULT_RESAMPLES, chunk_size=None, rng=None):
+    """
+    Refit bootstrap of the partition MSEs: each replicate refits every degree on a
+    multinomial resample of the points and is scored on the original points of each
+    mask, so the spread includes model-fitting variance.
+
+    All replicates of a chunk are solved together via stacked normal equations in the
+    orthonormal basis Q of `sweep`: G_b = Q^T diag(w_b) Q = L_b L_b^T, and the degree-d
+    refit is the partial sum over the first d + 1 columns of (Q L_b^-T) * (L_b^-1 Q^T w_b y).
+    Returns an array of shape (n_resamples, len(degrees), len(masks)).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    y = np.ravel(y)
+    degrees = np.asarray(degrees)
+    masks = np.asarray(masks, dtype=bool)
+    Q = sweep.Q[:, :degrees.max() + 1]
+    n, k = Q.shape
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // (n * k))
+
+    mse = np.empty((n_resamples, len(degrees), len(masks)))
+    for start in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - start)
+        w = multinomial_weights(n, size, rng).astype(np.float64)
+
+        # Stacked normal equations, one (k, k) system per replicate
+        gram = (Q.T * w[:, None, :]) @ Q
+        rhs = (w * y) @ Q
+        try:
+            L = np.linalg.cholesky(gram)
+        except np.linalg.LinAlgError:
+            raise ValueError(f"Degree {degrees.max()} is too high to refit on bootstrap resamples of {n} points")
+
+        # Columns of U = Q L^-T are orthonormal under the replicate's weights and nested by degree
+        U = np.linalg.solve(L, np.broadcast_to(Q.T, (size, k, n))).transpose(0, 2, 1)
+        z = np.linalg.solve(L, rhs[:, :, None])[:, :, 0]
+        fitted = np.cumsum(U * z[:, None, :], axis=2)[:, :, degrees]
+
+        sq_err = (y[None, :, None] - fitted) ** 2
+        mse[start:start + size] = (masks @ sq_err).transpose(0, 2, 1) / masks.sum(axis=1)
+    return mse
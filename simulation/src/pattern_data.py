@@ -0,0 +1,55 @@
+"""
+Sufficient-statistics datasets for binary inputs.
+
+With n_bits independent binary inputs there are only 2**n_bits distinct rows, so a
+sample of any size is fully described by how often each pattern (and label) occurs.
+Drawing those counts from a single multinomial makes the cost of a dataset depend
+on n_bits rather than on n_samples. Trees train on the result through
+`sample_weight`, and errors become count-weighted sums.
+"""
+
+import numpy as np
+
+# 2**24 patterns is already 400 MB of uint8 rows
+MAX_PATTERN_BITS = 24
+
+
+def enumerate_patterns(n_bits):
+    """All 2**n_bits binary rows; row i holds the bits of i (column j = bit j)."""
+    if n_bits > MAX_PATTERN_BITS:
+        raise ValueError(f"Pattern mode enumerates 2**n_bits rows; n_bits={n_bits} exceeds {MAX_PATTERN_BITS}")
+    codes = np.arange(2 ** n_bits, dtype=np.int64)
+    return ((codes[:, None] >> np.arange(n_bits)) & 1).astype(np.uint8)
+
+
+def pattern_probs(patterns, bit_probs):
+    """Probability of each pattern when bit j is 1 with probability bit_probs[j]."""
+    bit_probs = np.asarray(bit_probs, dtype=np.float64)
+    return np.prod(np.where(patterns == 1, bit_probs, 1.0 - bit_probs), axis=1)
+
+
+def draw_pattern_counts(n_samples, bit_probs, label_fn, rng=None):
+    """
+    Draws a dataset of n_samples rows in compressed form.
+
+    Returns (X, y, counts): the patterns that occur at least once, their labels
+    (label_fn is applied to the patterns) and how often each occurs.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    patterns = enumerate_patterns(len(bit_probs))
+    probs = pattern_probs(patterns, bit_probs)
+    counts = rng.multinomial(n_samples, probs / probs.sum())
+
+    present = counts > 0
+    X = patterns[present]
+    return X, label_fn(X), counts[present].astype(np.float64)
+
+
+def weighted_error(wrong, weights, mask=None):
+    """
+    Count-weighted error rate; wrong may carry leading axes, e.g. (n_alphas, n_rows).
+    """
+    if mask is not None:
+        weights = weights * mask
+    return wrong @ weights / weights.sum()
@@ -0,0 +1,252 @@
+"""
+Fit-once cost-complexity pruning.
+
+Growing a DecisionTreeClassifier with ccp_alpha = a is equivalent to growing the
+unpruned tree and then applying minimal cost-complexity (weakest-link) pruning
+until the weakest link costs more than a. The pruned trees for increasing a are
+therefore nested: one unpruned fit per training draw is enough to recover the
+tree, its predictions and its size for every alpha in a sweep.
+
+The pruning loop below mirrors sklearn's `_cost_complexity_prune` step by step
+(same node order, same floating point operations), so predictions agree with
+refitting `DecisionTreeClassifier(ccp_alpha=a)` on the same data.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+
+TREE_LEAF = -1
+TREE_FIELDS = (
+    "children_left",
+    "children_right",
+    "feature",
+    "threshold",
+    "value",
+    "impurity",
+    "n_node_samples",
+    "weighted_n_node_samples",
+)
+
+
+def tree_arrays(clf):
+    """Copies the node arrays of a fitted sklearn tree into a plain dict."""
+    t = clf.tree_
+    arrays = {name: np.array(getattr(t, name)) for name in TREE_FIELDS}
+    arrays["classes"] = np.array(clf.classes_)
+    return arrays
+
+
+def fit_pruning_path(X, y, sample_weight=None, **tree_params):
+    """
+    Grows the unpruned tree once and returns its PruningPath.
+
+    tree_params are passed to DecisionTreeClassifier (max_depth, random_state, ...);
+    ccp_alpha is ignored since pruning is applied afterwards.
+    """
+    from sklearn.tree import DecisionTreeClassifier
+
+    tree_params = dict(tree_params, ccp_alpha=0.0)
+    clf = DecisionTreeClassifier(**tree_params)
+    clf.fit(X, y, sample_weight=sample_weight)
+    return PruningPath(tree_arrays(clf))
+
+
+class PruningPath:
+    """
+    Nested sequence of cost-complexity pruned subtrees of one unpruned tree.
+
+    Pruning step k collapses the internal node `steps[k]` into a leaf at effective
+    alpha `ccp_alphas[k]`. The subtree for a requested alpha is the result of the
+    steps taken before the first effective alpha exceeding it, as in sklearn.
+    """
+
+    def __init__(self, arrays):
+        self.tree_ = SimpleNamespace(**{name: np.asarray(arrays[name]) for name in TREE_FIELDS})
+        self.classes_ = np.asarray(arrays["classes"])
+        self.node_count = len(self.tree_.children_left)
+
+        self._build_paths()
+        self._prune()
+
+        # Predicted class and class proportions of every node, leaf or not
+        node_value = self.tree_.value[:, 0, :]
+        self.node_proba = node_value / node_value.sum(axis=1, keepdims=True)
+        self.node_class = np.argmax(node_value, axis=1)
+
+    def _build_paths(self):
+        left = self.tree_.children_left
+        right = self.tree_.children_right
+
+        parent = np.full(self.node_count, TREE_LEAF, dtype=np.intp)
+        internal = left != TREE_LEAF
+        parent[left[internal]] = np.flatnonzero(internal)
+        parent[right[internal]] = np.flatnonzero(internal)
+        self.parent = parent
+
+        # Root-to-node paths, padded at the end with the node itself
+        depth = np.zeros(self.node_count, dtype=np.intp)
+        for node in range(1, self.node_count):
+            depth[node] = depth[parent[node]] + 1
+        paths = np.empty((self.node_count, depth.max() + 1), dtype=np.intp)
+        paths[:, 0] = 0
+        for node in range(1, self.node_count):
+            d = depth[node]
+            paths[node, :d] = paths[parent[node], :d]
+            paths[node, d:] = node
+        self.depth = depth
+        self.paths = paths
+
+        self.leaves = np.flatnonzero(~internal)
+        self.leaf_index = np.full(self.node_count, -1, dtype=np.intp)
+        self.leaf_index[self.leaves] = np.arange(len(self.leaves))
+
+        # Pre-order numbering of every subtree, for slicing out descendants
+        order = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if left[node] != TREE_LEAF:
+                stack.append(right[node])
+                stack.append(left[node])
+        order = np.array(order, dtype=np.intp)
+        tin = np.empty(self.node_count, dtype=np.intp)
+        tin[order] = np.arange(self.node_count)
+        size = np.ones(self.node_count, dtype=np.intp)
+        for node in order[::-1]:
+            if left[node] != TREE_LEAF:
+                size[node] += size[left[node]] + size[right[node]]
+        self._order = order
+        self._tin = tin
+        self._size = size
+
+    def _prune(self):
+        t = self.tree_
+        internal = t.children_left != TREE_LEAF
+        total_sum_weights = t.weighted_n_node_samples[0]
+        r_node = t.weighted_n_node_samples * t.impurity / total_sum_weights
+
+        # Bubble leaf impurities up to their ancestors, in leaf order
+        n_leaves = np.zeros(self.node_count, dtype=np.intp)
+        r_branch = np.zeros(self.node_count, dtype=np.float64)
+        r_branch[self.leaves] = r_node[self.leaves]
+        leaf_paths = self.paths[self.leaves, :]
+        is_ancestor = np.arange(leaf_paths.shape[1]) < self.depth[self.leaves][:, None]
+        ancestors = leaf_paths[is_ancestor]
+        np.add.at(r_branch, ancestors, np.repeat(r_node[self.leaves], is_ancestor.sum(axis=1)))
+        np.add.at(n_leaves, ancestors, 1)
+
+        candidate = internal.copy()
+        step_of = np.full(self.node_count, np.iinfo(np.intp).max, dtype=np.intp)
+        step_of[~internal] = -1
+        steps = []
+        ccp_alphas = []
+        leaf_counts = [len(self.leaves)]
+        impurities = [r_branch[0]]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            while candidate[0]:
+                subtree_alpha = np.where(candidate, (r_node - r_branch) / (n_leaves - 1), np.inf)
+                node = int(np.argmin(subtree_alpha))
+                effective_alpha = subtree_alpha[node]
+
+                descendants = self._order[self._tin[node]:self._tin[node] + self._size[node]]
+                candidate[descendants] = False
+
+                n_pruned_leaves = n_leaves[node] - 1
+                n_leaves[node] = 0
+                r_diff = r_node[node] - r_branch[node]
+                r_branch[node] = r_node[node]
+                node_ancestors = self.paths[node, :self.depth[node]]
+                n_leaves[node_ancestors] -= n_pruned_leaves
+                r_branch[node_ancestors] += r_diff
+
+                step_of[node] = len(steps)
+                steps.append(node)
+                ccp_alphas.append(effective_alpha)
+                leaf_counts.append(leaf_counts[-1] - n_pruned_leaves)
+                impurities.append(r_branch[0])
+
+        self.steps = np.array(steps, dtype=np.intp)
+        self.ccp_alphas = np.array(ccp_alphas, dtype=np.float64)
+        self.leaf_counts = np.array(leaf_counts, dtype=np.intp)
+        self.impurities = np.array(impurities, dtype=np.float64)
+        self.step_of = step_of
+
+        # Running minimum of the collapse step along each leaf's path: the effective
+        # leaf after k steps is the first node on the path collapsed before step k
+        self._leaf_path_steps = np.minimum.accumulate(step_of[self.paths[self.leaves]], axis=1)
+
+    def n_steps(self, alphas):
+        """Number of pruning steps applied for each alpha (0 for alpha == 0)."""
+        alphas = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+        reached = np.maximum.accumulate(self.ccp_alphas) if len(self.ccp_alphas) else self.ccp_alphas
+        k = np.searchsorted(reached, alphas, side="right")
+        # sklearn skips pruning entirely when ccp_alpha == 0
+        return np.where(alphas == 0.0, 0, k)
+
+    def get_n_leaves(self, alphas):
+        """Leaves of the pruned subtree for each alpha."""
+        return self.leaf_counts[self.n_steps(alphas)]
+
+    def effective_leaves(self, alphas):
+        """
+        Node ids of shape (n_leaves, n_alphas): the leaf of the pruned subtree that
+        each leaf of the unpruned tree falls into.
+        """
+        k = self.n_steps(alphas)
+        position = (self._leaf_path_steps[:, :, None] >= k[None, None, :]).sum(axis=1)
+        return np.take_along_axis(self.paths[self.leaves], position, axis=1)
+
+    def apply(self, X):
+        """Leaf of the unpruned tree reached by each row of X."""
+        t = self.tree_
+        X = np.asarray(X, dtype=np.float32)
+        node = np.zeros(len(X), dtype=np.intp)
+        active = np.flatnonzero(t.children_left[node] != TREE_LEAF)
+        while active.size:
+            current = node[active]
+            go_left = X[active, t.feature[current]] <= t.threshold[current]
+            node[active] = np.where(go_left, t.children_left[current], t.children_right[current])
+            active = active[t.children_left[node[active]] != TREE_LEAF]
+        return node
+
+    def apply_pruned(self, X, alphas):
+        """Leaf of each pruned subtree reached by each row of X, shape (n_alphas, n)."""
+        leaves = self.leaf_index[self.apply(X)]
+        return self.effective_leaves(alphas)[leaves].T
+
+    def predict(self, X, alphas):
+        """Predicted classes of shape (n_alphas, n) for every requested alpha."""
+        return self.classes_.take(self.node_class[self.apply_pruned(X, alphas)])
+
+    def subtree(self, alpha):
+        """Estimator-like view of the subtree pruned at a single alpha."""
+        return PrunedTree(self, alpha)
+
+
+class PrunedTree:
+    """
+    Read-only stand-in for DecisionTreeClassifier(ccp_alpha=alpha) fitted on the
+    same data. apply() returns node ids of the unpruned tree, so `tree_` node
+    arrays (n_node_samples, value, ...) can be indexed with them directly.
+    """
+
+    def __init__(self, path, alpha):
+        self.path = path
+        self.ccp_alpha = alpha
+        self.tree_ = path.tree_
+        self.classes_ = path.classes_
+
+    def apply(self, X):
+        return self.path.apply_pruned(X, [self.ccp_alpha])[0]
+
+    def predict_proba(self, X):
+        return self.path.node_proba[self.apply(X)]
+
+    def predict(self, X):
+        return self.classes_.take(self.path.node_class[self.apply(X)])
+
+    def get_n_leaves(self):
+        return int(self.path.get_n_leaves([self.ccp_alpha])[0])
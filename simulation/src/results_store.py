@@ -0,0 +1,404 @@
+"""
+Columnar results store (HDF5) shared by all runs.
+
+Each table is a group of 1-D column datasets of equal length: resizable, chunked
+and gzip-compressed, typed per column (float64, int64, bool or string). Rows are
+appended as they are produced, one cell at a time if need be. Reading a column,
+or a slice of one, touches only that column's chunks, so a query over thousands of
+runs reads a few arrays instead of parsing every results.json or CSV.
+
+Layout:
+    /runs/<column>            one row per run: run (id), name, experiment, config (JSON), created
+    /tables/<table>/<column>  the table's columns; column "run" refers to /runs
+
+Columns appear when first appended; earlier rows read as the fill value (NaN, -1,
+False or ""). HDF5 allows one writer at a time: append from a single process (as
+main.py does; its pool workers hand results back to it).
+
+    python simulation/src/results_store.py import simulation/runs/* simulations/results/*.csv
+    python simulation/src/results_store.py query sparse_parity error_exc --where alpha=0.01:0.1 --by run
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+
+DEFAULT_STORE = os.path.join("simulation", "results.h5")
+
+# Rows per chunk; one chunk of a float column is 32 KB before compression
+CHUNK_ROWS = 4096
+COMPRESSION_LEVEL = 4
+
+FILL = {"f": np.nan, "i": -1, "b": False, "O": ""}
+
+
+def _kind(dtype):
+    """Storage kind of a dtype: "f", "i", "b" or "O" (string)."""
+    return "O" if dtype.kind in "OSU" else "i" if dtype.kind in "iu" else dtype.kind
+
+
+def _as_column(values):
+    """
+    values as a 1-D array of a storable dtype (float64, int64, bool or str as object),
+    and a mask of the missing ones (None), which hold the dtype's fill value.
+    """
+    values = np.asarray(values)
+    missing = np.zeros(len(values), dtype=bool)
+    if values.dtype.kind == "O":
+        # Infer the type from the values present; a column of only None is float
+        missing = np.array([v is None for v in values], dtype=bool)
+        present = np.asarray(values[~missing].tolist())
+        values = np.empty(len(missing), dtype=present.dtype if present.dtype.kind in "biuf" else object)
+        values[~missing] = present
+    kind = _kind(values.dtype)
+    if kind == "i":
+        values = values.astype(np.int64)
+    elif kind == "f":
+        values = values.astype(np.float64)
+    elif kind == "O":
+        values = np.array([str(v) for v in values], dtype=object)
+    values[missing] = FILL[kind]
+    return values, missing
+
+
+def _matches(column, condition):
+    """Row mask: (lo, hi) is a closed range, a list or set is membership, anything else equality."""
+    if isinstance(condition, tuple):
+        lo, hi = condition
+        return (column >= lo) & (column <= hi)
+    if isinstance(condition, (list, set, frozenset, np.ndarray)):
+        return np.isin(column, list(condition))
+    return column == condition
+
+
+class ResultsStore:
+    """An HDF5 results store; use as a context manager."""
+
+    def __init__(self, path=DEFAULT_STORE, mode="a"):
+        import h5py
+
+        self._h5py = h5py
+        if mode != "r" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.file = h5py.File(path, mode)
+        # Run name -> id, read on first use
+        self._run_ids = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _group(self, table):
+        return self.file["runs"] if table == "runs" else self.file["tables"][table]
+
+    def tables(self):
+        return sorted(self.file["tables"]) if "tables" in self.file else []
+
+    def columns(self, table):
+        return list(self._group(table))
+
+    def n_rows(self, table):
+        if table not in (["runs"] if "runs" in self.file else []) + self.tables():
+            return 0
+        group = self._group(table)
+        return len(group[next(iter(group))]) if len(group) else 0
+
+    def n_run_rows(self, table, run):
+        """Rows of a table belonging to a run."""
+        if not self.n_rows(table):
+            return 0
+        return int((self.column(table, "run")[:] == run).sum())
+
+    def column(self, table, name):
+        """A column as a lazy h5py dataset: slicing it reads only the rows asked for."""
+        dataset = self._group(table)[name]
+        return dataset.asstr() if self._h5py.check_string_dtype(dataset.dtype) else dataset
+
+    # Writing
+
+    def _create_column(self, group, name, values, n_rows):
+        kind = values.dtype.kind
+        dtype = self._h5py.string_dtype() if kind == "O" else values.dtype
+        group.create_dataset(name, shape=(n_rows,), maxshape=(None,), dtype=dtype,
+                             chunks=(CHUNK_ROWS,), compression="gzip",
+                             compression_opts=COMPRESSION_LEVEL, fillvalue=FILL[kind])
+
+    def _promote(self, group, name):
+        """Rewrites an int column as float64 (its -1 fills become -1.0)."""
+        values = group[name][:].astype(np.float64)
+        del group[name]
+        self._create_column(group, name, values, len(values))
+        group[name][:] = values
+
+    def _conform(self, group, name, values, missing):
+        """
+        values (from _as_column) in the dtype of the existing column name: ints go into
+        a float column as floats, and floats turn an int column into a float one. Other
+        mismatches raise ValueError.
+        """
+        stored = _kind(group[name].dtype)
+        kind = _kind(values.dtype)
+        if missing.all():
+            return np.full(len(values), FILL[stored], dtype=object if stored == "O" else group[name].dtype)
+        if kind == stored:
+            return values
+        if (kind, stored) == ("f", "i"):
+            self._promote(group, name)
+            return values
+        if (kind, stored) == ("i", "f"):
+            values = values.astype(np.float64)
+            values[missing] = np.nan
+            return values
+        raise ValueError(f"Column {name!r} of {group.name} holds {group[name].dtype} values, "
+                         f"cannot append {values.dtype}")
+
+    def append(self, table, rows, run=None):
+        """
+        Appends rows to a table: a dict of equal-length columns, or a list of dicts.
+        A missing value (None, or a key absent from some dicts) is stored as the
+        column's fill value. run: id from add_run, stored in column "run". Returns
+        the number of rows added.
+        """
+        if isinstance(rows, list):
+            rows = {key: [row.get(key) for row in rows] for key in dict.fromkeys(k for row in rows for k in row)}
+        columns = {name: _as_column(values) for name, values in rows.items()}
+        n_new = len(next(iter(columns.values()))[0]) if columns else 0
+        if run is not None:
+            columns["run"] = (np.full(n_new, run, dtype=np.int64), np.zeros(n_new, dtype=bool))
+        if n_new == 0:
+            return 0
+        if table == "runs":
+            group = self.file.require_group("runs")
+        else:
+            group = self.file.require_group("tables").require_group(table)
+        n_rows = self.n_rows(table)
+
+        for name, (values, missing) in columns.items():
+            if len(values) != n_new:
+                raise ValueError(f"Column {name!r} has {len(values)} rows, expected {n_new}")
+            if name in group:
+                columns[name] = self._conform(group, name, values, missing)
+            else:
+                self._create_column(group, name, values, n_rows)
+                columns[name] = values
+        # Every column grows, so ones missing from these rows take their fill value
+        for name, dataset in group.items():
+            dataset.resize((n_rows + n_new,))
+            if name in columns:
+                dataset[n_rows:] = columns[name]
+        return n_new
+
+    def add_run(self, name, experiment, config=None):
+        """Registers a run (or finds it by name) and returns its id."""
+        run = self.run_id(name)
+        if run is not None:
+            return run
+        run = len(self._run_ids)
+        self.append("runs", {"run": [run], "name": [name], "experiment": [experiment],
+                             "config": [json.dumps(config or {}, sort_keys=True, default=str)],
+                             "created": [time.time()]})
+        self._run_ids[name] = run
+        return run
+
+    def run_id(self, name):
+        """Id of the run called name, or None."""
+        if self._run_ids is None:
+            self._run_ids = {}
+            if self.n_rows("runs"):
+                self._run_ids = dict(zip(self.column("runs", "name")[:], self.column("runs", "run")[:].tolist()))
+        return self._run_ids.get(name)
+
+    def drop_run(self, table, run):
+        """Removes a run's rows from a table (rewrites the table's columns)."""
+        if table not in self.tables():
+            return
+        keep = self.column(table, "run")[:] != run
+        if keep.all():
+            return
+        for name, dataset in self._group(table).items():
+            values = (self.column(table, name)[:])[keep]
+            dataset.resize((len(values),))
+            dataset[:] = values
+
+    # Reading
+
+    def select(self, table, columns=None, **where):
+        """
+        Columns of the rows matching every condition of `where` (column=condition; see
+        _matches), as a dict of arrays. Only the filter and requested columns are read.
+        """
+        if columns is None:
+            columns = self.columns(table)
+        mask = np.ones(self.n_rows(table), dtype=bool)
+        for name, condition in where.items():
+            mask &= _matches(self.column(table, name)[:], condition)
+        return {name: self.column(table, name)[:][mask] for name in columns}
+
+    def aggregate(self, table, value, by, **where):
+        """
+        Mean, standard deviation and count of `value` for each distinct `by`, over the
+        rows matching `where`. Returns a dict of arrays keyed by, mean, std, count.
+        """
+        data = self.select(table, [by, value], **where)
+        keys, inverse = np.unique(data[by], return_inverse=True)
+        x = data[value].astype(np.float64)
+        count = np.bincount(inverse, minlength=len(keys))
+        mean = np.bincount(inverse, weights=x, minlength=len(keys)) / count
+        var = np.bincount(inverse, weights=(x - mean[inverse]) ** 2, minlength=len(keys)) / np.maximum(count - 1, 1)
+        return {by: keys, "mean": mean, "std": np.sqrt(var), "count": count}
+
+    def frame(self, table, columns=None, **where):
+        """select() as a pandas DataFrame."""
+        import pandas as pd
+
+        return pd.DataFrame(self.select(table, columns, **where))
+
+
+def save_frame(path, table, df, experiment, config=None, name=None):
+    """
+    Appends a results DataFrame (as the audit scripts write to CSV) to the store as a
+    new run of `experiment`. Returns the run id.
+    """
+    if name is None:
+        name = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{table}"
+    with ResultsStore(path) as store:
+        run = store.add_run(name, experiment, config)
+        store.drop_run(table, run)
+        store.append(table, {column: df[column].to_numpy() for column in df.columns}, run=run)
+    return run
+
+
+def summary_rows(results):
+    """
+    main.py's results.json entries as flat rows: CI pairs become _lo / _hi columns,
+    other lists (e.g. features_used in early runs) JSON strings.
+    """
+    rows = []
+    for r in results:
+        row = {}
+        for key, value in r.items():
+            if isinstance(value, (list, tuple)) and len(value) == 2 and key.endswith("_ci"):
+                row[f"{key}_lo"], row[f"{key}_hi"] = value
+            elif isinstance(value, (list, tuple, dict)):
+                row[key] = json.dumps(value)
+            else:
+                row[key] = value
+        rows.append(row)
+    return rows
+
+
+def import_path(store, path):
+    """
+    Imports a main.py run directory (results.json and cells.jsonl, as tables
+    sparse_parity and sparse_parity_cells) or a results CSV (table named after the
+    file). A run directory whose results.json is a single record (another runner's)
+    becomes one row of table run_results. Paths already in the store are skipped.
+    Returns the rows added.
+    """
+    name = os.path.normpath(path)
+    if store.run_id(name) is not None:
+        return 0
+    if os.path.isdir(path):
+        results_path = os.path.join(path, "results.json")
+        if not os.path.exists(results_path):
+            return 0
+        try:
+            with open(results_path) as f:
+                results = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Skipping {path}: results.json is incomplete")
+            return 0
+        config_path = os.path.join(path, "config.json")
+        config = {}
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+        if isinstance(results, dict):
+            run = store.add_run(name, "run_results", config)
+            return store.append("run_results", summary_rows([results]), run=run)
+        run = store.add_run(name, "sparse_parity", config)
+        n = store.append("sparse_parity", summary_rows(results), run=run)
+        cells_path = os.path.join(path, "cells.jsonl")
+        if os.path.exists(cells_path):
+            with open(cells_path) as f:
+                cells = []
+                for line in f:
+                    try:
+                        cells.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+            n += store.append("sparse_parity_cells", cells, run=run)
+        return n
+    if path.endswith(".csv"):
+        import pandas as pd
+
+        table = os.path.basename(path)[:-len(".csv")]
+        if table.endswith("_results"):
+            table = table[:-len("_results")]
+        df = pd.read_csv(path)
+        run = store.add_run(name, table)
+        return store.append(table, {column: df[column].to_numpy() for column in df.columns}, run=run)
+    return 0
+
+
+def _condition(text):
+    """CLI filter value: lo:hi, a,b,c or a single value."""
+    def number(s):
+        try:
+            return int(s)
+        except ValueError:
+            try:
+                return float(s)
+            except ValueError:
+                return s
+    if ":" in text:
+        lo, hi = text.split(":")
+        return (number(lo), number(hi))
+    if "," in text:
+        return [number(s) for s in text.split(",")]
+    return number(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--store", default=DEFAULT_STORE, help="HDF5 results store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="Import main.py run directories and results CSVs")
+    p.add_argument("paths", nargs="+")
+    p = sub.add_parser("tables", help="List tables, their rows and columns")
+    p = sub.add_parser("query", help="Aggregate a column over the matching rows")
+    p.add_argument("table")
+    p.add_argument("value")
+    p.add_argument("--where", nargs="*", default=[], metavar="COLUMN=VALUE",
+                   help="Filters: alpha=0.01:0.1 (closed range), seed=0,1,2 (any of) or run=3")
+    p.add_argument("--by", default="alpha", help="Group rows by this column")
+    args = parser.parse_args()
+
+    mode = "a" if args.command == "import" else "r"
+    with ResultsStore(args.store, mode) as store:
+        if args.command == "import":
+            start = time.perf_counter()
+            n = sum(import_path(store, path) for path in args.paths)
+            print(f"Imported {n} rows into {args.store} in {time.perf_counter() - start:.2f}s")
+        elif args.command == "tables":
+            for table in ["runs"] + store.tables():
+                print(f"{table}: {store.n_rows(table)} rows; {', '.join(store.columns(table))}")
+        else:
+            where = dict(arg.split("=", 1) for arg in args.where)
+            start = time.perf_counter()
+            agg = store.aggregate(args.table, args.value, args.by,
+                                  **{key: _condition(value) for key, value in where.items()})
+            elapsed = time.perf_counter() - start
+            print(f"{args.value} by {args.by} ({elapsed * 1000:.1f} ms)")
+            for key, mean, std, count in zip(agg[args.by], agg["mean"], agg["std"], agg["count"]):
+                print(f"  {key}: {mean:.4f} +/- {std:.4f} (n={count})")
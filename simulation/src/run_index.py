@@ -0,0 +1,289 @@
+"""
+SQLite catalogue of the run directories under simulation/runs.
+
+Each run directory is indexed with:
+- its config parameters, one row per key in table params;
+- summary metrics from its results.json (mean and max of every numeric field) in
+  table metrics;
+- its files, in table artefacts.
+
+Scans are incremental. A directory whose newest file mtime and file count are
+unchanged is skipped. Otherwise its config, results and cell log are hashed, and the
+directory is only re-read if the hash changed.
+
+Config dedup: a run's config_hash covers every setting that affects its results
+(not workers, cache or output options) together with the code version main.py
+records. Before starting, main.py looks up a complete run with the same hash and
+serves it instead of recomputing. Runs from before code versions were recorded
+never match, so a result computed by different code is not served.
+
+    python simulation/src/run_index.py scan
+    python simulation/src/run_index.py list --where engine=path n_trials=20
+    python simulation/src/run_index.py show <run_name>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_RUNS_DIR = os.path.join("simulation", "runs")
+INDEX_FILE = "index.sqlite"
+
+# Settings that do not change a run's results
+PROCESS_SETTINGS = ("workers", "resume", "cache_dir", "cache_max_mb", "no_cache", "profile_imports",
+                    "store", "recompute")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    n_files INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    config TEXT,
+    config_hash TEXT,
+    complete INTEGER NOT NULL,
+    indexed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_config_hash ON runs (config_hash);
+CREATE TABLE IF NOT EXISTS params (
+    name TEXT NOT NULL, key TEXT NOT NULL, value TEXT, number REAL, PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT NOT NULL, metric TEXT NOT NULL, value REAL, PRIMARY KEY (name, metric)
+);
+CREATE TABLE IF NOT EXISTS artefacts (
+    name TEXT NOT NULL, path TEXT NOT NULL, size INTEGER, mtime REAL, PRIMARY KEY (name, path)
+);
+"""
+
+# Files whose content identifies a run's state
+CONTENT_FILES = ("config.json", "results.json", "cells.jsonl")
+
+
+def config_hash(config):
+    """
+    Hash of the settings that determine a run's results, or None if the config does
+    not record the code version that produced them.
+    """
+    if not config.get("code_version"):
+        return None
+    relevant = {key: value for key, value in config.items() if key not in PROCESS_SETTINGS}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+
+def _files(run_dir):
+    """(relative path, size, mtime) of every file under run_dir."""
+    files = []
+    for root, _, names in os.walk(run_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            files.append((os.path.relpath(path, run_dir), st.st_size, st.st_mtime))
+    return sorted(files)
+
+
+def _content_hash(run_dir):
+    h = hashlib.sha256()
+    for name in CONTENT_FILES:
+        path = os.path.join(run_dir, name)
+        if os.path.exists(path):
+            h.update(name.encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+    return h.hexdigest()
+
+
+def summary_metrics(results):
+    """
+    Mean and max of every numeric field of results.json: a list of records (one per
+    alpha) or a single record.
+    """
+    records = results if isinstance(results, list) else [results]
+    values = {}
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values.setdefault(key, []).append(float(value))
+    metrics = {"n_records": float(len(records))}
+    for key, v in values.items():
+        metrics[f"{key}_mean"] = sum(v) / len(v)
+        metrics[f"{key}_max"] = max(v)
+    return metrics
+
+
+class RunIndex:
+    """The catalogue of one runs directory, stored in <runs_dir>/index.sqlite."""
+
+    def __init__(self, runs_dir=DEFAULT_RUNS_DIR, path=None):
+        self.runs_dir = runs_dir
+        os.makedirs(runs_dir, exist_ok=True)
+        self.db = sqlite3.connect(path or os.path.join(runs_dir, INDEX_FILE), timeout=30)
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _forget(self, name):
+        for table in ("runs", "params", "metrics", "artefacts"):
+            self.db.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+
+    def _index(self, name, run_dir, files, mtime, content_hash):
+        config = {}
+        config_path = os.path.join(run_dir, "config.json")
+        if os.path.exists(config_path):
+            try:
+                with open(config_path) as f:
+                    config = json.load(f)
+            except json.JSONDecodeError:
+                config = {}
+        results = None
+        results_path = os.path.join(run_dir, "results.json")
+        if os.path.exists(results_path):
+            try:
+                with open(results_path) as f:
+                    results = json.load(f)
+            except json.JSONDecodeError:
+                results = None
+        # Complete: results written after the config (a resumed run rewrites its config first)
+        complete = results is not None and (
+            not os.path.exists(config_path) or os.path.getmtime(results_path) >= os.path.getmtime(config_path))
+
+        self._forget(name)
+        self.db.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (name, run_dir, mtime, len(files), content_hash, json.dumps(config, sort_keys=True),
+                         config_hash(config), int(complete), time.time()))
+        self.db.executemany("INSERT INTO params VALUES (?, ?, ?, ?)",
+                            [(name, key, json.dumps(value),
+                              float(value) if isinstance(value, (int, float)) else None)
+                             for key, value in config.items()])
+        if results is not None:
+            self.db.executemany("INSERT INTO metrics VALUES (?, ?, ?)",
+                                [(name, metric, value) for metric, value in summary_metrics(results).items()])
+        self.db.executemany("INSERT INTO artefacts VALUES (?, ?, ?, ?)",
+                            [(name, os.path.join(run_dir, path), size, file_mtime)
+                             for path, size, file_mtime in files])
+
+    def scan(self):
+        """
+        Brings the catalogue up to date with the runs directory. Returns the number
+        of directories (re)indexed and removed.
+        """
+        known = {name: (mtime, n_files, content_hash) for name, mtime, n_files, content_hash in
+                 self.db.execute("SELECT name, mtime, n_files, content_hash FROM runs")}
+        n_indexed = 0
+        present = set()
+        with self.db:
+            for name in sorted(os.listdir(self.runs_dir)):
+                run_dir = os.path.join(self.runs_dir, name)
+                if not os.path.isdir(run_dir):
+                    continue
+                present.add(name)
+                files = _files(run_dir)
+                mtime = max((file_mtime for _, _, file_mtime in files), default=os.path.getmtime(run_dir))
+                if name in known and known[name][:2] == (mtime, len(files)):
+                    continue
+                content_hash = _content_hash(run_dir)
+                if name in known and known[name][2] == content_hash:
+                    # Touched but not changed: only the artefact list and mtime move on
+                    self.db.execute("UPDATE runs SET mtime = ?, n_files = ? WHERE name = ?",
+                                    (mtime, len(files), name))
+                    self.db.execute("DELETE FROM artefacts WHERE name = ?", (name,))
+                    self.db.executemany("INSERT INTO artefacts VALUES (?, ?, ?, ?)",
+                                        [(name, os.path.join(run_dir, path), size, file_mtime)
+                                         for path, size, file_mtime in files])
+                    continue
+                self._index(name, run_dir, files, mtime, content_hash)
+                n_indexed += 1
+            removed = set(known) - present
+            for name in removed:
+                self._forget(name)
+        return n_indexed, len(removed)
+
+    def find_identical(self, config):
+        """Path of a complete run with the same result-relevant config, or None."""
+        h = config_hash(config)
+        if h is None:
+            return None
+        row = self.db.execute("SELECT path FROM runs WHERE config_hash = ? AND complete = 1 "
+                              "ORDER BY name DESC LIMIT 1", (h,)).fetchone()
+        return row[0] if row else None
+
+    def select(self, **where):
+        """Names of runs whose config parameters equal the given values."""
+        query = "SELECT name FROM runs"
+        args = []
+        for key, value in where.items():
+            query += (" INTERSECT SELECT name FROM params WHERE key = ? AND "
+                      + ("number = ?" if isinstance(value, (int, float)) else "value = ?"))
+            args += [key, value if isinstance(value, (int, float)) else json.dumps(value)]
+        return [name for (name,) in self.db.execute(query + " ORDER BY name", args)]
+
+    def metrics(self, name):
+        return dict(self.db.execute("SELECT metric, value FROM metrics WHERE name = ?", (name,)))
+
+    def params(self, name):
+        return {key: json.loads(value) for key, value in
+                self.db.execute("SELECT key, value FROM params WHERE name = ?", (name,))}
+
+    def artefacts(self, name):
+        return [path for (path,) in self.db.execute("SELECT path FROM artefacts WHERE name = ? ORDER BY path",
+                                                    (name,))]
+
+
+def served_run(config, runs_dir=DEFAULT_RUNS_DIR):
+    """
+    For runners: refreshes the catalogue and returns the directory of an earlier
+    complete run with the same config (a dict), or None.
+    """
+    with RunIndex(runs_dir) as index:
+        index.scan()
+        return index.find_identical(config)
+
+
+def _value(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs_dir", default=DEFAULT_RUNS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("scan", help="Index new and changed run directories")
+    p = sub.add_parser("list", help="Runs whose config matches every KEY=VALUE")
+    p.add_argument("--where", nargs="*", default=[], metavar="KEY=VALUE")
+    p = sub.add_parser("show", help="Config, metrics and artefacts of a run")
+    p.add_argument("name")
+    args = parser.parse_args()
+
+    with RunIndex(args.runs_dir) as index:
+        start = time.perf_counter()
+        n_indexed, n_removed = index.scan()
+        if args.command == "scan":
+            print(f"Indexed {n_indexed} run directories, removed {n_removed} "
+                  f"({time.perf_counter() - start:.2f}s)")
+        elif args.command == "list":
+            where = {key: _value(value) for key, value in (arg.split("=", 1) for arg in args.where)}
+            for name in index.select(**where):
+                m = index.metrics(name)
+                print(f"{name}: {int(m.get('n_records', 0))} records"
+                      + (f", mean error_exc {m['error_exc_mean']:.4f}" if "error_exc_mean" in m else ""))
+        else:
+            print(json.dumps(index.params(args.name), indent=4))
+            for metric, value in sorted(index.metrics(args.name).items()):
+                print(f"{metric}: {value:.6g}")
+            for path in index.artefacts(args.name):
+                print(path)
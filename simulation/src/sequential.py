@@ -0,0 +1,79 @@
+"""
+Sequential stopping: trials in batches per cell until its interval is tight.
+
+A fixed trial count spends as much on a flat region of the alpha grid, where every
+trial gives the same error, as on the fragility transition, where errors vary most.
+Here every cell (an alpha, say) runs trials in batches and stops as soon as the
+bootstrap CI of its mean is no wider than a target, or a trial cap is reached.
+All cells still running share the same trial range in each round, so a batch is
+one (alphas x trials) block of work, as for a fixed grid.
+"""
+
+import numpy as np
+
+from bootstrap import bootstrap_ci
+
+# Resamples for the interim CIs that decide when to stop (the final CIs use the runner's own)
+STOP_RESAMPLES = 2000
+
+
+def ci_widths(values, level=0.90, n_resamples=STOP_RESAMPLES, rng=None):
+    """Width of the bootstrap CI of the mean of each column of values (observations on axis 0)."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return np.full(values.shape[1:], np.inf)
+    _, ci = bootstrap_ci(values, level=level, n_resamples=n_resamples, rng=rng)
+    return ci[..., 1] - ci[..., 0]
+
+
+def sequential_trials(cells, run_batch, widths, target_width, batch, max_trials):
+    """
+    cells: cell keys. run_batch(active, trials) runs the range `trials` for the
+    active cells; widths(active, n) returns their CI widths after n trials each.
+    A cell stops once its width is <= target_width or it has run max_trials trials.
+    Returns {cell: trials used}.
+    """
+    if batch < 1:
+        raise ValueError(f"batch must be positive, got {batch}")
+    n_used = {cell: 0 for cell in cells}
+    active = list(cells)
+    while active:
+        start = n_used[active[0]]
+        trials = range(start, min(start + batch, max_trials))
+        run_batch(active, trials)
+        for cell in active:
+            n_used[cell] = trials.stop
+        width = np.asarray(widths(active, trials.stop), dtype=np.float64)
+        active = [cell for cell, w in zip(active, width) if w > target_width and n_used[cell] < max_trials]
+    return n_used
+
+
+def sequential_frame(run_batch, alphas, metrics, target_width, batch, max_seeds, rng, by=()):
+    """
+    sequential_trials for the audit scripts, whose run_batch(alphas, seeds) returns a
+    DataFrame with one row per (alpha, [by...], seed). An alpha stops once the CI of
+    every metric is tight within every group of `by` (e.g. each budget). rng draws
+    the stopping CIs; seed it, or the seeds each alpha uses vary from run to run.
+    Returns (all rows ordered by alpha, by and seed; {alpha: seeds used}).
+    """
+    import pandas as pd
+
+    frames = []
+
+    def run(active, seeds):
+        frames.append(run_batch(active, list(seeds)))
+
+    def widths(active, n):
+        df = pd.concat(frames)
+        out = []
+        for alpha in active:
+            rows = df[df["alpha"] == alpha]
+            groups = rows.groupby(list(by)) if by else [(None, rows)]
+            out.append(max(ci_widths(g[list(metrics)].to_numpy(), rng=rng).max() for _, g in groups))
+        return out
+
+    n_used = sequential_trials(list(alphas), run, widths, target_width, batch, max_seeds)
+    df = pd.concat(frames, ignore_index=True)
+    position = {alpha: i for i, alpha in enumerate(alphas)}
+    df = df.assign(_alpha=df["alpha"].map(position)).sort_values(["_alpha", *by, "seed"], kind="stable")
+    return df.drop(columns="_alpha").reset_index(drop=True), n_used
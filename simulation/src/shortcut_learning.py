@@ -1,8 +1,19 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score
+import argparse
 import os
+import sys
+from bootstrap import bootstrap_ci, DEFAULT_RESAMPLES
+from import_profile import add_profile_argument, run_with_import_profile
+from l1_path import l1_logistic_batch, l1_logistic_path, predict_labels
+
+# Regime codes of the phase diagram (index = code), as named by describe_behaviour
+REGIMES = (
+    "Collapsed (No Features)",
+    "Blind (Uses Shortcut Only)",
+    "Robust (Uses Core Only)",
+    "Mixed (Core Dominant)",
+    "Mixed (Shortcut Dominant)",
+)
 
 # --- 1. Data Generation ---
 def generate_shortcut_data(n, shift=False, corr_train=0.99, corr_shift=0.1):
@@ -16,11 +27,79 @@ def generate_shortcut_data(n, shift=False, corr_train=0.99, corr_shift=0.1):
     y = z_core
     return X, y
 
-def describe_behaviour(clf, alpha):
+def _bernoulli_positions(size, p, rng):
+    """
+    Sorted positions of the successes among `size` Bernoulli(p) trials, drawn as
+    geometric gaps, so memory is proportional to the number of successes.
+    """
+    if p <= 0 or size == 0:
+        return np.empty(0, dtype=np.int64)
+    if p >= 1:
+        return np.arange(size, dtype=np.int64)
+    chunks, last = [], -1
+    while True:
+        gaps = rng.geometric(p, int(1.1 * (size - last) * p) + 64)
+        pos = last + np.cumsum(gaps)
+        chunks.append(pos[pos < size])
+        if pos[-1] >= size:
+            return np.concatenate(chunks)
+        last = pos[-1]
+
+def generate_sparse_shortcut_data(n, n_core=1, n_short=1, n_noise=0, core_density=1.0, short_density=1.0,
+                                  noise_density=0.01, core_scale=0.1, short_scale=1.0, noise_scale=1.0,
+                                  shift=False, corr_train=0.99, corr_shift=0.1, rng=None):
+    """
+    Many-feature version of generate_shortcut_data as a scipy CSR matrix, columns
+    [n_core core | n_short shortcut | n_noise noise]. Each feature of a block is present
+    in a row with that block's density; a present feature carries a sign:
+    core features the sign of z_core (= y), shortcut features the sign of the row's
+    z_short (matches z_core with probability corr), noise features a random sign,
+    times the block's scale. The matrix is assembled from the nonzeros only.
+    """
+    from scipy import sparse
+
+    if rng is None:
+        rng = np.random
+    corr = corr_shift if shift else corr_train
+    y = (rng.random(n) < 0.5).astype(int)
+    z_short = np.where(rng.random(n) < corr, y, 1 - y)
+
+    rows, cols, vals = [], [], []
+    offset = 0
+    for width, density, scale, sign in ((n_core, core_density, core_scale, 2 * y - 1),
+                                        (n_short, short_density, short_scale, 2 * z_short - 1),
+                                        (n_noise, noise_density, noise_scale, None)):
+        pos = _bernoulli_positions(n * width, density, rng)
+        r = pos // max(width, 1)
+        rows.append(r)
+        cols.append(pos % max(width, 1) + offset)
+        if sign is None:
+            vals.append(scale * np.where(rng.random(len(pos)) < 0.5, 1.0, -1.0))
+        else:
+            vals.append(scale * sign[r].astype(np.float64))
+        offset += width
+
+    # Each block is row-major already, so a stable sort by row gives CSR order
+    rows = np.concatenate(rows)
+    order = np.argsort(rows, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+    X = sparse.csr_matrix((np.concatenate(vals)[order], np.concatenate(cols)[order], indptr), shape=(n, offset))
+    return X, y
+
+def shortcut_population(corr):
+    """
+    The four (z_core, z_short) patterns of generate_shortcut_data and their exact
+    probabilities when the shortcut matches the core with probability corr.
+    """
+    X = np.array([[0, 0], [0, 1], [1, 0], [1, 1]])
+    y = X[:, 0]
+    probs = 0.5 * np.where(X[:, 0] == X[:, 1], corr, 1.0 - corr)
+    return X, y, probs
+
+def describe_behaviour(coef):
     """
-    Analyses model coefficients to determine feature dominance.
+    Analyses model coefficients [core, shortcut] to determine feature dominance.
     """
-    coef = clf.coef_[0]
     core_w = abs(coef[0])
     short_w = abs(coef[1])
     
@@ -36,65 +115,87 @@ def describe_behaviour(clf, alpha):
     else:
         return "Collapsed (No Features)"
 
+def regime_codes(coefs):
+    """
+    describe_behaviour for many fits at once: coefs (..., 2) -> codes into REGIMES.
+    """
+    core_w = np.abs(coefs[..., 0])
+    short_w = np.abs(coefs[..., 1])
+    mixed = np.where(core_w > short_w, 3, 4)
+    return np.where(core_w > 0, np.where(short_w > 0, mixed, 2), np.where(short_w > 0, 1, 0)).astype(np.int8)
+
 # --- 2. Simulation ---
-def run_shortcut_experiment():
+def run_shortcut_experiment(n_Cs=20, solver="path", population=False):
     n_train = 1000
     n_test = 500
-    n_bootstrap = 100
+    n_bootstrap = DEFAULT_RESAMPLES
+    rng = np.random.default_rng()
     
-    Cs = np.logspace(-3, 1, 20)
+    Cs = np.logspace(-3, 1, n_Cs)
     alphas = 1.0 / Cs
     
-    X_train, y_train = generate_shortcut_data(n_train, shift=False)
-    X_test_std, y_test_std = generate_shortcut_data(n_test, shift=False)
-    X_test_shift, y_test_shift = generate_shortcut_data(n_test, shift=True)
-    
-    acc_train = []
-    acc_train_ci = []
-    acc_shift = []
-    acc_shift_ci = []
-    behaviours = []
-    
-    for C in Cs:
-        # Scale: z_short is "loud" (1.0), z_core is "quiet" (0.1)
-        X_train_scaled = X_train.copy().astype(float)
-        X_train_scaled[:, 0] *= 0.1 # Core is expensive/quiet
-        X_train_scaled[:, 1] *= 1.0 # Shortcut is cheap/loud
-        
-        X_test_std_scaled = X_test_std.copy().astype(float)
-        X_test_std_scaled[:, 0] *= 0.1
-        X_test_std_scaled[:, 1] *= 1.0
-        
-        X_test_shift_scaled = X_test_shift.copy().astype(float)
-        X_test_shift_scaled[:, 0] *= 0.1
-        X_test_shift_scaled[:, 1] *= 1.0
-
-        clf = LogisticRegression(penalty='l1', C=C, solver='liblinear')
-        clf.fit(X_train_scaled, y_train)
+    if population:
+        # Infinite-data limit: the four patterns weighted by n_train x probability,
+        # scored exactly under the train and shifted pattern probabilities
+        X_train, y_train, p_train = shortcut_population(0.99)
+        w_train = n_train * p_train
+        X_test_std, y_test_std, p_std = shortcut_population(0.99)
+        X_test_shift, y_test_shift, p_shift = shortcut_population(0.1)
+    else:
+        X_train, y_train = generate_shortcut_data(n_train, shift=False)
+        X_test_std, y_test_std = generate_shortcut_data(n_test, shift=False)
+        X_test_shift, y_test_shift = generate_shortcut_data(n_test, shift=True)
+        w_train = None
+    
+    # Scale: z_short is "loud" (1.0), z_core is "quiet" (0.1)
+    scale = np.array([0.1, 1.0]) # Core is expensive/quiet, shortcut is cheap/loud
+    X_train_scaled = X_train * scale
+    X_test_std_scaled = X_test_std * scale
+    X_test_shift_scaled = X_test_shift * scale
+    
+    if solver == "path":
+        # One warm-started pass along the C grid
+        coefs, intercepts = l1_logistic_path(X_train_scaled, y_train, Cs, sample_weight=w_train)
+        correct_std = predict_labels(X_test_std_scaled, coefs, intercepts) == y_test_std
+        correct_shift = predict_labels(X_test_shift_scaled, coefs, intercepts) == y_test_shift
+    else:
+        from sklearn.linear_model import LogisticRegression
         
-        # Bootstrap for Confidence Intervals
-        def get_acc_ci(X, y_true):
-            boot_accs = []
-            y_pred_all = clf.predict(X)
-            for _ in range(n_bootstrap):
-                idx = np.random.choice(len(y_true), size=len(y_true), replace=True)
-                boot_accs.append(accuracy_score(y_true[idx], y_pred_all[idx]))
-            return np.mean(boot_accs), np.percentile(boot_accs, [5, 95])
+        coefs, correct_std, correct_shift = [], [], []
+        for C in Cs:
+            clf = LogisticRegression(penalty='l1', C=C, solver='liblinear')
+            clf.fit(X_train_scaled, y_train, sample_weight=w_train)
+            coefs.append(clf.coef_[0])
+            correct_std.append(clf.predict(X_test_std_scaled) == y_test_std)
+            correct_shift.append(clf.predict(X_test_shift_scaled) == y_test_shift)
+    behaviours = [describe_behaviour(coef) for coef in coefs]
+    
+    # Bootstrap for Confidence Intervals: test points are resampled once for all Cs
+    def get_acc_ci(correct):
+        return bootstrap_ci(np.array(correct).T, level=0.90, n_resamples=n_bootstrap, rng=rng)
 
-        mean_t, ci_t = get_acc_ci(X_test_std_scaled, y_test_std)
-        mean_s, ci_s = get_acc_ci(X_test_shift_scaled, y_test_shift)
-        
-        acc_train.append(mean_t)
-        acc_train_ci.append(ci_t.tolist())
-        acc_shift.append(mean_s)
-        acc_shift_ci.append(ci_s.tolist())
-        
-        behaviour = describe_behaviour(clf, 1.0/C)
-        behaviours.append(behaviour)
-        
-        print(f"Alpha: {1.0/C:7.2f} | Train: {acc_train[-1]:.3f} | Shift: {acc_shift[-1]:.3f} | Behaviour: {behaviour}")
+    if population:
+        # Exact accuracies; no sampling noise, so the intervals collapse to points
+        acc_train = np.array(correct_std) @ p_std
+        acc_shift = np.array(correct_shift) @ p_shift
+        acc_train_ci = np.stack([acc_train, acc_train], axis=1)
+        acc_shift_ci = np.stack([acc_shift, acc_shift], axis=1)
+    else:
+        acc_train, acc_train_ci = get_acc_ci(correct_std)
+        acc_shift, acc_shift_ci = get_acc_ci(correct_shift)
+    
+    if n_Cs <= 50:
+        for C, mean_t, mean_s, behaviour in zip(Cs, acc_train, acc_shift, behaviours):
+            print(f"Alpha: {1.0/C:7.2f} | Train: {mean_t:.3f} | Shift: {mean_s:.3f} | Behaviour: {behaviour}")
+    
+    # Regime transitions along the grid (from weak to strong compression)
+    for k in range(1, n_Cs):
+        if behaviours[k] != behaviours[k - 1]:
+            print(f"Transition between alpha {alphas[k]:.4g} and {alphas[k-1]:.4g}: {behaviours[k]} -> {behaviours[k-1]}")
         
     # --- 4. Plotting ---
+    import matplotlib.pyplot as plt
+    
     plt.figure(figsize=(10, 6))
     
     t_lo = [r[0] for r in acc_train_ci]
@@ -124,5 +225,106 @@ def run_shortcut_experiment():
     plt.savefig(fig_path)
     print(f"Plot saved to {output_path} and {fig_path}")
 
+def run_sparse_experiment(n_core, n_short, n_noise, core_density, density, n_Cs=20, n_train=1000, n_test=500):
+    """
+    The shortcut experiment at high dimension: n_core quiet core features, n_short loud
+    shortcut features and n_noise noise features (shortcut and noise present with
+    `density`), sparse throughout. Regimes compare the L1 mass on the core and
+    shortcut blocks.
+    """
+    rng = np.random.default_rng()
+    Cs = np.logspace(-3, 1, n_Cs)
+    alphas = 1.0 / Cs
+    
+    data = {}
+    for name, shift in (("train", False), ("std", False), ("shift", True)):
+        data[name] = generate_sparse_shortcut_data(n_train if name == "train" else n_test, n_core, n_short, n_noise,
+                                                   core_density=core_density, short_density=density,
+                                                   noise_density=density, shift=shift)
+    X_train, y_train = data["train"]
+    nbytes = X_train.data.nbytes + X_train.indices.nbytes + X_train.indptr.nbytes
+    print(f"Train: {X_train.shape[0]} x {X_train.shape[1]}, {X_train.nnz} nonzeros ({nbytes / 2**20:.1f} MiB)")
+    
+    coefs, intercepts = l1_logistic_path(X_train, y_train, Cs)
+    acc_train, acc_train_ci = bootstrap_ci((predict_labels(data["std"][0], coefs, intercepts) == data["std"][1]).T,
+                                           level=0.90, rng=rng)
+    acc_shift, acc_shift_ci = bootstrap_ci((predict_labels(data["shift"][0], coefs, intercepts) == data["shift"][1]).T,
+                                           level=0.90, rng=rng)
+    
+    blocks = np.split(np.abs(coefs), [n_core, n_core + n_short], axis=1)
+    behaviours = [describe_behaviour([blocks[0][k].sum(), blocks[1][k].sum()]) for k in range(n_Cs)]
+    print("| Alpha | Train Acc | Shift Acc | Nonzero (core/shortcut/noise) | Behaviour |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    for k in range(n_Cs):
+        nonzero = "/".join(str(np.count_nonzero(b[k])) for b in blocks)
+        print(f"| {alphas[k]:.4g} | {acc_train[k]:.3f} [{acc_train_ci[k][0]:.3f}, {acc_train_ci[k][1]:.3f}] "
+              f"| {acc_shift[k]:.3f} [{acc_shift_ci[k][0]:.3f}, {acc_shift_ci[k][1]:.3f}] | {nonzero} | {behaviours[k]} |")
+
+def run_phase_diagram(core_scales, short_scales, corr_trains, corr_shifts, Cs, n_train=1000):
+    """
+    Population-limit regimes and exact accuracies over the full grid
+    (core scale, shortcut scale, corr_train, corr_shift, C), all fits solved as one batch.
+    The fit does not depend on corr_shift, so each (core, shortcut, corr_train, C) is fit once.
+    Returns arrays of shape (len(core_scales), len(short_scales), len(corr_trains), len(corr_shifts), len(Cs)).
+    """
+    a, b, ct, C = (g.ravel() for g in np.meshgrid(core_scales, short_scales, corr_trains, Cs, indexing='ij'))
+    patterns, y, _ = shortcut_population(0.5)
+    X = patterns[None, :, :] * np.stack([a, b], axis=1)[:, None, :]
+    
+    def probs(corr):
+        return 0.5 * np.where(patterns[:, 0] == patterns[:, 1], np.asarray(corr)[:, None], 1.0 - np.asarray(corr)[:, None])
+    
+    p_train = probs(ct)
+    coefs, intercepts = l1_logistic_batch(X, y, C, sample_weight=n_train * p_train)
+    correct = ((X @ coefs[:, :, None])[:, :, 0] + intercepts[:, None] > 0) == y
+    
+    shape = (len(core_scales), len(short_scales), len(corr_trains), 1, len(Cs))
+    full = shape[:3] + (len(corr_shifts),) + shape[4:]
+    acc_shift = (correct @ probs(corr_shifts).T).reshape(shape[:3] + (len(Cs), len(corr_shifts)))
+    return {
+        "regime": np.broadcast_to(regime_codes(coefs).reshape(shape), full).copy(),
+        "acc_train": np.broadcast_to((correct * p_train).sum(axis=1).reshape(shape), full).copy(),
+        "acc_shift": np.moveaxis(acc_shift, 4, 3),
+        "coef": coefs.reshape(shape[:3] + shape[4:] + (2,)),
+    }
+
 if __name__ == "__main__":
-    run_shortcut_experiment()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_Cs", type=int, default=20, help="Points on the C grid (e.g. 1000 to locate regime transitions)")
+    parser.add_argument("--solver", choices=["path", "liblinear"], default="path",
+                        help="path: one warm-started L1 path over all C; liblinear: an independent sklearn fit per C")
+    parser.add_argument("--population", action="store_true",
+                        help="Fit the exact population loss (4 weighted patterns) and report exact accuracies")
+    parser.add_argument("--phase_diagram", metavar="OUT_NPZ", default=None,
+                        help="Population-limit regime map over the grids below (and the C grid), saved to OUT_NPZ")
+    parser.add_argument("--core_scales", type=float, nargs="+", default=list(np.logspace(-2, 0, 20)))
+    parser.add_argument("--short_scales", type=float, nargs="+", default=list(np.logspace(-1, 1, 20)))
+    parser.add_argument("--corr_trains", type=float, nargs="+", default=[0.9, 0.95, 0.99, 0.999])
+    parser.add_argument("--corr_shifts", type=float, nargs="+", default=[0.1, 0.5])
+    parser.add_argument("--sparse", action="store_true",
+                        help="High-dimensional sparse variant with many core, shortcut and noise features")
+    parser.add_argument("--n_core", type=int, default=10)
+    parser.add_argument("--n_short", type=int, default=1000)
+    parser.add_argument("--n_noise", type=int, default=10000)
+    parser.add_argument("--core_density", type=float, default=0.1, help="Probability a core feature is present in a row")
+    parser.add_argument("--density", type=float, default=0.05,
+                        help="Probability a shortcut or noise feature is present in a row")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    
+    if args.profile_imports:
+        sys.exit(run_with_import_profile())
+    if args.phase_diagram:
+        Cs = np.logspace(-3, 1, args.n_Cs)
+        phase = run_phase_diagram(args.core_scales, args.short_scales, args.corr_trains, args.corr_shifts, Cs)
+        np.savez(args.phase_diagram, core_scales=args.core_scales, short_scales=args.short_scales,
+                 corr_trains=args.corr_trains, corr_shifts=args.corr_shifts, Cs=Cs, regimes=REGIMES, **phase)
+        counts = np.bincount(phase["regime"].ravel(), minlength=len(REGIMES))
+        for name, count in zip(REGIMES, counts):
+            print(f"{name:28s} {count / counts.sum():6.1%}")
+        print(f"Phase diagram ({phase['regime'].size} points) saved to {args.phase_diagram}")
+        sys.exit(0)
+    if args.sparse:
+        run_sparse_experiment(args.n_core, args.n_short, args.n_noise, args.core_density, args.density, n_Cs=args.n_Cs)
+        sys.exit(0)
+    run_shortcut_experiment(n_Cs=args.n_Cs, solver=args.solver, population=args.population)
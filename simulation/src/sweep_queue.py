@@ -0,0 +1,425 @@
+"""
+Sweep runner over a shared-filesystem work queue.
+
+An experiment grid is expanded into one work item per cell under a queue directory
+on a filesystem every node mounts (e.g. NFS); there is no scheduler service. Any
+number of workers, on any number of nodes, claim items with lock files and write
+one result file per cell; a reducer then assembles the experiment's usual outputs.
+
+Queue layout:
+    spec.json          experiment name and its options
+    items/<id>.json    one cell each
+    locks/<id>.lock    a claim: created with O_CREAT | O_EXCL, so exactly one worker
+                       gets it; its mtime is the lease, renewed by a heartbeat thread
+    done/<id>.json     the cell's result records, written to a temporary file and
+                       renamed into place, so a result is either complete or absent
+
+A lock whose mtime is older than the lease (its worker died) is taken over by
+renaming it aside and checking that the renamed file is the one found stale; if
+another worker replaced it in between, the live lock is put back. A lock names its
+owner, so a worker that stalled past its lease neither renews nor removes the claim
+that replaced its own. Such a worker, or a rare interleaving of takeovers, can still
+run a cell twice. That is harmless: every cell seeds its own random streams, so a
+cell run twice writes the same result.
+
+    python simulation/src/sweep_queue.py init QUEUE budget_sensitivity --correction incremental
+    python simulation/src/sweep_queue.py work QUEUE        # on every node, as often as wanted
+    python simulation/src/sweep_queue.py status QUEUE
+    python simulation/src/sweep_queue.py reduce QUEUE
+
+Experiments: main (this directory's main.py; options are main.py's flags), and the
+audit scripts under simulations/. Run from the repository root, as main.py is.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# The audit scripts live in simulations/ at the repository root
+SCRIPTS_DIR = Path(__file__).resolve().parents[2] / "simulations"
+
+# Seconds a claim stays valid without a heartbeat
+DEFAULT_LEASE = 600.0
+# Seconds an idle worker waits before looking again for expired claims
+DEFAULT_POLL = 30.0
+
+
+def _write_json(path, obj):
+    """Writes obj to path atomically (temporary file in the same directory, then rename)."""
+    from main import NumpyEncoder
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(obj, f, cls=NumpyEncoder)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _script(name):
+    if str(SCRIPTS_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS_DIR))
+    import importlib
+    return importlib.import_module(name)
+
+
+# Experiments: build_parser() for their options, cells(options) -> list of cells,
+# run(options, cell) -> result records, reduce(options, records in item order)
+
+def _main_module():
+    import main
+    return main
+
+
+def _main_cells(options):
+    import numpy as np
+
+    alphas = np.linspace(0.0, options["alpha_max"], options["n_alphas"]).tolist()
+    if options["engine"] == "path":
+        return [{"alphas": alphas, "trial": i} for i in range(options["n_trials"])]
+    return [{"alpha": alpha, "trial": i} for alpha in alphas for i in range(options["n_trials"])]
+
+
+_main_setup = {}
+
+
+def _main_run(options, cell):
+    import numpy as np
+    main = _main_module()
+
+    # The test set is built once per worker process and shared by its cells
+    key = json.dumps(options, sort_keys=True)
+    if key not in _main_setup:
+        _main_setup[key] = main.setup_experiment(argparse.Namespace(**options))
+        main.init_worker(_main_setup[key][1])
+    params, _ = _main_setup[key]
+    if "alphas" in cell:
+        cell = (np.array(cell["alphas"]), cell["trial"], params)
+        result = main.run_path_cell(cell)
+    else:
+        cell = (cell["alpha"], cell["trial"], params)
+        result = main.run_cell(cell)
+    return main.cell_records(cell, result)
+
+
+def _main_reduce(options, records):
+    """Writes the records as a new run's cell log, then lets main.py resume it."""
+    main = _main_module()
+    config = argparse.Namespace(**options)
+    run_dir = main.open_run_dir(config)
+    with main.open_cell_log(run_dir) as log:
+        for rec in records:
+            log.write(json.dumps(rec) + "\n")
+    config.resume = run_dir
+    main.run_experiment(config)
+    return run_dir
+
+
+def _script_cells(name, options):
+    module = _script(name)
+    return [{"alpha": alpha, "seed": seed} for alpha in module.ALPHAS for seed in range(module.N_SEEDS)]
+
+
+def _budgets(module, options):
+    budgets = options.get("budgets") or module.BUDGETS
+    return sorted(budgets) if options.get("nested") else list(budgets)
+
+
+def _script_run(name, options, cell):
+    module = _script(name)
+    kwargs = {key: options[key] for key in ("correction", "nested") if key in options}
+    if name == "budget_sensitivity":
+        df = module.run_experiment([cell["alpha"]], _budgets(module, options), seeds=[cell["seed"]], **kwargs)
+    else:
+        df = module.run_experiment([cell["alpha"]], module.BUDGET, seeds=[cell["seed"]], **kwargs)
+    return df.to_dict("records")
+
+
+def _script_reduce(name, options, records):
+    """Writes the CSV the script itself writes, rows in the script's order."""
+    import pandas as pd
+
+    module = _script(name)
+    df = pd.DataFrame(records)
+    if name == "budget_sensitivity":
+        # Items run all budgets of one (alpha, seed); the script orders by alpha, budget, seed
+        position = {"alpha": module.ALPHAS, "budget": _budgets(module, options)}
+        df = df.sort_values(["alpha", "budget", "seed"], kind="stable",
+                            key=lambda col: col.map({v: i for i, v in enumerate(position[col.name])})
+                            if col.name in position else col)
+        stem = "budget_sensitivity_nested" if options.get("nested") else "budget_sensitivity"
+    else:
+        stem = name
+    out = SCRIPTS_DIR / "results" / f"{stem}_results.csv"
+    out.parent.mkdir(exist_ok=True)
+    df.to_csv(out, index=False)
+    if options.get("store"):
+        from results_store import save_frame
+        save_frame(options["store"], stem, df, name, options)
+    return str(out)
+
+
+def _script_experiment(name):
+    return {
+        "build_parser": lambda: _script(name).build_parser(),
+        "cells": lambda options: _script_cells(name, options),
+        "run": lambda options, cell: _script_run(name, options, cell),
+        "reduce": lambda options, records: _script_reduce(name, options, records),
+    }
+
+
+EXPERIMENTS = {
+    "main": {
+        "build_parser": lambda: _main_module().build_parser(),
+        "cells": _main_cells,
+        "run": _main_run,
+        "reduce": _main_reduce,
+    },
+    "sparse_parity_audit": _script_experiment("sparse_parity_audit"),
+    "sparse_parity_revised": _script_experiment("sparse_parity_revised"),
+    "budget_sensitivity": _script_experiment("budget_sensitivity"),
+}
+
+
+class WorkQueue:
+    """A queue directory: items, claims and results of one experiment grid."""
+
+    def __init__(self, root, lease=DEFAULT_LEASE):
+        self.root = root
+        self.lease = lease
+        self.items_dir = os.path.join(root, "items")
+        self.locks_dir = os.path.join(root, "locks")
+        self.done_dir = os.path.join(root, "done")
+        self.owner = f"{socket.gethostname()}.{os.getpid()}"
+
+    @classmethod
+    def create(cls, root, experiment, options):
+        """Expands the experiment grid into work items under root."""
+        if experiment not in EXPERIMENTS:
+            raise ValueError(f"Unknown experiment {experiment!r}; expected one of {tuple(EXPERIMENTS)}")
+        if os.path.exists(os.path.join(root, "spec.json")):
+            raise FileExistsError(f"{root} already holds a queue")
+        if options.get("target_ci_width") is not None:
+            raise ValueError("--target_ci_width decides the trials as results come in; "
+                             "a queue needs the full grid up front")
+        queue = cls(root)
+        for d in (queue.items_dir, queue.locks_dir, queue.done_dir):
+            os.makedirs(d, exist_ok=True)
+        cells = EXPERIMENTS[experiment]["cells"](options)
+        width = len(str(len(cells)))
+        for i, cell in enumerate(cells):
+            _write_json(os.path.join(queue.items_dir, f"{i:0{width}d}.json"), cell)
+        # Written last: a queue without spec.json is incomplete
+        _write_json(os.path.join(root, "spec.json"), {"experiment": experiment, "options": options,
+                                                      "n_items": len(cells)})
+        return queue
+
+    @property
+    def spec(self):
+        return _read_json(os.path.join(self.root, "spec.json"))
+
+    def item_ids(self):
+        return sorted(name[:-len(".json")] for name in os.listdir(self.items_dir) if name.endswith(".json"))
+
+    def done_ids(self):
+        return {name[:-len(".json")] for name in os.listdir(self.done_dir) if name.endswith(".json")}
+
+    def _lock_path(self, item_id):
+        return os.path.join(self.locks_dir, f"{item_id}.lock")
+
+    def _stale_stat(self, path):
+        """os.stat of the lock if its lease has run out, else None."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st if time.time() - st.st_mtime > self.lease else None
+
+    def _expired(self, path):
+        return self._stale_stat(path) is not None
+
+    def claim(self, item_id):
+        """Takes the item's lock; False if another worker holds a live claim on it."""
+        path = self._lock_path(item_id)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                seen = self._stale_stat(path)
+                if seen is None:
+                    return False
+                # Break the stale claim: only the worker whose rename succeeds removes it
+                stale = f"{path}.stale.{self.owner}"
+                try:
+                    os.rename(path, stale)
+                except FileNotFoundError:
+                    continue
+                moved = os.stat(stale)
+                if (moved.st_ino, moved.st_mtime) != (seen.st_ino, seen.st_mtime):
+                    # Another worker broke the claim and locked afresh after our stat:
+                    # we moved its live lock, so put it back (without replacing a newer one)
+                    try:
+                        os.link(stale, path)
+                    except FileExistsError:
+                        pass
+                    os.unlink(stale)
+                    return False
+                os.unlink(stale)
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(f"{self.owner} {time.time():.0f}\n")
+            return True
+        return False
+
+    def _owns(self, path):
+        """Whether the lock at path is this worker's (not a claim taken over from it)."""
+        try:
+            with open(path) as f:
+                return f.read().split(" ", 1)[0] == self.owner
+        except FileNotFoundError:
+            return False
+
+    def release(self, item_id):
+        """Removes the item's lock if it is still this worker's claim."""
+        path = self._lock_path(item_id)
+        if not self._owns(path):
+            return
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _heartbeat(self, item_id, stop):
+        """Renews the claim's lease until stop is set, or until another worker has taken it over."""
+        path = self._lock_path(item_id)
+        while not stop.wait(self.lease / 3):
+            if not os.path.exists(path):
+                # Moved aside for a moment by a worker checking it; renew on the next beat
+                continue
+            if not self._owns(path):
+                return
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+
+    def run_item(self, item_id, experiment, options):
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(item_id, stop), daemon=True)
+        beat.start()
+        try:
+            cell = _read_json(os.path.join(self.items_dir, f"{item_id}.json"))
+            records = EXPERIMENTS[experiment]["run"](options, cell)
+            _write_json(os.path.join(self.done_dir, f"{item_id}.json"), {"records": records})
+        finally:
+            stop.set()
+            beat.join()
+            self.release(item_id)
+
+    def work(self, max_items=None, wait=True, poll=DEFAULT_POLL):
+        """
+        Claims and runs items until every item is done (or max_items were run). Items
+        are visited in a per-worker random order so workers rarely contend. With
+        wait, a worker that finds only live claims keeps polling for expired ones.
+        Returns the number of items this worker ran.
+        """
+        spec = self.spec
+        ids = self.item_ids()
+        random.Random(self.owner).shuffle(ids)
+        n_run = 0
+        while True:
+            done = self.done_ids()
+            pending = [i for i in ids if i not in done]
+            if not pending:
+                return n_run
+            progressed = False
+            for item_id in pending:
+                if max_items is not None and n_run >= max_items:
+                    return n_run
+                if os.path.exists(os.path.join(self.done_dir, f"{item_id}.json")) or not self.claim(item_id):
+                    continue
+                # Finished by another worker between the listing and the claim
+                if os.path.exists(os.path.join(self.done_dir, f"{item_id}.json")):
+                    self.release(item_id)
+                    continue
+                self.run_item(item_id, spec["experiment"], spec["options"])
+                n_run += 1
+                progressed = True
+            if not progressed:
+                if not wait:
+                    return n_run
+                time.sleep(poll)
+
+    def status(self):
+        """(items, done, live claims, expired claims)."""
+        locks = [os.path.join(self.locks_dir, name) for name in os.listdir(self.locks_dir)
+                 if name.endswith(".lock")]
+        expired = sum(self._expired(path) for path in locks)
+        return len(self.item_ids()), len(self.done_ids()), len(locks) - expired, expired
+
+    def reduce(self):
+        """Assembles the experiment's outputs from every item's records, in item order."""
+        spec = self.spec
+        ids = self.item_ids()
+        missing = sorted(set(ids) - self.done_ids())
+        if missing:
+            raise RuntimeError(f"{len(missing)} of {len(ids)} items are not done (e.g. {missing[0]})")
+        records = []
+        for item_id in ids:
+            records.extend(_read_json(os.path.join(self.done_dir, f"{item_id}.json"))["records"])
+        return EXPERIMENTS[spec["experiment"]]["reduce"](spec["options"], records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("init", help="Expand an experiment grid into work items")
+    p.add_argument("queue")
+    p.add_argument("experiment", choices=tuple(EXPERIMENTS))
+    p.add_argument("options", nargs=argparse.REMAINDER, help="The experiment's own flags")
+    p = sub.add_parser("work", help="Claim and run items until the queue is done")
+    p.add_argument("queue")
+    p.add_argument("--lease", type=float, default=DEFAULT_LEASE,
+                   help="Seconds after which a claim without heartbeat may be taken over")
+    p.add_argument("--poll", type=float, default=DEFAULT_POLL,
+                   help="Seconds between looks for expired claims when all items are claimed")
+    p.add_argument("--max_items", type=int, default=None, help="Stop after running this many items")
+    p.add_argument("--no_wait", action="store_true", help="Exit when nothing is claimable instead of polling")
+    p = sub.add_parser("status", help="Count items, results and claims")
+    p.add_argument("queue")
+    p.add_argument("--lease", type=float, default=DEFAULT_LEASE)
+    p = sub.add_parser("reduce", help="Assemble the experiment's outputs once every item is done")
+    p.add_argument("queue")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        options = vars(EXPERIMENTS[args.experiment]["build_parser"]().parse_args(args.options))
+        options.pop("profile_imports", None)
+        if args.experiment == "main":
+            # Parallelism comes from the number of workers; each runs one cell at a time
+            options.update(workers=1, resume=None)
+        queue = WorkQueue.create(args.queue, args.experiment, options)
+        print(f"{args.queue}: {len(queue.item_ids())} items of {args.experiment}")
+    elif args.command == "work":
+        queue = WorkQueue(args.queue, lease=args.lease)
+        n_run = queue.work(max_items=args.max_items, wait=not args.no_wait, poll=args.poll)
+        print(f"{queue.owner}: ran {n_run} items")
+    elif args.command == "status":
+        n_items, n_done, live, expired = WorkQueue(args.queue, lease=args.lease).status()
+        print(f"{n_done}/{n_items} done, {live} claimed, {expired} expired claims")
+    else:
+        print(f"Wrote {WorkQueue(args.queue).reduce()}")
@@ -13,15 +13,23 @@ Predictions:
 Budgets tested: B ∈ [25, 50, 100, 200, 500] (1.25% to 25% of test set)
 """
 
+import sys
+import argparse
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.tree import DecisionTreeClassifier
 from pathlib import Path
 
-np.random.seed(42)
-Path("results").mkdir(exist_ok=True)
-Path("../manuscript/figures").mkdir(parents=True, exist_ok=True)
+# Shared engines live next to the main simulation code
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "simulation" / "src"))
+from pruning_path import fit_pruning_path
+from exact_eval import BitDistribution, exact_model_errors
+from import_profile import add_profile_argument, run_with_import_profile
+from allocation import allocate_audits, audit_order
+from leaf_stats import LeafScorer
+from incremental_tree import IncrementalTree
+from results_store import DEFAULT_STORE, save_frame
+from sequential import sequential_frame
+
+REPO_STORE = Path(__file__).resolve().parent.parent / DEFAULT_STORE
 
 
 def generate_data_rare_tail(n_samples=10000):
@@ -33,41 +41,50 @@ def generate_data_rare_tail(n_samples=10000):
     return X, y.astype(int), exception_mask
 
 
+def rare_tail_population():
+    """
+    The distribution generate_data_rare_tail samples from (uniform bits),
+    for exact bulk/tail errors without a test set.
+    """
+    def tail(X):
+        return (X[:, 9] == 1) & (X[:, 0] == 1)
+    
+    def labels(X):
+        return (((X[:, 0] == 1) & (X[:, 1] == 1)) ^ tail(X)).astype(int)
+    
+    return BitDistribution(np.full(10, 0.5), labels, tail, relevant_bits=(0, 1, 9))
+
+
 def compute_obviousness_confidence(tree, X):
     """Confidence-based obviousness."""
-    proba = tree.predict_proba(X)
-    y_pred = tree.predict(X)
-    confidence = proba[np.arange(len(X)), y_pred.astype(int)]
+    _, confidence, _, _ = LeafScorer(tree).score(X)
     return confidence
 
 
-def allocate_audits(obviousness, budget):
-    """Allocate audits: v(x) ∝ 1/O_R(x)"""
-    allocation_weights = 1.0 / (obviousness + 1e-10)
-    allocation_probs = allocation_weights / allocation_weights.sum()
-    
-    n_points = len(obviousness)
-    audit_indices = np.random.choice(
-        n_points,
-        size=min(budget, n_points),
-        replace=False,
-        p=allocation_probs
-    )
-    
-    audited = np.zeros(n_points, dtype=bool)
-    audited[audit_indices] = True
-    return audited
+# How the corrected model is built (see build_corrected_model)
+CORRECTIONS = ("refit", "incremental", "check")
 
 
-def build_corrected_model(X_train, y_train, X_test, y_test, audited_mask, alpha):
-    """Build base and corrected models."""
-    M_base = DecisionTreeClassifier(ccp_alpha=alpha, random_state=42, max_depth=10)
-    M_base.fit(X_train, y_train)
+def build_corrected_model(X_train, y_train, X_test, y_test, audited_mask, alpha, M_base=None, base_tree=None):
+    """
+    Build base and corrected models (pass M_base to reuse an existing fit, and
+    base_tree, an IncrementalTree of the training data, to absorb the audits
+    into a copy of it instead of refitting).
+    """
+    from sklearn.tree import DecisionTreeClassifier
+    
+    if M_base is None:
+        M_base = DecisionTreeClassifier(ccp_alpha=alpha, random_state=42, max_depth=10)
+        M_base.fit(X_train, y_train)
     
     X_audit = X_test[audited_mask]
     y_audit = y_test[audited_mask]
     
-    if len(X_audit) > 0:
+    if len(X_audit) > 0 and base_tree is not None:
+        corrected = base_tree.copy()
+        corrected.absorb(X_audit, y_audit)
+        M_corrected = corrected.subtree(alpha)
+    elif len(X_audit) > 0:
         X_combined = np.vstack([X_train, X_audit])
         y_combined = np.hstack([y_train, y_audit])
         M_corrected = DecisionTreeClassifier(ccp_alpha=alpha, random_state=42, max_depth=10)
@@ -78,95 +95,170 @@ def build_corrected_model(X_train, y_train, X_test, y_test, audited_mask, alpha)
     return M_base, M_corrected
 
 
-def run_experiment(alpha, budget, n_seeds=10):
-    """Run experiment with given alpha and budget."""
-    results = []
+def run_experiment(alphas, budgets, n_seeds=10, correction="refit", nested=False, seeds=None):
+    """
+    Run experiment for every alpha and budget.
+    
+    Datasets, base trees (grown once per seed and pruned to each alpha), base
+    predictions and base errors are shared by all budgets; only the audit
+    allocation and the corrected model depend on the budget.
+    
+    nested: draw one audit priority order per (alpha, seed) and let budget B audit
+    its first B points, so budgets are nested and paired. With incremental
+    correction each budget then only absorbs the audits beyond the previous one.
+    
+    seeds: the seeds to run (default range(n_seeds)); rows depend only on (alpha, seed).
+    """
+    import pandas as pd
     
-    for seed in range(n_seeds):
+    if nested:
+        budgets = sorted(budgets)
+    results = {(alpha, budget): [] for alpha in alphas for budget in budgets}
+    population = rare_tail_population()
+    
+    for seed in (range(n_seeds) if seeds is None else seeds):
         np.random.seed(seed)
         
         X_train, y_train, _ = generate_data_rare_tail(n_samples=5000)
         X_test, y_test, tail_mask = generate_data_rare_tail(n_samples=2000)
-        
-        M_base = DecisionTreeClassifier(ccp_alpha=alpha, random_state=seed, max_depth=10)
-        M_base.fit(X_train, y_train)
-        
-        obviousness = compute_obviousness_confidence(M_base, X_test)
-        audited = allocate_audits(obviousness, budget)
-        
-        M_base, M_corrected = build_corrected_model(
-            X_train, y_train, X_test, y_test, audited, alpha
-        )
-        
-        y_pred_base = M_base.predict(X_test)
-        y_pred_corr = M_corrected.predict(X_test)
-        
-        error_base = (y_pred_base != y_test)
-        error_corr = (y_pred_corr != y_test)
-        
+        rng_state = np.random.get_state()
         bulk_mask = ~tail_mask
         
-        # Metrics
-        obs_gradient = obviousness[bulk_mask].mean() - obviousness[tail_mask].mean()
+        path_alloc = fit_pruning_path(X_train, y_train, random_state=seed, max_depth=10)
+        path_ref = fit_pruning_path(X_train, y_train, random_state=42, max_depth=10)
+        if correction != "refit":
+            base_tree = IncrementalTree.fit(X_train, y_train, max_depth=10, random_state=42)
         
-        audits_bulk = audited[bulk_mask].sum()
-        audits_tail = audited[tail_mask].sum()
-        allocation_ratio = (audits_tail / (tail_mask.sum() + 1e-10)) / (audits_bulk / (bulk_mask.sum() + 1e-10))
-        
-        error_base_tail = error_base[tail_mask].mean()
-        error_corr_tail = error_corr[tail_mask].mean()
-        error_base_bulk = error_base[bulk_mask].mean()
-        error_corr_bulk = error_corr[bulk_mask].mean()
-        
-        delta_tail = error_base_tail - error_corr_tail
-        delta_bulk = error_base_bulk - error_corr_bulk
-        effectiveness = delta_tail / (delta_bulk + 1e-10)
-        
-        results.append({
-            'alpha': alpha,
-            'budget': budget,
-            'budget_pct': budget / len(X_test) * 100,
-            'seed': seed,
-            'obs_gradient': obs_gradient,
-            'allocation_ratio': allocation_ratio,
-            'error_base_tail': error_base_tail,
-            'error_corr_tail': error_corr_tail,
-            'delta_tail': delta_tail,
-            'delta_bulk': delta_bulk,
-            'effectiveness': effectiveness,
-            'audits_tail': audits_tail,
-            'audits_bulk': audits_bulk,
-        })
+        for alpha in alphas:
+            obviousness = compute_obviousness_confidence(path_alloc.subtree(alpha), X_test)
+            obs_gradient = obviousness[bulk_mask].mean() - obviousness[tail_mask].mean()
+            
+            M_base = path_ref.subtree(alpha)
+            error_base = (M_base.predict(X_test) != y_test)
+            error_base_tail = error_base[tail_mask].mean()
+            error_base_bulk = error_base[bulk_mask].mean()
+            error_base_bulk_exact, error_base_tail_exact = exact_model_errors(M_base, population)
+            
+            if nested:
+                np.random.set_state(rng_state)
+                order = audit_order(obviousness)
+                if correction == "incremental":
+                    corrected_tree = base_tree.copy()
+                    n_absorbed = 0
+            
+            for budget in budgets:
+                if nested:
+                    audited = np.zeros(len(X_test), dtype=bool)
+                    audited[order[:budget]] = True
+                else:
+                    # Every budget draws its audits from the same stream
+                    np.random.set_state(rng_state)
+                    audited = allocate_audits(obviousness, budget)
+                
+                if nested and correction == "incremental":
+                    # Absorb only the audits added since the previous budget
+                    new = order[n_absorbed:budget]
+                    corrected_tree.absorb(X_test[new], y_test[new])
+                    n_absorbed = min(budget, len(order))
+                    M_corrected = corrected_tree.subtree(alpha)
+                else:
+                    _, M_corrected = build_corrected_model(
+                        X_train, y_train, X_test, y_test, audited, alpha, M_base=M_base,
+                        base_tree=base_tree if correction == "incremental" else None
+                    )
+                
+                error_corr = (M_corrected.predict(X_test) != y_test)
+                error_corr_bulk_exact, error_corr_tail_exact = exact_model_errors(M_corrected, population)
+                
+                # Metrics
+                audits_bulk = audited[bulk_mask].sum()
+                audits_tail = audited[tail_mask].sum()
+                allocation_ratio = (audits_tail / (tail_mask.sum() + 1e-10)) / (audits_bulk / (bulk_mask.sum() + 1e-10))
+                
+                error_corr_tail = error_corr[tail_mask].mean()
+                error_corr_bulk = error_corr[bulk_mask].mean()
+                
+                delta_tail = error_base_tail - error_corr_tail
+                delta_bulk = error_base_bulk - error_corr_bulk
+                effectiveness = delta_tail / (delta_bulk + 1e-10)
+                
+                results[alpha, budget].append({
+                    'alpha': alpha,
+                    'budget': budget,
+                    'budget_pct': budget / len(X_test) * 100,
+                    'seed': seed,
+                    'obs_gradient': obs_gradient,
+                    'allocation_ratio': allocation_ratio,
+                    'error_base_tail': error_base_tail,
+                    'error_corr_tail': error_corr_tail,
+                    'error_base_tail_exact': error_base_tail_exact,
+                    'error_corr_tail_exact': error_corr_tail_exact,
+                    'error_base_bulk_exact': error_base_bulk_exact,
+                    'error_corr_bulk_exact': error_corr_bulk_exact,
+                    'delta_tail': delta_tail,
+                    'delta_bulk': delta_bulk,
+                    'effectiveness': effectiveness,
+                    'audits_tail': audits_tail,
+                    'audits_bulk': audits_bulk,
+                })
+                
+                if correction == "check":
+                    _, M_incremental = build_corrected_model(
+                        X_train, y_train, X_test, y_test, audited, alpha, M_base=M_base, base_tree=base_tree
+                    )
+                    agreement = (M_incremental.predict(X_test) == M_corrected.predict(X_test)).mean()
+                    results[alpha, budget][-1]['incremental_agreement'] = agreement
     
-    return pd.DataFrame(results)
+    # Rows ordered by alpha, then budget, then seed
+    return pd.DataFrame([row for alpha in alphas for budget in budgets for row in results[alpha, budget]])
+
 
+# Experiment parameters; focus on moderate compression where mechanism is clearest
+ALPHAS = [0.01, 0.1]
+BUDGETS = [25, 50, 100, 200, 500]  # 1.25% to 25% of test set
+N_SEEDS = 10
+# Metrics whose CIs (at every budget) decide when an alpha has enough seeds (--target_ci_width)
+STOP_METRICS = ("error_corr_tail",)
 
-def main():
+
+def main(correction="refit", nested=False, budgets=None, store=None, target_ci_width=None, batch_seeds=4,
+         max_seeds=100):
     """Run budget sensitivity analysis."""
+    np.random.seed(42)
+    Path("results").mkdir(exist_ok=True)
+    Path("../manuscript/figures").mkdir(parents=True, exist_ok=True)
     
     print("Budget Sensitivity Analysis")
     print("=" * 60)
     print("Testing how effectiveness depends on audit budget size")
     print("=" * 60)
     
-    # Focus on moderate compression where mechanism is clearest
-    alphas = [0.01, 0.1]
-    budgets = [25, 50, 100, 200, 500]  # 1.25% to 25% of test set
-    n_seeds = 10
-    
-    all_results = []
-    for alpha in alphas:
-        for budget in budgets:
-            print(f"\nRunning alpha={alpha}, budget={budget} ({budget/20:.1f}%)...")
-            results = run_experiment(alpha, budget, n_seeds)
-            all_results.append(results)
+    alphas, n_seeds = ALPHAS, N_SEEDS
+    if budgets is None:
+        budgets = BUDGETS
+    stem = "budget_sensitivity_nested" if nested else "budget_sensitivity"
     
-    df = pd.concat(all_results, ignore_index=True)
+    print(f"\nRunning alphas={alphas}, budgets={budgets} ({min(budgets)/20:.2f}% to {max(budgets)/20:.0f}%)...")
+    if target_ci_width is None:
+        df = run_experiment(alphas, budgets, n_seeds, correction=correction, nested=nested)
+    else:
+        # Seeded stopping CIs, so the seeds used per alpha (and the CSV) are reproducible
+        stop_rng = np.random.default_rng(np.random.SeedSequence(42, spawn_key=(1,)))
+        df, seeds_used = sequential_frame(
+            lambda active, seeds: run_experiment(active, budgets, correction=correction, nested=nested, seeds=seeds),
+            alphas, STOP_METRICS, target_ci_width, batch_seeds, max_seeds, stop_rng, by=("budget",))
+        print(f"Seeds used per alpha: {seeds_used}")
+    if correction == "check":
+        print(f"Incremental vs refit corrected model: test predictions agree on "
+              f"{df['incremental_agreement'].mean():.2%} (min {df['incremental_agreement'].min():.2%})")
     
     # Save results
-    df.to_csv("results/budget_sensitivity_results.csv", index=False)
+    df.to_csv(f"results/{stem}_results.csv", index=False)
+    if store:
+        save_frame(store, stem, df, "budget_sensitivity",
+                   {"alphas": alphas, "budgets": budgets, "n_seeds": n_seeds, "correction": correction, "nested": nested})
     print("\n" + "=" * 60)
-    print("PRIMARY OUTPUT: results/budget_sensitivity_results.csv")
+    print(f"PRIMARY OUTPUT: results/{stem}_results.csv")
     print("=" * 60)
     
     # Analysis
@@ -185,16 +277,18 @@ def main():
         print(summary)
     
     # Create figures
-    create_figures(df)
+    create_figures(df, stem)
     
     print("\n" + "=" * 60)
     print("Analysis complete!")
     print("=" * 60)
 
 
-def create_figures(df):
+def create_figures(df, stem="budget_sensitivity"):
     """Create budget sensitivity figures."""
     
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(2, 2, figsize=(14, 10))
     
     alphas = df['alpha'].unique()
@@ -258,11 +352,38 @@ def create_figures(df):
     ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
-    plt.savefig('../manuscript/figures/budget_sensitivity.pdf', dpi=300, bbox_inches='tight')
-    plt.savefig('../manuscript/figures/budget_sensitivity.png', dpi=300, bbox_inches='tight')
+    plt.savefig(f'../manuscript/figures/{stem}.pdf', dpi=300, bbox_inches='tight')
+    plt.savefig(f'../manuscript/figures/{stem}.png', dpi=300, bbox_inches='tight')
     print("\nFigures saved to manuscript/figures/")
     plt.close()
 
 
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--correction", choices=CORRECTIONS, default="refit",
+                        help="refit: regrow the corrected tree on train + audits; incremental: absorb the audits "
+                             "into the base tree (IncrementalTree); check: refit, and record the agreement "
+                             "of the incremental correction with it")
+    parser.add_argument("--nested", action="store_true",
+                        help="One audit priority order per (alpha, seed); budget B audits its first B points "
+                             "(results/budget_sensitivity_nested_results.csv)")
+    parser.add_argument("--budgets", type=int, nargs="+", default=None,
+                        help="Audit budgets (default: 25 50 100 200 500)")
+    parser.add_argument("--target_ci_width", "--target-ci-width", type=float, default=None,
+                        help="Sequential stopping: run seeds per alpha in batches until the 90%% CI of error_corr_tail (at every budget) "
+                             "is at most this wide")
+    parser.add_argument("--batch_seeds", type=int, default=4, help="Seeds per batch with --target_ci_width")
+    parser.add_argument("--max_seeds", type=int, default=100, help="Seed cap per alpha with --target_ci_width")
+    parser.add_argument("--store", nargs="?", const=str(REPO_STORE), default=None,
+                        help=f"Also append the results to an HDF5 results store (default {REPO_STORE})")
+    add_profile_argument(parser)
+    return parser
+
+
 if __name__ == "__main__":
-    main()
+    args = build_parser().parse_args()
+    
+    if args.profile_imports:
+        sys.exit(run_with_import_profile())
+    main(correction=args.correction, nested=args.nested, budgets=args.budgets, store=args.store,
+         target_ci_width=args.target_ci_width, batch_seeds=args.batch_seeds, max_seeds=args.max_seeds)
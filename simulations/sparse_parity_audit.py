@@ -11,18 +11,22 @@ Design:
 - Measure: error on audited vs unaudited, bulk vs tail
 """
 
+import sys
+import argparse
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.tree import DecisionTreeClassifier
 from pathlib import Path
 
-# Set random seed for reproducibility
-np.random.seed(42)
+# Shared engines live next to the main simulation code
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "simulation" / "src"))
+from pruning_path import fit_pruning_path
+from exact_eval import BitDistribution, exact_model_errors
+from import_profile import add_profile_argument, run_with_import_profile
+from allocation import allocate_audits
+from leaf_stats import LeafScorer
+from results_store import DEFAULT_STORE, save_frame
+from sequential import sequential_frame
 
-# Create output directories
-Path("results").mkdir(exist_ok=True)
-Path("../manuscript/figures").mkdir(parents=True, exist_ok=True)
+REPO_STORE = Path(__file__).resolve().parent.parent / DEFAULT_STORE
 
 
 def generate_sparse_parity_data(n_samples=10000, n_bits=10):
@@ -45,129 +49,124 @@ def generate_sparse_parity_data(n_samples=10000, n_bits=10):
     return X, y.astype(int), exception_mask
 
 
-def compute_obviousness(tree, X):
+def sparse_parity_population(n_bits=10):
     """
-    Compute obviousness O_R(x) for each point.
-    
-    O_R(x) = (# training points in leaf) / (total training points)
-    High O_R → claim is "obvious" (many similar examples)
-    Low O_R → claim is "non-obvious" (rare, exception-like)
+    The distribution generate_sparse_parity_data samples from (uniform bits),
+    for exact bulk/tail errors without a test set.
     """
-    # Get leaf IDs for test points
-    leaf_ids = tree.apply(X)
-    
-    # Get number of samples in each leaf from training
-    n_node_samples = tree.tree_.n_node_samples
+    def labels(X):
+        base_rule = (X[:, 0] == 1) & (X[:, 1] == 1)
+        return (base_rule ^ (X[:, n_bits-1] == 1)).astype(int)
     
-    # Map each test point to its leaf's sample count
-    obviousness = np.array([n_node_samples[leaf_id] for leaf_id in leaf_ids], dtype=float)
-    obviousness = obviousness / obviousness.sum()  # Normalize
+    def tail(X):
+        return X[:, n_bits-1] == 1
     
-    return obviousness
+    return BitDistribution(np.full(n_bits, 0.5), labels, tail, relevant_bits=(0, 1, n_bits-1))
 
 
-def allocate_audits(obviousness, budget):
+def run_experiment(alphas, budget=100, n_seeds=10, seeds=None):
     """
-    Allocate audit budget using policy: v(x) proportional to 1/O_R(x)
+    Run experiments for every pruning parameter with a given budget.
     
-    Returns: boolean array indicating which points are audited
-    """
-    # Inverse obviousness (less obvious → more audits)
-    allocation_weights = 1.0 / (obviousness + 1e-10)
-    allocation_probs = allocation_weights / allocation_weights.sum()
-    
-    # Sample audit indices
-    n_points = len(obviousness)
-    audit_indices = np.random.choice(
-        n_points, 
-        size=min(budget, n_points), 
-        replace=False, 
-        p=allocation_probs
-    )
-    
-    audited = np.zeros(n_points, dtype=bool)
-    audited[audit_indices] = True
-    
-    return audited
-
-
-def run_experiment(alpha, budget=100, n_seeds=10):
-    """
-    Run single experiment with given pruning parameter and budget.
+    Each seed grows one unpruned tree; the tree for each alpha is read off
+    its cost-complexity pruning path instead of being refit.
+    seeds: the seeds to run (default range(n_seeds)); rows depend only on (alpha, seed).
     
     Returns: DataFrame of metrics
     """
-    results = []
+    import pandas as pd
     
-    for seed in range(n_seeds):
+    results = {alpha: [] for alpha in alphas}
+    
+    for seed in (range(n_seeds) if seeds is None else seeds):
         np.random.seed(seed)
         
         # Generate data
         X_train, y_train, _ = generate_sparse_parity_data(n_samples=5000)
         X_test, y_test, tail_mask_test = generate_sparse_parity_data(n_samples=2000)
+        rng_state = np.random.get_state()
         
-        # Train CART with pruning
-        tree = DecisionTreeClassifier(
-            ccp_alpha=alpha,
-            random_state=seed,
-            max_depth=10
-        )
-        tree.fit(X_train, y_train)
-        
-        # Compute obviousness on test set
-        obviousness = compute_obviousness(tree, X_test)
-        
-        # Allocate audits
-        audited = allocate_audits(obviousness, budget)
-        
-        # Get predictions
-        y_pred = tree.predict(X_test)
-        
-        # Compute errors
-        errors = (y_pred != y_test)
+        population = sparse_parity_population()
         
-        # Metrics
-        bulk_mask = ~tail_mask_test
+        # Grow the unpruned CART once per seed
+        path = fit_pruning_path(X_train, y_train, random_state=seed, max_depth=10)
         
-        results.append({
-            'alpha': alpha,
-            'seed': seed,
-            'error_audited': errors[audited].mean() if audited.sum() > 0 else np.nan,
-            'error_unaudited': errors[~audited].mean() if (~audited).sum() > 0 else np.nan,
-            'error_bulk': errors[bulk_mask].mean(),
-            'error_tail': errors[tail_mask_test].mean(),
-            'audits_to_bulk': audited[bulk_mask].sum(),
-            'audits_to_tail': audited[tail_mask_test].sum(),
-            'bulk_size': bulk_mask.sum(),
-            'tail_size': tail_mask_test.sum(),
-            'tree_leaves': tree.get_n_leaves(),
-        })
-    
-    return pd.DataFrame(results)
+        for alpha in alphas:
+            # Each alpha draws its audits from the same stream as a fresh run
+            np.random.set_state(rng_state)
+            tree = path.subtree(alpha)
+            
+            # Predictions and count-based obviousness O_R(x) on the test set
+            y_pred, _, obviousness, _ = LeafScorer(tree).score(X_test)
+            
+            # Allocate audits
+            audited = allocate_audits(obviousness, budget)
+            
+            # Compute errors
+            errors = (y_pred != y_test)
+            
+            # Metrics
+            bulk_mask = ~tail_mask_test
+            error_bulk_exact, error_tail_exact = exact_model_errors(tree, population)
+            
+            results[alpha].append({
+                'alpha': alpha,
+                'seed': seed,
+                'error_audited': errors[audited].mean() if audited.sum() > 0 else np.nan,
+                'error_unaudited': errors[~audited].mean() if (~audited).sum() > 0 else np.nan,
+                'error_bulk': errors[bulk_mask].mean(),
+                'error_tail': errors[tail_mask_test].mean(),
+                'error_bulk_exact': error_bulk_exact,
+                'error_tail_exact': error_tail_exact,
+                'audits_to_bulk': audited[bulk_mask].sum(),
+                'audits_to_tail': audited[tail_mask_test].sum(),
+                'bulk_size': bulk_mask.sum(),
+                'tail_size': tail_mask_test.sum(),
+                'tree_leaves': tree.get_n_leaves(),
+            })
+    
+    return pd.DataFrame([row for alpha in alphas for row in results[alpha]])
 
 
-def main():
+# Experiment parameters
+ALPHAS = [0.001, 0.01, 0.1, 1.0, 10.0]
+BUDGET = 100
+N_SEEDS = 10
+# Metrics whose CIs decide when an alpha has enough seeds (--target_ci_width)
+STOP_METRICS = ("error_tail",)
+
+
+def main(store=None, target_ci_width=None, batch_seeds=4, max_seeds=100):
     """Run full experiment suite."""
     
+    # Set random seed for reproducibility
+    np.random.seed(42)
+    
+    # Create output directories
+    Path("results").mkdir(exist_ok=True)
+    Path("../manuscript/figures").mkdir(parents=True, exist_ok=True)
+    
     print("Running Sparse Parity Audit Budget Experiments...")
     print("=" * 60)
     
-    # Experiment parameters
-    alphas = [0.001, 0.01, 0.1, 1.0, 10.0]
-    budget = 100
-    n_seeds = 10
+    alphas, budget, n_seeds = ALPHAS, BUDGET, N_SEEDS
     
     # Run experiments
-    all_results = []
-    for alpha in alphas:
-        print(f"\nRunning alpha = {alpha}...")
-        results = run_experiment(alpha, budget, n_seeds)
-        all_results.append(results)
-    
-    df = pd.concat(all_results, ignore_index=True)
+    print(f"\nRunning alphas = {alphas}...")
+    if target_ci_width is None:
+        df = run_experiment(alphas, budget, n_seeds)
+    else:
+        # Seeded stopping CIs, so the seeds used per alpha (and the CSV) are reproducible
+        stop_rng = np.random.default_rng(np.random.SeedSequence(42, spawn_key=(1,)))
+        df, seeds_used = sequential_frame(lambda active, seeds: run_experiment(active, budget, seeds=seeds),
+                                          alphas, STOP_METRICS, target_ci_width, batch_seeds, max_seeds, stop_rng)
+        print(f"Seeds used per alpha: {seeds_used}")
     
     # Save results (PRIMARY OUTPUT FOR ANALYSIS)
     df.to_csv("results/sparse_parity_audit_results.csv", index=False)
+    if store:
+        save_frame(store, "sparse_parity_audit", df, "sparse_parity_audit",
+                   {"alphas": alphas, "budget": budget, "n_seeds": n_seeds})
     print("\n" + "=" * 60)
     print("PRIMARY OUTPUT: results/sparse_parity_audit_results.csv")
     print("=" * 60)
@@ -229,6 +228,8 @@ def main():
 def create_figures(df):
     """Create visualization figures."""
     
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(2, 2, figsize=(12, 10))
     
     # 1. Error: Audited vs Unaudited
@@ -298,5 +299,23 @@ def create_figures(df):
     plt.close()
 
 
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target_ci_width", "--target-ci-width", type=float, default=None,
+                        help="Sequential stopping: run seeds per alpha in batches until the 90%% CI of error_tail "
+                             "is at most this wide")
+    parser.add_argument("--batch_seeds", type=int, default=4, help="Seeds per batch with --target_ci_width")
+    parser.add_argument("--max_seeds", type=int, default=100, help="Seed cap per alpha with --target_ci_width")
+    parser.add_argument("--store", nargs="?", const=str(REPO_STORE), default=None,
+                        help=f"Also append the results to an HDF5 results store (default {REPO_STORE})")
+    add_profile_argument(parser)
+    return parser
+
+
 if __name__ == "__main__":
-    main()
+    args = build_parser().parse_args()
+    
+    if args.profile_imports:
+        sys.exit(run_with_import_profile())
+    main(store=args.store, target_ci_width=args.target_ci_width, batch_seeds=args.batch_seeds,
+         max_seeds=args.max_seeds)
@@ -15,15 +15,23 @@ P3: Tail error concentrates (base up, corrected down)
 P4: Verification more effective on tail
 """
 
+import sys
+import argparse
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.tree import DecisionTreeClassifier
 from pathlib import Path
 
-np.random.seed(42)
-Path("results").mkdir(exist_ok=True)
-Path("../manuscript/figures").mkdir(parents=True, exist_ok=True)
+# Shared engines live next to the main simulation code
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "simulation" / "src"))
+from pruning_path import fit_pruning_path
+from exact_eval import BitDistribution, exact_model_errors
+from import_profile import add_profile_argument, run_with_import_profile
+from allocation import allocate_audits
+from leaf_stats import LeafScorer
+from incremental_tree import IncrementalTree
+from results_store import DEFAULT_STORE, save_frame
+from sequential import sequential_frame
+
+REPO_STORE = Path(__file__).resolve().parent.parent / DEFAULT_STORE
 
 
 def generate_data_rare_tail(n_samples=10000, p_exc=0.01):
@@ -47,6 +55,20 @@ def generate_data_rare_tail(n_samples=10000, p_exc=0.01):
     return X, y.astype(int), exception_mask
 
 
+def rare_tail_population():
+    """
+    The distribution generate_data_rare_tail samples from (uniform bits),
+    for exact bulk/tail errors without a test set.
+    """
+    def tail(X):
+        return (X[:, 9] == 1) & (X[:, 0] == 1)
+    
+    def labels(X):
+        return (((X[:, 0] == 1) & (X[:, 1] == 1)) ^ tail(X)).astype(int)
+    
+    return BitDistribution(np.full(10, 0.5), labels, tail, relevant_bits=(0, 1, 9))
+
+
 def compute_obviousness_confidence(tree, X):
     """
     Confidence-based obviousness: O_R(x) = prediction confidence.
@@ -56,57 +78,41 @@ def compute_obviousness_confidence(tree, X):
     
     This maintains variance even when tree is simple.
     """
-    proba = tree.predict_proba(X)
-    y_pred = tree.predict(X)
-    
-    # Confidence = probability of predicted class
-    confidence = proba[np.arange(len(X)), y_pred.astype(int)]
-    
+    _, confidence, _, _ = LeafScorer(tree).score(X)
     return confidence
 
 
-def allocate_audits(obviousness, budget):
-    """
-    Allocate audit budget: v(x) ∝ 1/O_R(x)
-    
-    Low obviousness → more audits
-    """
-    allocation_weights = 1.0 / (obviousness + 1e-10)
-    allocation_probs = allocation_weights / allocation_weights.sum()
-    
-    n_points = len(obviousness)
-    audit_indices = np.random.choice(
-        n_points,
-        size=min(budget, n_points),
-        replace=False,
-        p=allocation_probs
-    )
-    
-    audited = np.zeros(n_points, dtype=bool)
-    audited[audit_indices] = True
-    
-    return audited
+# How the corrected model is built (see build_corrected_model)
+CORRECTIONS = ("refit", "incremental", "check")
 
 
-def build_corrected_model(X_train, y_train, X_test, y_test, audited_mask, alpha):
+def build_corrected_model(X_train, y_train, X_test, y_test, audited_mask, alpha, M_base=None, base_tree=None):
     """
     Build base and corrected models.
     
-    Base: trained on training data only
-    Corrected: retrained with audit labels added
+    Base: trained on training data only (pass M_base to reuse an existing fit)
+    Corrected: retrained with audit labels added (pass base_tree, an IncrementalTree
+    of the training data, to absorb the audits into a copy of it instead)
     
     This creates causal effect of verification.
     """
+    from sklearn.tree import DecisionTreeClassifier
+    
     # Base model
-    M_base = DecisionTreeClassifier(ccp_alpha=alpha, random_state=42, max_depth=10)
-    M_base.fit(X_train, y_train)
+    if M_base is None:
+        M_base = DecisionTreeClassifier(ccp_alpha=alpha, random_state=42, max_depth=10)
+        M_base.fit(X_train, y_train)
     
     # Get audit labels (ground truth for audited points)
     X_audit = X_test[audited_mask]
     y_audit = y_test[audited_mask]
     
     # Corrected model: retrain with audit data
-    if len(X_audit) > 0:
+    if len(X_audit) > 0 and base_tree is not None:
+        corrected = base_tree.copy()
+        corrected.absorb(X_audit, y_audit)
+        M_corrected = corrected.subtree(alpha)
+    elif len(X_audit) > 0:
         X_combined = np.vstack([X_train, X_audit])
         y_combined = np.hstack([y_train, y_audit])
         M_corrected = DecisionTreeClassifier(ccp_alpha=alpha, random_state=42, max_depth=10)
@@ -117,102 +123,146 @@ def build_corrected_model(X_train, y_train, X_test, y_test, audited_mask, alpha)
     return M_base, M_corrected
 
 
-def run_experiment(alpha, budget=50, n_seeds=10):
+def run_experiment(alphas, budget=50, n_seeds=10, correction="refit", seeds=None):
     """
-    Run experiment with given pruning parameter.
+    Run experiment for every pruning parameter.
+    
+    Base trees are grown once per seed; the tree for each alpha is read off
+    the cost-complexity pruning path instead of being refit.
+    seeds: the seeds to run (default range(n_seeds)); rows depend only on (alpha, seed).
     
     Returns: DataFrame with metrics for all predictions P1-P4
     """
-    results = []
+    import pandas as pd
     
-    for seed in range(n_seeds):
+    results = {alpha: [] for alpha in alphas}
+    
+    for seed in (range(n_seeds) if seeds is None else seeds):
         np.random.seed(seed)
         
         # Generate data with rare tail
         X_train, y_train, _ = generate_data_rare_tail(n_samples=5000)
         X_test, y_test, tail_mask = generate_data_rare_tail(n_samples=2000)
+        rng_state = np.random.get_state()
+        population = rare_tail_population()
         
-        # Build base model
-        M_base = DecisionTreeClassifier(ccp_alpha=alpha, random_state=seed, max_depth=10)
-        M_base.fit(X_train, y_train)
-        
-        # Compute confidence-based obviousness
-        obviousness = compute_obviousness_confidence(M_base, X_test)
-        
-        # Allocate audits
-        audited = allocate_audits(obviousness, budget)
-        
-        # Build corrected model
-        M_base, M_corrected = build_corrected_model(
-            X_train, y_train, X_test, y_test, audited, alpha
-        )
-        
-        # Predictions
-        y_pred_base = M_base.predict(X_test)
-        y_pred_corr = M_corrected.predict(X_test)
-        
-        # Errors
-        error_base = (y_pred_base != y_test)
-        error_corr = (y_pred_corr != y_test)
-        
-        # Stratify by bulk/tail
-        bulk_mask = ~tail_mask
-        
-        # P1: Obviousness gradient
-        obs_bulk_mean = obviousness[bulk_mask].mean()
-        obs_tail_mean = obviousness[tail_mask].mean()
-        obs_gradient = obs_bulk_mean - obs_tail_mean
-        
-        # P2: Allocation ratio
-        audits_bulk = audited[bulk_mask].sum()
-        audits_tail = audited[tail_mask].sum()
-        bulk_size = bulk_mask.sum()
-        tail_size = tail_mask.sum()
-        allocation_ratio = (audits_tail / (tail_size + 1e-10)) / (audits_bulk / (bulk_size + 1e-10))
-        
-        # P3: Tail error concentration
-        error_base_tail = error_base[tail_mask].mean()
-        error_corr_tail = error_corr[tail_mask].mean()
-        error_base_bulk = error_base[bulk_mask].mean()
-        error_corr_bulk = error_corr[bulk_mask].mean()
-        
-        # P4: Verification effectiveness
-        delta_tail = error_base_tail - error_corr_tail
-        delta_bulk = error_base_bulk - error_corr_bulk
-        effectiveness = delta_tail / (delta_bulk + 1e-10)
+        # Unpruned base trees: one drives allocation, the other is the
+        # reference for correction (as in build_corrected_model)
+        path_alloc = fit_pruning_path(X_train, y_train, random_state=seed, max_depth=10)
+        path_ref = fit_pruning_path(X_train, y_train, random_state=42, max_depth=10)
+        if correction != "refit":
+            base_tree = IncrementalTree.fit(X_train, y_train, max_depth=10, random_state=42)
         
-        results.append({
-            'alpha': alpha,
-            'seed': seed,
+        for alpha in alphas:
+            # Each alpha draws its audits from the same stream as a fresh run
+            np.random.set_state(rng_state)
+            
+            # Build base model
+            M_base = path_alloc.subtree(alpha)
+            
+            # Compute confidence-based obviousness
+            obviousness = compute_obviousness_confidence(M_base, X_test)
+            
+            # Allocate audits
+            audited = allocate_audits(obviousness, budget)
+            
+            # Build corrected model
+            M_base, M_corrected = build_corrected_model(
+                X_train, y_train, X_test, y_test, audited, alpha,
+                M_base=path_ref.subtree(alpha),
+                base_tree=base_tree if correction == "incremental" else None
+            )
+            
+            # Predictions
+            y_pred_base = M_base.predict(X_test)
+            y_pred_corr = M_corrected.predict(X_test)
+            
+            # Errors
+            error_base = (y_pred_base != y_test)
+            error_corr = (y_pred_corr != y_test)
+            error_base_bulk_exact, error_base_tail_exact = exact_model_errors(M_base, population)
+            error_corr_bulk_exact, error_corr_tail_exact = exact_model_errors(M_corrected, population)
+            
+            # Stratify by bulk/tail
+            bulk_mask = ~tail_mask
+            
             # P1: Obviousness gradient
-            'obs_bulk_mean': obs_bulk_mean,
-            'obs_tail_mean': obs_tail_mean,
-            'obs_gradient': obs_gradient,
-            # P2: Allocation
-            'audits_bulk': audits_bulk,
-            'audits_tail': audits_tail,
-            'allocation_ratio': allocation_ratio,
-            # P3: Errors
-            'error_base_tail': error_base_tail,
-            'error_corr_tail': error_corr_tail,
-            'error_base_bulk': error_base_bulk,
-            'error_corr_bulk': error_corr_bulk,
-            # P4: Effectiveness
-            'delta_tail': delta_tail,
-            'delta_bulk': delta_bulk,
-            'effectiveness': effectiveness,
-            # Metadata
-            'tail_size': tail_size,
-            'bulk_size': bulk_size,
-            'tree_leaves': M_base.get_n_leaves(),
-        })
-    
-    return pd.DataFrame(results)
+            obs_bulk_mean = obviousness[bulk_mask].mean()
+            obs_tail_mean = obviousness[tail_mask].mean()
+            obs_gradient = obs_bulk_mean - obs_tail_mean
+            
+            # P2: Allocation ratio
+            audits_bulk = audited[bulk_mask].sum()
+            audits_tail = audited[tail_mask].sum()
+            bulk_size = bulk_mask.sum()
+            tail_size = tail_mask.sum()
+            allocation_ratio = (audits_tail / (tail_size + 1e-10)) / (audits_bulk / (bulk_size + 1e-10))
+            
+            # P3: Tail error concentration
+            error_base_tail = error_base[tail_mask].mean()
+            error_corr_tail = error_corr[tail_mask].mean()
+            error_base_bulk = error_base[bulk_mask].mean()
+            error_corr_bulk = error_corr[bulk_mask].mean()
+            
+            # P4: Verification effectiveness
+            delta_tail = error_base_tail - error_corr_tail
+            delta_bulk = error_base_bulk - error_corr_bulk
+            effectiveness = delta_tail / (delta_bulk + 1e-10)
+            
+            results[alpha].append({
+                'alpha': alpha,
+                'seed': seed,
+                # P1: Obviousness gradient
+                'obs_bulk_mean': obs_bulk_mean,
+                'obs_tail_mean': obs_tail_mean,
+                'obs_gradient': obs_gradient,
+                # P2: Allocation
+                'audits_bulk': audits_bulk,
+                'audits_tail': audits_tail,
+                'allocation_ratio': allocation_ratio,
+                # P3: Errors
+                'error_base_tail': error_base_tail,
+                'error_corr_tail': error_corr_tail,
+                'error_base_bulk': error_base_bulk,
+                'error_corr_bulk': error_corr_bulk,
+                'error_base_tail_exact': error_base_tail_exact,
+                'error_corr_tail_exact': error_corr_tail_exact,
+                'error_base_bulk_exact': error_base_bulk_exact,
+                'error_corr_bulk_exact': error_corr_bulk_exact,
+                # P4: Effectiveness
+                'delta_tail': delta_tail,
+                'delta_bulk': delta_bulk,
+                'effectiveness': effectiveness,
+                # Metadata
+                'tail_size': tail_size,
+                'bulk_size': bulk_size,
+                'tree_leaves': M_base.get_n_leaves(),
+            })
+            
+            if correction == "check":
+                _, M_incremental = build_corrected_model(
+                    X_train, y_train, X_test, y_test, audited, alpha, M_base=M_base, base_tree=base_tree
+                )
+                results[alpha][-1]['incremental_agreement'] = (M_incremental.predict(X_test) == y_pred_corr).mean()
+    
+    return pd.DataFrame([row for alpha in alphas for row in results[alpha]])
 
 
-def main():
+# Experiment parameters
+ALPHAS = [0.001, 0.01, 0.1, 1.0, 10.0]
+BUDGET = 50
+N_SEEDS = 10
+# Metrics whose CIs decide when an alpha has enough seeds (--target_ci_width)
+STOP_METRICS = ("error_corr_tail",)
+
+
+def main(correction="refit", store=None, target_ci_width=None, batch_seeds=4, max_seeds=100):
     """Run full experiment suite."""
     
+    np.random.seed(42)
+    Path("results").mkdir(exist_ok=True)
+    Path("../manuscript/figures").mkdir(parents=True, exist_ok=True)
+    
     print("Running REVISED Sparse Parity Audit Simulation")
     print("=" * 60)
     print("Design improvements:")
@@ -221,20 +271,27 @@ def main():
     print("  3. Rare 1% tail (genuine tail scenario)")
     print("=" * 60)
     
-    alphas = [0.001, 0.01, 0.1, 1.0, 10.0]
-    budget = 50
-    n_seeds = 10
-    
-    all_results = []
-    for alpha in alphas:
-        print(f"\nRunning alpha = {alpha}...")
-        results = run_experiment(alpha, budget, n_seeds)
-        all_results.append(results)
+    alphas, budget, n_seeds = ALPHAS, BUDGET, N_SEEDS
     
-    df = pd.concat(all_results, ignore_index=True)
+    print(f"\nRunning alphas = {alphas}...")
+    if target_ci_width is None:
+        df = run_experiment(alphas, budget, n_seeds, correction=correction)
+    else:
+        # Seeded stopping CIs, so the seeds used per alpha (and the CSV) are reproducible
+        stop_rng = np.random.default_rng(np.random.SeedSequence(42, spawn_key=(1,)))
+        df, seeds_used = sequential_frame(
+            lambda active, seeds: run_experiment(active, budget, correction=correction, seeds=seeds),
+            alphas, STOP_METRICS, target_ci_width, batch_seeds, max_seeds, stop_rng)
+        print(f"Seeds used per alpha: {seeds_used}")
+    if correction == "check":
+        print(f"Incremental vs refit corrected model: test predictions agree on "
+              f"{df['incremental_agreement'].mean():.2%} (min {df['incremental_agreement'].min():.2%})")
     
     # Save results
     df.to_csv("results/sparse_parity_revised_results.csv", index=False)
+    if store:
+        save_frame(store, "sparse_parity_revised", df, "sparse_parity_revised",
+                   {"alphas": alphas, "budget": budget, "n_seeds": n_seeds, "correction": correction})
     print("\n" + "=" * 60)
     print("PRIMARY OUTPUT: results/sparse_parity_revised_results.csv")
     print("=" * 60)
@@ -292,6 +349,8 @@ def main():
 def create_figures(df):
     """Create 4-panel figure testing predictions P1-P4."""
     
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(2, 2, figsize=(12, 10))
     
     # P1: Obviousness Gradient
@@ -355,5 +414,27 @@ def create_figures(df):
     plt.close()
 
 
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--correction", choices=CORRECTIONS, default="refit",
+                        help="refit: regrow the corrected tree on train + audits; incremental: absorb the audits "
+                             "into the base tree (IncrementalTree); check: refit, and record the agreement "
+                             "of the incremental correction with it")
+    parser.add_argument("--target_ci_width", "--target-ci-width", type=float, default=None,
+                        help="Sequential stopping: run seeds per alpha in batches until the 90%% CI of error_corr_tail "
+                             "is at most this wide")
+    parser.add_argument("--batch_seeds", type=int, default=4, help="Seeds per batch with --target_ci_width")
+    parser.add_argument("--max_seeds", type=int, default=100, help="Seed cap per alpha with --target_ci_width")
+    parser.add_argument("--store", nargs="?", const=str(REPO_STORE), default=None,
+                        help=f"Also append the results to an HDF5 results store (default {REPO_STORE})")
+    add_profile_argument(parser)
+    return parser
+
+
 if __name__ == "__main__":
-    main()
+    args = build_parser().parse_args()
+    
+    if args.profile_imports:
+        sys.exit(run_with_import_profile())
+    main(correction=args.correction, store=args.store, target_ci_width=args.target_ci_width,
+         batch_seeds=args.batch_seeds, max_seeds=args.max_seeds)